@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks of the computation of equilibrium arguments and node factors.
+"""
+from __future__ import absolute_import
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from libtcd import astro                # noqa: E402
+
+
+def test_century_of_year_tables(benchmark):
+    benchmark(astro.year_tables, astro.CONSTITUENTS, 1950, 100)
+
+
+def test_year_of_hourly_values(benchmark):
+    times = numpy.datetime64('2020-01-01') \
+        + numpy.arange(24 * 366) * numpy.timedelta64(1, 'h')
+    names = ['M2', 'S2', 'N2', 'K1', 'O1', 'M4']
+    benchmark(astro.equilibrium_arguments, names, times)
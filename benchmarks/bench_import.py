@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks of start-up time.
+
+Each of these runs a fresh interpreter, so that short-lived processes
+(command line tools, workers which only unpickle stations) can be
+compared against the cost of starting Python at all.
+
+"""
+from __future__ import absolute_import
+
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize('statement', [
+    'pass',
+    'import libtcd.api',
+    'import libtcd.api; libtcd._libtcd.bind_all()',
+    'import libtcd.tcdfile',
+    ], ids=['python', 'api', 'api-bound', 'tcdfile'])
+def test_startup(benchmark, statement):
+    def run():
+        subprocess.check_call([sys.executable, '-c', statement])
+    benchmark.pedantic(run, rounds=20, warmup_rounds=1)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks of the database API, on synthetic databases.
+
+Run these with ``tox -e bench``, or::
+
+    py.test benchmarks --benchmark-autosave
+
+Then compare saved runs with ``py.test-benchmark compare``.
+
+"""
+from __future__ import absolute_import
+
+from collections import deque
+import random
+
+import pytest
+
+from libtcd.api import ReferenceStation, SubordinateStation, Tcd
+from libtcd.tcdfile import MmapTcd
+
+
+def consume(iterable):
+    deque(iterable, maxlen=0)
+
+
+@pytest.fixture(params=[Tcd, MmapTcd], ids=['Tcd', 'MmapTcd'])
+def tcd_class(request):
+    return request.param
+
+
+@pytest.fixture
+def tcd(tcd_class, tcd_filename):
+    return tcd_class.open(tcd_filename)
+
+
+@pytest.fixture
+def sample_names(tcd):
+    """ The names of 100 stations, chosen at random.
+    """
+    rng = random.Random(42)
+    return [h.name for h in rng.sample(list(tcd.headers), 100)]
+
+
+def test_open(benchmark, tcd_class, tcd_filename):
+    benchmark(tcd_class.open, tcd_filename)
+
+
+def test_iter(benchmark, tcd):
+    benchmark(consume, tcd)
+
+
+def test_iter_headers(benchmark, tcd):
+    benchmark(consume, tcd.headers)
+
+
+class TestFind(object):
+    def test_build_name_index(self, benchmark, tcd, sample_names):
+        def find():
+            tcd._name_index = None
+            tcd.find(sample_names[0])
+        benchmark(find)
+
+    def test_find(self, benchmark, tcd, sample_names):
+        benchmark(lambda: [tcd.find(name) for name in sample_names])
+
+    def test_findall(self, benchmark, tcd, sample_names):
+        benchmark(lambda: [tcd.findall(name) for name in sample_names])
+
+    def test_index(self, benchmark, tcd, sample_names):
+        stations = [tcd.find(name) for name in sample_names]
+        benchmark(lambda: [tcd.index(station) for station in stations])
+
+
+class TestWrite(object):
+    @pytest.fixture
+    def tcd(self, writable_tcd_filename):
+        return Tcd.open(writable_tcd_filename)
+
+    @pytest.fixture(params=[ReferenceStation, SubordinateStation])
+    def station(self, request, tcd):
+        return next(s for s in tcd if isinstance(s, request.param))
+
+    def test_append(self, benchmark, tcd, station):
+        benchmark(tcd.append, station)
+
+    def test_setitem(self, benchmark, tcd, station):
+        i = len(tcd) // 2
+
+        def setitem():
+            tcd[i] = station
+        benchmark(setitem)
+
+
+@pytest.mark.parametrize('station_class',
+                         [ReferenceStation, SubordinateStation])
+def test_pack_round_trip(benchmark, tcd_filename, station_class):
+    tcd = Tcd.open(tcd_filename)
+    station = next(s for s in tcd if isinstance(s, station_class))
+
+    def round_trip():
+        rec = station._pack(tcd)
+        return station_class._unpack(tcd, rec)
+    benchmark(round_trip)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import os
+import shutil
+
+import pytest
+
+from synthetic import GENERATOR_VERSION, make_tcd
+
+DEFAULT_SIZES = '1000,10000,50000'
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--bench-sizes', default=DEFAULT_SIZES,
+        help="Comma-separated numbers of stations in the synthetic "
+        "databases (default: %s)" % DEFAULT_SIZES)
+
+
+def pytest_generate_tests(metafunc):
+    if 'n_stations' in metafunc.fixturenames:
+        sizes = metafunc.config.getoption('bench_sizes')
+        metafunc.parametrize('n_stations',
+                             [int(n) for n in sizes.split(',')],
+                             scope='session')
+
+
+def _data_dir(config, tmpdir_factory):
+    # Synthetic files are kept in the pytest cache, when available,
+    # since the larger ones take a while to generate.
+    cache = getattr(config, 'cache', None)
+    if cache is not None:
+        return str(cache.makedir('libtcd-bench'))
+    return str(tmpdir_factory.mktemp('libtcd-bench'))
+
+
+@pytest.fixture(scope='session')
+def tcd_filename(request, tmpdir_factory, n_stations):
+    """ The name of a (cached) synthetic TCD file of ``n_stations``.
+    """
+    data_dir = _data_dir(request.config, tmpdir_factory)
+    filename = os.path.join(data_dir, 'synthetic-v%d-%d.tcd'
+                            % (GENERATOR_VERSION, n_stations))
+    if not os.path.exists(filename):
+        tmpname = filename + '.tmp'
+        make_tcd(tmpname, n_stations).close()
+        os.rename(tmpname, filename)
+    return filename
+
+
+@pytest.fixture
+def writable_tcd_filename(tcd_filename, tmpdir):
+    """ The name of a private copy of the synthetic TCD file.
+    """
+    filename = str(tmpdir.join('writable.tcd'))
+    shutil.copyfile(tcd_filename, filename)
+    return filename
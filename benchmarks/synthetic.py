@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+""" Generate synthetic TCD files for benchmarking.
+
+The files use the constituents of the ``test.tcd`` fixture, and hold a
+mix of reference stations (each with 20 to 40 coefficients) and
+subordinate stations.  Generation is deterministic: a given
+``(n_stations, seed)`` always produces the same stations, so that
+benchmark results are comparable across commits.
+
+Usage::
+
+    python benchmarks/synthetic.py OUTPUT.tcd N_STATIONS
+
+"""
+from __future__ import absolute_import
+
+import datetime
+import random
+import sys
+
+from pkg_resources import resource_filename
+
+from libtcd.api import (
+    Coefficient,
+    ReferenceStation,
+    SubordinateStation,
+    Tcd,
+    )
+from libtcd.tcdfile import MmapTcd
+
+#: Bump this whenever the generated stations change, so that cached
+#: files are regenerated.
+GENERATOR_VERSION = 1
+
+#: The fraction of stations which are reference stations.
+REFERENCE_FRACTION = 0.3
+
+#: The fraction of subordinate stations which share the name of the
+#: preceding (subordinate) station.
+DUPLICATE_NAME_FRACTION = 0.05
+
+DEFAULT_SEED = 1970
+
+_REGIONS = [
+    (u'Puget Sound, Washington', u'U.S.A.', u':America/Los_Angeles'),
+    (u'Chesapeake Bay, Maryland', u'U.S.A.', u':America/New_York'),
+    (u'Bristol Channel, England', u'United Kingdom', u':Europe/London'),
+    (u'Bay of Fundy, Nova Scotia', u'Canada', u':America/Halifax'),
+    (u'Moreton Bay, Queensland', u'Australia', u':Australia/Brisbane'),
+    ]
+
+_DATUMS = [
+    u'Mean Lower Low Water',
+    u'Mean Low Water Springs',
+    u'Lowest Astronomical Tide',
+    ]
+
+
+def synthetic_stations(constituents, n_stations, seed=DEFAULT_SEED):
+    """ Generate ``n_stations`` stations.
+
+    ``constituents`` is the mapping of constituents of the database the
+    stations are for.  Subordinate stations refer to earlier reference
+    stations.
+
+    """
+    rng = random.Random(seed)
+    constituents = list(constituents.values())
+    refstations = []
+    stations = []
+    prev_name = None
+    for i in range(n_stations):
+        region, country, tzfile = rng.choice(_REGIONS)
+        attrs = dict(
+            latitude=round(rng.uniform(-70.0, 70.0), 4),
+            longitude=round(rng.uniform(-180.0, 180.0), 4),
+            tzfile=tzfile,
+            country=country,
+            level_units=u'feet',
+            source=u'synthetic',
+            date_imported=datetime.date(2015, 5, 4),
+            )
+        if not refstations or rng.random() < REFERENCE_FRACTION:
+            name = u'Reference %06d, %s' % (i, region)
+            n_coeffs = rng.randint(20, 40)
+            coefficients = [
+                Coefficient(round(rng.uniform(0.01, 5.0), 3),
+                            round(rng.uniform(0.0, 360.0), 2),
+                            constituent)
+                for constituent in rng.sample(constituents, n_coeffs)]
+            station = ReferenceStation(
+                name, coefficients,
+                datum=rng.choice(_DATUMS),
+                datum_offset=round(rng.uniform(0.0, 10.0), 3),
+                **attrs)
+            refstations.append(station)
+            prev_name = None
+        else:
+            if prev_name and rng.random() < DUPLICATE_NAME_FRACTION:
+                name = prev_name
+            else:
+                name = u'Subordinate %06d, %s' % (i, region)
+            minutes = datetime.timedelta(minutes=1)
+            station = SubordinateStation(
+                name, rng.choice(refstations),
+                min_time_add=rng.randint(-120, 120) * minutes,
+                max_time_add=rng.randint(-120, 120) * minutes,
+                min_level_multiply=round(rng.uniform(0.5, 1.5), 2),
+                max_level_multiply=round(rng.uniform(0.5, 1.5), 2),
+                **attrs)
+            prev_name = name
+        stations.append(station)
+    return stations
+
+
+def make_tcd(filename, n_stations, seed=DEFAULT_SEED):
+    """ Create a synthetic TCD file holding ``n_stations`` stations.
+    """
+    template = MmapTcd(resource_filename('libtcd.tests', 'test.tcd'))
+    try:
+        tcd = Tcd(filename, template.constituent_tables)
+    finally:
+        template.close()
+    tcd.extend(synthetic_stations(tcd.constituents, n_stations, seed))
+    return tcd
+
+
+def main(argv=sys.argv[1:]):
+    filename, n_stations = argv
+    tcd = make_tcd(filename, int(n_stations))
+    tcd.close()
+
+if __name__ == '__main__':
+    main()
@@ -119,7 +119,15 @@ class TIDE_RECORD(Structure):
 class Error(Exception):
     pass
 
-_lib = cdll.LoadLibrary("libtcd.so.0")
+# The library is loaded when the first libtcd function is called.
+_lib = None
+
+
+def _load_library():
+    global _lib
+    if _lib is None:
+        _lib = cdll.LoadLibrary("libtcd.so.0")
+    return _lib
 
 
 def _check_bool(result, func, args):
@@ -155,17 +163,60 @@ def _to_param(param_or_type):
     return _Param(param_or_type)
 
 
+class _LazyFunction(object):
+    """ A libtcd function, whose prototype is bound on first use.
+
+    When first called, this replaces itself (as a module global) by the
+    ctypes function.
+
+    """
+    def __init__(self, name, params, restype, errcheck, alias):
+        self.__name__ = alias
+        self._spec = name, params, restype, errcheck
+
+    def _bind(self):
+        name, params, restype, errcheck = self._spec
+        argtypes = tuple(param.typ for param in params)
+        paramflags = tuple(param.paramflag for param in params)
+        func = CFUNCTYPE(restype, *argtypes)((name, _load_library()),
+                                             paramflags)
+        func.__name__ = self.__name__
+        if errcheck:
+            func.errcheck = errcheck
+        self._func = func
+        # Leave alone anything which has replaced us (e.g. instrumentation)
+        if globals().get(self.__name__) is self:
+            globals()[self.__name__] = func
+        return func
+
+    def __call__(self, *args, **kwargs):
+        func = self.__dict__.get('_func') or self._bind()
+        return func(*args, **kwargs)
+
+
+# The names of all declared functions
+_declared = []
+# alias -> _LazyFunction
+_lazy_functions = {}
+
+
 def _declare(name, *params, **kwargs):
     params = list(map(_to_param, params))
-    argtypes = tuple(param.typ for param in params)
-    paramflags = tuple(param.paramflag for param in params)
     restype = kwargs.get('restype')
     errcheck = kwargs.get('errcheck')
-    func = CFUNCTYPE(restype, *argtypes)((name, _lib), paramflags)
-    func.__name__ = name
-    if errcheck:
-        func.errcheck = errcheck
-    globals()[name] = func
+    alias = kwargs.get('alias', name)
+    func = _LazyFunction(name, params, restype, errcheck, alias)
+    globals()[alias] = _lazy_functions[alias] = func
+    _declared.append(alias)
+
+
+def bind_all():
+    """ Load libtcd and bind all functions now, rather than on first use.
+    """
+    for func in _lazy_functions.values():
+        if '_func' not in func.__dict__:
+            func._bind()
+
 
 _declare('dump_tide_record', _Param(POINTER(TIDE_RECORD), 'rec'))
 
@@ -250,6 +301,28 @@ _declare('read_tide_record',
 _declare('read_next_tide_record',
          _OutputParam(POINTER(TIDE_RECORD)),
          restype=c_int32, errcheck=_check_return_none_on_failure)
+
+# Variants of the above which read into a caller-supplied record (so
+# that record buffers may be reused.)  They return the record, or None.
+_declare('get_partial_tide_record',
+         _Param(c_int32, 'num'),
+         _Param(POINTER(TIDE_STATION_HEADER), 'rec'),
+         restype=c_bool, errcheck=_check_return_none_on_failure,
+         alias='get_partial_tide_record_into')
+_declare('get_next_partial_tide_record',
+         _Param(POINTER(TIDE_STATION_HEADER), 'rec'),
+         restype=c_int32, errcheck=_check_return_none_on_failure,
+         alias='get_next_partial_tide_record_into')
+_declare('read_tide_record',
+         _Param(c_int32, 'num'),
+         _Param(POINTER(TIDE_RECORD), 'rec'),
+         restype=c_int32, errcheck=_check_return_none_on_failure,
+         alias='read_tide_record_into')
+_declare('read_next_tide_record',
+         _Param(POINTER(TIDE_RECORD), 'rec'),
+         restype=c_int32, errcheck=_check_return_none_on_failure,
+         alias='read_next_tide_record_into')
+
 _declare('add_tide_record',
          _Param(POINTER(TIDE_RECORD), 'rec'),
          _Param(POINTER(DB_HEADER_PUBLIC), 'db', default=None),
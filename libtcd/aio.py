@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+""" An :mod:`asyncio` interface to TCD databases.
+
+Every access to a :class:`~libtcd.api.Tcd` may block: on the global
+lock which serializes access to libtcd, and on libtcd's own file I/O.
+:class:`AsyncTcd` keeps all of that off the event loop.  Each
+``AsyncTcd`` has a dedicated owner thread which makes all the calls to
+its database; its methods return awaitables.
+
+Requests which arrive together are batched.  The owner thread takes
+all the requests queued when it becomes free.  The raw records for a
+run of reads (``__getitem__`` and ``find``) are read under a single
+acquisition of the lock.
+
+This module requires Python 3.5 or later.
+
+"""
+from __future__ import absolute_import
+
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from itertools import groupby
+import threading
+
+from six.moves import queue
+
+from .api import Tcd
+from .compat import bytes_
+from . import _libtcd
+
+# Request kinds
+_READ = 'read'
+_APPEND = 'append'
+_CALL = 'call'
+_STOP = 'stop'
+
+
+def _resolved(result=None, exception=None):
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+class AsyncTcd(object):
+    """ An asyncio facade for a database.
+
+    ``tcd`` is an open :class:`~libtcd.api.Tcd` (or
+    :class:`~libtcd.tcdfile.MmapTcd`.)  It should not be used, other
+    than through the ``AsyncTcd``, until :meth:`close` has completed.
+
+    """
+    def __init__(self, tcd):
+        self._start(lambda: tcd, close=False)
+
+    @classmethod
+    def open(cls, filename, tcd_class=Tcd, lazy=False):
+        """ Open a database.
+
+        The database is opened by the owner thread.  Requests may be
+        made immediately; they are processed once it is open.
+
+        """
+        self = cls.__new__(cls)
+        self._start(lambda: tcd_class.open(filename, lazy=lazy), close=True)
+        return self
+
+    def _start(self, opener, close):
+        self.tcd = None
+        self._close_tcd = close
+        self._queue = queue.Queue()
+        self._queue_lock = threading.Lock()
+        self._closed = False
+        self._stopped = Future()
+        self._thread = threading.Thread(target=self._run, args=(opener,),
+                                        name='AsyncTcd owner')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _submit(self, kind, arg):
+        future = Future()
+        with self._queue_lock:
+            if self._closed:
+                future.set_exception(RuntimeError("closed"))
+            else:
+                self._queue.put((kind, arg, future))
+        return future
+
+    def _request(self, kind, arg):
+        return asyncio.wrap_future(self._submit(kind, arg))
+
+    def __getitem__(self, i):
+        """ Get a station, by record number.  Returns an awaitable.
+        """
+        return self._request(_READ, ('index', i))
+
+    def find(self, name):
+        """ Find a station by name.  Returns an awaitable.
+        """
+        return self._request(_READ, ('name', name))
+
+    def append(self, station):
+        """ Append a station.
+
+        Returns an awaitable for the record number of the new station.
+
+        """
+        return self._request(_APPEND, station)
+
+    def headers(self):
+        """ Get all the station headers.  Returns an awaitable.
+        """
+        return self._request(_CALL, lambda tcd: list(tcd.headers))
+
+    def call(self, func, *args):
+        """ Call ``func(tcd, *args)`` in the owner thread.
+
+        Returns an awaitable for its result.
+
+        """
+        return self._request(_CALL, lambda tcd: func(tcd, *args))
+
+    def iter_records(self, chunk_size=64):
+        """ Iterate asynchronously over all the stations in the database.
+
+        Returns an asynchronous iterator (for use with ``async for``.)
+        Records are read, and unpacked, a chunk at a time.
+
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        return _AsyncRecordIterator(self, chunk_size)
+
+    def close(self):
+        """ Stop the owner thread, once all pending requests are done.
+
+        If the database was opened by :meth:`open`, it is closed.
+        Requests made after ``close`` fail with :exc:`RuntimeError`.
+        Returns an awaitable.
+
+        """
+        with self._queue_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put((_STOP, None, None))
+        return asyncio.wrap_future(self._stopped)
+
+    def _run(self, opener):
+        try:
+            self.tcd = opener()
+        except Exception as ex:
+            error = ex
+        else:
+            error = None
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            requests = []
+            for kind, arg, future in batch:
+                if kind is _STOP:
+                    stopping = True
+                elif future.set_running_or_notify_cancel():
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        requests.append((kind, arg, future))
+            for kind, group in groupby(requests, lambda req: req[0]):
+                group = list(group)
+                try:
+                    getattr(self, '_process_' + kind)(group)
+                except Exception as ex:
+                    for _, _, future in group:
+                        if not future.done():
+                            future.set_exception(ex)
+        try:
+            if self._close_tcd and self.tcd is not None:
+                self.tcd.close()
+        except Exception as ex:
+            self._stopped.set_exception(ex)
+        else:
+            self._stopped.set_result(None)
+
+    def _process_read(self, requests):
+        tcd = self.tcd
+        n_records = len(tcd)
+        numbers = []
+        for _, (key, value), future in requests:
+            if key == 'name':
+                i = tcd._names.find(bytes_(value, _libtcd.ENCODING))
+                if i is None:
+                    future.set_exception(KeyError(value))
+            else:
+                i = value + n_records if value < 0 else value
+            numbers.append(i)
+
+        # Read all the raw records under a single lock acquisition
+        with tcd._reading() as reader:
+            records = [reader._get_record(i) if i is not None else None
+                       for i in numbers]
+
+        for (_, (key, value), future), rec in zip(requests, records):
+            if future.done():
+                continue
+            try:
+                if rec is None:
+                    raise IndexError(value)
+                future.set_result(tcd._unpack_record(rec))
+            except Exception as ex:
+                future.set_exception(ex)
+
+    def _process_append(self, requests):
+        # Each append succeeds or fails on its own
+        for _, station, future in requests:
+            try:
+                future.set_result(self.tcd.append(station))
+            except Exception as ex:
+                future.set_exception(ex)
+
+    def _process_call(self, requests):
+        for _, func, future in requests:
+            try:
+                future.set_result(func(self.tcd))
+            except Exception as ex:
+                future.set_exception(ex)
+
+
+class _AsyncRecordIterator(object):
+    def __init__(self, atcd, chunk_size):
+        self._atcd = atcd
+        self._chunk_size = chunk_size
+        self._start = 0
+        self._stations = deque()
+        self._exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self._stations:
+            result = _resolved(self._stations.popleft())
+        elif self._exhausted:
+            result = _resolved(exception=StopAsyncIteration())
+        else:
+            result = Future()
+            chunk = self._atcd._submit(_CALL, self._read_chunk)
+            chunk.add_done_callback(
+                lambda chunk: self._chunk_done(chunk, result))
+        return asyncio.wrap_future(result)
+
+    def _read_chunk(self, tcd):
+        # Called in the owner thread
+        with tcd._reading() as reader:
+            records = reader._read_chunk(self._start, self._chunk_size)
+        return [tcd._unpack_record(rec) for rec in records]
+
+    def _chunk_done(self, chunk, result):
+        try:
+            stations = chunk.result()
+        except Exception as ex:
+            result.set_exception(ex)
+            return
+        self._start += len(stations)
+        if len(stations) < self._chunk_size:
+            self._exhausted = True
+        self._stations.extend(stations)
+        if self._stations:
+            result.set_result(self._stations.popleft())
+        else:
+            result.set_exception(StopAsyncIteration())
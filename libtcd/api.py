@@ -3,20 +3,32 @@
 """
 from __future__ import absolute_import
 
+from array import array
 from collections import namedtuple, Mapping
-from ctypes import c_char_p, POINTER
+from contextlib import contextmanager
+from ctypes import (
+    Array,
+    addressof,
+    c_char_p,
+    memmove,
+    memset,
+    POINTER,
+    sizeof,
+    )
 import datetime
-from itertools import chain, count, islice
-from operator import attrgetter, methodcaller
+from itertools import chain, islice
+from operator import attrgetter
+import os
 from threading import Lock
 import re
 
-from six import add_metaclass, text_type
+from six import add_metaclass, exec_, text_type
 from six.moves import range, zip
 
 from . import _libtcd
 from .compat import bytes_, OrderedDict
-from .util import reify, timedelta_total_minutes
+from .spatial import SpatialIndex
+from .util import LRUCache, reify, timedelta_total_minutes
 
 Constituent = namedtuple('Constituent', ['name', 'speed', 'node_factors'])
 
@@ -25,31 +37,216 @@ NodeFactor = namedtuple('NodeFactor', ['equilibrium', 'node_factor'])
 
 class NodeFactors(Mapping):
     """ Mapping from ``year`` to :cls:`NodeFactor`\s
+
+    The equilibrium arguments and node factors are kept in two
+    sequences of floats.  (See :meth:`from_arrays`.)
+
     """
     def __init__(self, start_year, node_factors):
+        equilibriums = [nf.equilibrium for nf in node_factors]
+        factors = [nf.node_factor for nf in node_factors]
+        self._init(start_year, equilibriums, factors, 0, len(factors))
+
+    @classmethod
+    def from_arrays(cls, start_year, equilibriums, node_factors,
+                    offset=0, length=None):
+        """ Construct a view onto sequences of equilibriums and node factors.
+
+        The values for ``start_year`` are at index ``offset`` of the
+        sequences, which are not copied.  This allows the node factors of
+        all constituents to share the same (flat) tables.
+
+        """
+        if length is None:
+            length = len(node_factors) - offset
+        self = cls.__new__(cls)
+        self._init(start_year, equilibriums, node_factors, offset, length)
+        return self
+
+    def _init(self, start_year, equilibriums, node_factors, offset, length):
         self.start_year = start_year
-        self.node_factors = node_factors
+        self._equilibriums = equilibriums
+        self._node_factors = node_factors
+        self._offset = offset
+        self._length = length
+
+    def __reduce__(self):
+        # Only pickle our own part of the tables
+        stop = self._offset + self._length
+        return (NodeFactors.from_arrays,
+                (self.start_year,
+                 self._equilibriums[self._offset:stop],
+                 self._node_factors[self._offset:stop]))
 
     @property
     def end_year(self):
-        return self.start_year + len(self.node_factors)
+        return self.start_year + self._length
 
     def __len__(self):
-        return len(self.node_factors)
+        return self._length
 
     def __iter__(self):
         return iter(range(self.start_year, self.end_year))
 
     def values(self):
         # FIXME: py3k compatibility (need to return a view?)
-        return self.node_factors
+        stop = self._offset + self._length
+        return [NodeFactor(eq, nf)
+                for eq, nf in zip(self._equilibriums[self._offset:stop],
+                                  self._node_factors[self._offset:stop])]
+
+    @property
+    def node_factors(self):
+        return self.values()
+
+    def _slices(self, start_year, end_year):
+        """ Get the equilibriums and node factors for a range of years.
+        """
+        start = self._offset + start_year - self.start_year
+        stop = self._offset + end_year - self.start_year
+        return (self._equilibriums[start:stop],
+                self._node_factors[start:stop])
 
     def __getitem__(self, year):
         i = int(year) - self.start_year
-        if 0 <= i < len(self.node_factors):
-            return self.node_factors[i]
+        if 0 <= i < self._length:
+            i += self._offset
+            return NodeFactor(self._equilibriums[i], self._node_factors[i])
         raise KeyError(year)
 
+
+def _flat_table(table, typecode, size):
+    """ Get ``table`` as a flat table of ``size`` floats of type ``typecode``.
+
+    Arrays (``array`` or numpy) of the right type are not copied.
+
+    """
+    if hasattr(table, 'dtype'):                         # numpy
+        import numpy
+        table = numpy.ascontiguousarray(table, dtype=typecode).reshape(-1)
+    elif not (isinstance(table, array) and table.typecode == typecode):
+        table = array(typecode, table)
+    if len(table) != size:
+        raise ValueError("Expected a table of %d values, not %d"
+                         % (size, len(table)))
+    return table
+
+
+def _ctypes_table(ctype, table):
+    """ Get a ctypes array which shares its memory with ``table``.
+
+    Read-only tables are copied.
+
+    """
+    table_type = ctype * len(table)
+    try:
+        return table_type.from_buffer(table)
+    except TypeError:                   # not writable
+        return table_type.from_buffer_copy(table)
+
+
+class ConstituentTables(object):
+    """ The constituents of a database, as flat tables.
+
+    ``names`` is a list of the constituent names, and ``speeds`` a
+    sequence of their speeds (in degrees per hour.)  ``equilibriums``
+    and ``node_factors`` hold ``C x Y`` matrices, in row-major order,
+    of the yearly equilibrium arguments and node factors of the ``C``
+    constituents for the ``Y`` years starting with ``start_year``.
+
+    The tables may be given as ``array`` objects, numpy arrays (of any
+    shape with the right number of elements) or other sequences.  They
+    are stored as flat ``array('d')`` (speeds) and ``array('f')``
+    tables, or as flat numpy arrays of the corresponding types.  Tables
+    which are already of the right type are not copied.
+
+    A :class:`Tcd` may be created from ``ConstituentTables``.  Their
+    tables are then passed to libtcd without any per-element copying.
+
+    """
+    def __init__(self, names, speeds, start_year, number_of_years,
+                 equilibriums, node_factors):
+        n = len(names)
+        size = n * number_of_years
+        self.names = list(names)
+        self.speeds = _flat_table(speeds, 'd', n)
+        self.start_year = start_year
+        self.number_of_years = number_of_years
+        self.equilibriums = _flat_table(equilibriums, 'f', size)
+        self.node_factors = _flat_table(node_factors, 'f', size)
+
+    @classmethod
+    def from_constituents(cls, constituents):
+        """ Build tables from a mapping of name to :class:`Constituent`.
+
+        The tables cover the range of years common to all the
+        constituents.
+
+        """
+        start_year = max(map(attrgetter('node_factors.start_year'),
+                             constituents.values()))
+        end_year = min(map(attrgetter('node_factors.end_year'),
+                           constituents.values()))
+        num_years = end_year - start_year
+        if num_years < 1:
+            raise ValueError("num_years is zero")
+
+        names = []
+        speeds = array('d')
+        equilibriums = array('f')
+        node_factors = array('f')
+        for c in constituents.values():
+            names.append(c.name)
+            speeds.append(c.speed)
+            eqs, nfs = c.node_factors._slices(start_year, end_year)
+            equilibriums.extend(eqs)
+            node_factors.extend(nfs)
+        return cls(names, speeds, start_year, num_years,
+                   equilibriums, node_factors)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def end_year(self):
+        return self.start_year + self.number_of_years
+
+    def constituents(self):
+        """ Build the ordered mapping of name to :class:`Constituent`.
+
+        The constituents' :class:`NodeFactors` are views onto the tables.
+
+        """
+        years = self.number_of_years
+        constituents = OrderedDict()
+        for i, (name, speed) in enumerate(zip(self.names, self.speeds)):
+            if name in constituents:
+                raise InvalidTcdFile("duplicate constituent name (%r)" % name)
+            node_factors = NodeFactors.from_arrays(
+                self.start_year, self.equilibriums, self.node_factors,
+                i * years, years)
+            constituents[name] = Constituent(name, speed, node_factors)
+        return constituents
+
+    def as_numpy(self):
+        """ Get the tables as numpy arrays.
+
+        Returns ``(speeds, equilibriums, node_factors)``, where the
+        latter two are ``C x Y`` ``float32`` matrices.  These share
+        memory with the tables (where possible.)  This requires numpy.
+
+        """
+        import numpy
+        shape = len(self), self.number_of_years
+
+        def as_matrix(table):
+            if isinstance(table, array):
+                table = numpy.frombuffer(table, dtype=numpy.float32)
+            return numpy.asarray(table, dtype=numpy.float32).reshape(shape)
+        return (numpy.asarray(self.speeds, dtype=numpy.float64),
+                as_matrix(self.equilibriums),
+                as_matrix(self.node_factors))
+
 Coefficient = namedtuple('Coefficient', ['amplitude', 'epoch', 'constituent'])
 
 
@@ -65,6 +262,18 @@ class _attr_descriptor(object):
         self.null_value = null_value
         self.__dict__.update(**kwargs)
 
+    @property
+    def unpacked_names(self):
+        """ The names of the station attributes set by :meth:`unpack`.
+        """
+        return (self.name,)
+
+    @property
+    def packed_names(self):
+        """ The names of the record fields used by :meth:`unpack`.
+        """
+        return (self.packed_name,)
+
     def unpack(self, tcd, rec):
         packed = getattr(rec, self.packed_name)
         if self.null_value is not _marker and packed == self.null_value:
@@ -87,6 +296,53 @@ class _attr_descriptor(object):
     def pack_value(self, tcd, value):
         return value
 
+    def unpack_code(self, var):
+        """ Source code to unpack the attribute(s).
+
+        Returns a list of lines, for use in the specialized unpack
+        function of a station class (see :class:`_StationMeta`), which
+        unpack record ``rec`` into the dict ``state``.  ``var`` is the
+        name by which the descriptor is known to the generated code.
+
+        """
+        if _overrides(self, 'unpack'):
+            return ['for name, value in %s.unpack(tcd, rec):' % var,
+                    '    state[name] = value']
+        value = 'packed'
+        if _overrides(self, 'unpack_value'):
+            value = '%s.unpack_value(tcd, packed)' % var
+        if self.null_value is not _marker:
+            value = 'None if packed == %s.null_value else %s' % (var, value)
+        return ['packed = rec.%s' % self.packed_name,
+                'state[%r] = %s' % (self.name, value)]
+
+    def pack_code(self, var):
+        """ Source code to pack the attribute(s).
+
+        Like :meth:`unpack_code`, except that the lines pack
+        ``station`` into the record ``rec``.
+
+        """
+        if _overrides(self, 'pack'):
+            return ['for name, packed in %s.pack(tcd, station):' % var,
+                    '    setattr(rec, name, packed)']
+        packed = 'value'
+        if _overrides(self, 'pack_value'):
+            packed = '%s.pack_value(tcd, value)' % var
+        if self.null_value is not _marker:
+            packed = '%s.null_value if value is None else %s' % (var, packed)
+        return ['value = station.%s' % self.name,
+                'rec.%s = %s' % (self.packed_name, packed)]
+
+
+def _overrides(descriptor, method_name):
+    # Whether the descriptor's class overrides the given method of
+    # _attr_descriptor
+    def func(method):
+        return getattr(method, '__func__', method)
+    return (func(getattr(type(descriptor), method_name))
+            is not func(getattr(_attr_descriptor, method_name)))
+
 
 class _string_table(_attr_descriptor):
     getter_tmpl = 'get_{table_name}'
@@ -96,16 +352,35 @@ class _string_table(_attr_descriptor):
         super(_string_table, self).__init__(*args, **kwargs)
 
         table_name = getattr(self, 'table_name', self.packed_name)
-        self.getter = getattr(_libtcd, self.getter_tmpl.format(**locals()))
-        self.finder = getattr(_libtcd, self.finder_tmpl.format(**locals()))
+        self.table_name = table_name
+        self.getter_name = self.getter_tmpl.format(**locals())
+        self.finder_name = self.finder_tmpl.format(**locals())
+
+    # The libtcd functions are looked up when used, so that replacements
+    # (e.g. by libtcd.instrument) take effect
+    @property
+    def getter(self):
+        return getattr(_libtcd, self.getter_name)
+
+    @property
+    def finder(self):
+        return getattr(_libtcd, self.finder_name)
 
     def unpack_value(self, tcd, i):
+        # Databases keep Python-side copies of their string tables
+        string_table = getattr(tcd, '_string_table_cache', None)
+        if string_table is not None:
+            return string_table(self.table_name).get(i)
         return text_type(self.getter(i), _libtcd.ENCODING)
 
     def pack_value(self, tcd, s):
         if s is None:
             return 0
-        i = self.finder(bytes_(s, _libtcd.ENCODING))
+        find_or_add = getattr(tcd, '_find_or_add_string', None)
+        if find_or_add is not None:
+            i = find_or_add(self.table_name, s, self.finder)
+        else:
+            i = self.finder(bytes_(s, _libtcd.ENCODING))
         if i < 0:
             raise ValueError(s)         # FIXME: better message
         return i
@@ -209,11 +484,19 @@ class _record_number(_attr_descriptor):
     def pack(self, tcd, station):
         return ()                       # never pack record number
 
+    def pack_code(self, var):
+        return []
+
 
 class _record_type(_attr_descriptor):
+    unpacked_names = packed_names = ()
+
     def unpack(self, tcd, rec):
         return ()
 
+    def unpack_code(self, var):
+        return []
+
     def pack(self, tcd, station):
         if isinstance(station, ReferenceStation):
             record_type = _libtcd.REFERENCE_STATION
@@ -228,13 +511,24 @@ class _record_type(_attr_descriptor):
 
 class _coordinates(_attr_descriptor):
     # latitude/longitude
+    unpacked_names = packed_names = ('latitude', 'longitude')
+
     def unpack(self, tcd, rec):
+        latitude, longitude = self.unpack_coordinates(rec)
+        yield 'latitude', latitude
+        yield 'longitude', longitude
+
+    @staticmethod
+    def unpack_coordinates(rec):
         latitude = rec.latitude
         longitude = rec.longitude
         if latitude == 0 and longitude == 0:
             latitude = longitude = None
-        yield 'latitude', latitude
-        yield 'longitude', longitude
+        return latitude, longitude
+
+    def unpack_code(self, var):
+        return ["state['latitude'], state['longitude'] = "
+                "%s.unpack_coordinates(rec)" % var]
 
     def pack(self, tcd, station):
         latitude = station.latitude
@@ -248,14 +542,23 @@ class _coordinates(_attr_descriptor):
 
 
 class _coefficients(_attr_descriptor):
-    # latitude/longitude
+    packed_names = ('amplitude', 'epoch')
+
     def unpack(self, tcd, rec):
-        yield self.name, [
-            Coefficient(amplitude, epoch, constituent)
-            for constituent, amplitude, epoch in zip(
-                tcd.constituents.values(), rec.amplitude, rec.epoch)
-            if amplitude != 0.0
-            ]
+        yield self.name, self.unpack_coefficients(tcd, rec)
+
+    @staticmethod
+    def unpack_coefficients(tcd, rec):
+        # (Slicing the ctypes arrays is much faster than iterating.)
+        return [Coefficient(amplitude, epoch, constituent)
+                for constituent, amplitude, epoch in zip(
+                    tcd.constituents.values(), rec.amplitude[:],
+                    rec.epoch[:])
+                if amplitude != 0.0]
+
+    def unpack_code(self, var):
+        return ['state[%r] = %s.unpack_coefficients(tcd, rec)'
+                % (self.name, var)]
 
     def pack(self, tcd, station):
         coeffs = dict((coeff.constituent.name, coeff)
@@ -277,19 +580,25 @@ class _coefficients(_attr_descriptor):
 
 class _reference_station(_attr_descriptor):
     def unpack(self, tcd, rec):
-        if isinstance(rec, _libtcd.TIDE_STATION_HEADER):
-            get_record = _libtcd.get_partial_tide_record
+        record_class = getattr(rec, 'record_class', type(rec))
+        if issubclass(record_class, _libtcd.TIDE_STATION_HEADER):
+            source = tcd.headers
             refclass = ReferenceStationHeader
         else:
-            assert isinstance(rec, _libtcd.TIDE_RECORD)
-            get_record = _libtcd.read_tide_record
+            assert issubclass(record_class, _libtcd.TIDE_RECORD)
+            source = tcd
             refclass = ReferenceStation
 
         i = getattr(rec, self.packed_name)
-        refrec = get_record(i)
-        if refrec.record_type != _libtcd.REFERENCE_STATION:
-            raise InvalidTcdFile("Reference station has bad record_type")
-        yield self.name, refclass._unpack(tcd, refrec)
+        cache = tcd._refstation_cache(refclass)
+        refstation = cache.get(i)
+        if refstation is None:
+            with source._reading() as reader:
+                refrec = reader._get_record(i)
+            if refrec.record_type != _libtcd.REFERENCE_STATION:
+                raise InvalidTcdFile("Reference station has bad record_type")
+            refstation = cache[i] = source._unpack_record(refrec)
+        yield self.name, refstation
 
     @staticmethod
     def unpack_value(tcd, i):
@@ -307,12 +616,151 @@ class _reference_station(_attr_descriptor):
 
 
 class _StationMeta(type):
+    """ Metaclass for stations.
+
+    This collects the ``_PACKED_ATTRS`` of all base classes, and
+    compiles functions, specialized for the class, to unpack
+    (``_unpack_state``) and pack (``_pack_record``) records.  These
+    have the same effect as calling the ``unpack`` (or ``pack``)
+    method of each descriptor in turn, but without the overhead of
+    a generator per descriptor.
+
+    """
     def __init__(cls, name, bases, dct):
-        packed_attrs = set()
-        for base in cls.__mro__:
-            packed_attrs.update(getattr(base, '_PACKED_ATTRS', ()))
+        # Base classes first, then in order of declaration
+        packed_attrs = OrderedDict()
+        for base in reversed(cls.__mro__):
+            for descriptor in getattr(base, '_PACKED_ATTRS', ()):
+                packed_attrs[descriptor] = True
         if packed_attrs:
             cls._PACKED_ATTRS = tuple(packed_attrs)
+            cls._unpack_state = staticmethod(_compile_unpack(cls))
+            cls._pack_record = staticmethod(_compile_pack(cls))
+
+
+def _compile_function(cls, name, args, lines, namespace):
+    source = 'def %s(%s):\n%s' % (
+        name, args, ''.join('    %s\n' % line for line in lines))
+    code = compile(source, '<%s.%s>' % (cls.__name__, name), 'exec')
+    exec_(code, namespace)
+    return namespace[name]
+
+
+def _compile_unpack(cls):
+    """ Compile a function to unpack a record into a station's state.
+
+    The function has signature ``(state, tcd, rec)``.
+
+    """
+    namespace = {}
+    lines = []
+    for n, descriptor in enumerate(cls._PACKED_ATTRS):
+        var = '_d%d' % n
+        namespace[var] = descriptor
+        lines.extend(descriptor.unpack_code(var))
+    lines.append('return state')
+    return _compile_function(cls, '_unpack_state', 'state, tcd, rec',
+                             lines, namespace)
+
+
+def _compile_pack(cls):
+    """ Compile a function to pack a station into a ``TIDE_RECORD``.
+
+    The function has signature ``(tcd, station)``.
+
+    """
+    namespace = {'TIDE_RECORD': _libtcd.TIDE_RECORD}
+    lines = ['rec = TIDE_RECORD()']
+    defaults = getattr(cls, '_TIDE_RECORD_DEFAULTS', {})
+    for n, field in enumerate(sorted(defaults)):
+        var = '_f%d' % n
+        namespace[var] = defaults[field]
+        lines.append('rec.%s = %s' % (field, var))
+    for n, descriptor in enumerate(cls._PACKED_ATTRS):
+        var = '_d%d' % n
+        namespace[var] = descriptor
+        lines.extend(descriptor.pack_code(var))
+    lines.append('return rec')
+    return _compile_function(cls, '_pack_record', 'tcd, station',
+                             lines, namespace)
+
+
+class _RecordFields(object):
+    """ A copy of the fields of a record needed to unpack a station.
+
+    This is much smaller than the ``TIDE_RECORD`` it is copied from,
+    since it omits the (large) character arrays of fields which are not
+    needed.  ``record_class`` is the type of the original record.
+
+    """
+    def __init__(self, rec, packed_names):
+        self.record_class = type(rec)
+        for name in packed_names:
+            value = getattr(rec, name)
+            if isinstance(value, Array):
+                value = type(value).from_buffer_copy(value)
+            setattr(self, name, value)
+
+
+class _lazy_attr(object):
+    """ A non-data descriptor which unpacks an attribute on first access.
+
+    The values of all the attributes unpacked by the (packed attribute)
+    descriptor are stored in the instance ``__dict__``, where they
+    shadow this descriptor thereafter.
+
+    """
+    def __init__(self, name, descriptor):
+        self.name = name
+        self.descriptor = descriptor
+
+    def __get__(self, inst, owner):
+        if inst is None:
+            return self
+        state = inst.__dict__
+        for name, value in self.descriptor.unpack(inst._lazy_tcd,
+                                                  inst._lazy_rec):
+            state.setdefault(name, value)
+        return state[self.name]
+
+
+def _new_station(cls):
+    return cls.__new__(cls)
+
+_lazy_classes = {}
+
+
+def _lazy_class(cls):
+    """ Get the lazily unpacked version of station class ``cls``.
+
+    This is a subclass of ``cls`` (with the same name) which has a
+    :class:`_lazy_attr` for each of the attributes unpacked from a
+    record.
+
+    """
+    lazy_cls = _lazy_classes.get(cls)
+    if lazy_cls is None:
+        dct = {
+            '__module__': cls.__module__,
+            '__reduce__': _lazy_reduce,
+            '_PACKED_NAMES': tuple(sorted(set(chain.from_iterable(
+                d.packed_names for d in cls._PACKED_ATTRS)))),
+            }
+        for descriptor in cls._PACKED_ATTRS:
+            for name in descriptor.unpacked_names:
+                dct[name] = _lazy_attr(name, descriptor)
+        lazy_cls = type(cls)(cls.__name__, (cls,), dct)
+        _lazy_classes[cls] = _lazy_classes[lazy_cls] = lazy_cls
+    return lazy_cls
+
+
+def _lazy_reduce(self):
+    # Pickle (or copy) a lazy station as a fully unpacked instance of the
+    # ordinary station class.
+    self._unpack_all()
+    state = dict(self.__dict__)
+    del state['_lazy_tcd'], state['_lazy_rec']
+    return _new_station, (type(self).__bases__[0],), state
 
 
 @add_metaclass(_StationMeta)
@@ -331,13 +779,23 @@ class StationHeader(object):
         self.__dict__.update(kwargs)
 
     @classmethod
-    def _unpack(cls, tcd, rec):
-        unpack = methodcaller('unpack', tcd, rec)
+    def _unpack(cls, tcd, rec, lazy=False):
+        if lazy:
+            lazy_cls = _lazy_class(cls)
+            inst = lazy_cls.__new__(lazy_cls)
+            inst._lazy_tcd = tcd
+            inst._lazy_rec = _RecordFields(rec, lazy_cls._PACKED_NAMES)
+            return inst
         inst = cls.__new__(cls)
-        inst.__dict__.update(
-            chain.from_iterable(map(unpack, cls._PACKED_ATTRS)))
+        cls._unpack_state(inst.__dict__, tcd, rec)
         return inst
 
+    def _unpack_all(self):
+        # Make sure all lazily unpacked attributes have been unpacked.
+        for descriptor in self._PACKED_ATTRS:
+            for name in descriptor.unpacked_names:
+                getattr(self, name)
+
     def __repr__(self):
         return "<{0.__class__.__name__}: {0.name}>".format(self)
 
@@ -384,11 +842,7 @@ class Station(StationHeader):
         return OrderedDict()
 
     def _pack(self, tcd):
-        packed = self._TIDE_RECORD_DEFAULTS.copy()
-        pack = methodcaller('pack', tcd, self)
-        packed.update(
-            chain.from_iterable(map(pack, self._PACKED_ATTRS)))
-        return _libtcd.TIDE_RECORD(**packed)
+        return self._pack_record(tcd, self)
 
     # "Null" values for TIDE_RECORD fields in those cases where the
     # "null" value is not zero.
@@ -476,109 +930,485 @@ class InvalidTcdFile(Exception):
 
 _lock = Lock()
 _current_database = None
+_reopen_count = 0
+
+
+# The string tables cached by Tcd: table name -> DB_HEADER_PUBLIC field
+# giving the number of entries in the table
+_STRING_TABLE_SIZES = {
+    'country': 'countries',
+    'tzfile': 'tzfiles',
+    'level_units': 'level_unit_types',
+    'dir_units': 'dir_unit_types',
+    'restriction': 'restriction_types',
+    'datum': 'datum_types',
+    'legalese': 'legaleses',
+    }
 
 
 def get_current_database():
     return _current_database
 
 
+def get_reopen_count():
+    """ The number of times a database has been (re)opened by libtcd.
+
+    libtcd can only have one database open at a time, so each switch
+    to a different :class:`Tcd` which actually reopens its file (rather
+    than reading from a snapshot) is counted.
+
+    """
+    return _reopen_count
+
+
+class _NameIndex(object):
+    """ An index of station names to record numbers.
+
+    Record numbers are indexed separately for each record type.
+    All names are (encoded) byte strings.
+
+    """
+    def __init__(self):
+        self.by_type = {
+            _libtcd.REFERENCE_STATION: {},
+            _libtcd.SUBORDINATE_STATION: {},
+            }
+        self.keys = []          # record_number -> (record_type, name)
+
+    @classmethod
+    def from_headers(cls, headers):
+        """ Build index from an iterable of ``TIDE_STATION_HEADER``\s
+        """
+        index = cls()
+        for rec in headers:
+            if rec.record_number != len(index.keys):
+                raise InvalidTcdFile("Records are not numbered sequentially")
+            index.append(rec.record_type, rec.name)
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, name):
+        """ Find the lowest numbered record with the given name.
+        """
+        firsts = [by_name[name][0]
+                  for by_name in self.by_type.values() if name in by_name]
+        return min(firsts) if firsts else None
+
+    def findall(self, name):
+        """ Find the record numbers of all records with the given name.
+        """
+        return sorted(chain.from_iterable(
+            by_name.get(name, ()) for by_name in self.by_type.values()))
+
+    def index(self, record_type, name):
+        """ Find the lowest numbered record of the given type and name.
+        """
+        record_numbers = self.by_type.get(record_type, {}).get(name)
+        return record_numbers[0] if record_numbers else None
+
+    def append(self, record_type, name):
+        i = len(self.keys)
+        self.keys.append((record_type, name))
+        self.by_type[record_type].setdefault(name, []).append(i)
+        return i
+
+    def replace(self, i, record_type, name):
+        self._remove_key(i)
+        self.keys[i] = (record_type, name)
+        record_numbers = self.by_type[record_type].setdefault(name, [])
+        record_numbers.append(i)
+        record_numbers.sort()
+
+    def delete(self, i):
+        """ Remove record ``i``, renumbering the records which follow it.
+        """
+        self._remove_key(i)
+        del self.keys[i]
+        for by_name in self.by_type.values():
+            for record_numbers in by_name.values():
+                record_numbers[:] = [j - 1 if j > i else j
+                                     for j in record_numbers]
+
+    def _remove_key(self, i):
+        record_type, name = self.keys[i]
+        by_name = self.by_type[record_type]
+        record_numbers = by_name[name]
+        record_numbers.remove(i)
+        if not record_numbers:
+            del by_name[name]
+
+
+class _StringTableCache(object):
+    """ A Python-side copy of a libtcd string table.
+
+    Maps index to (decoded) text, and text to index.
+
+    """
+    def __init__(self, texts=()):
+        self.texts = []
+        self.indexes = {}
+        for text in texts:
+            self.add(len(self.texts), text)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def get(self, i):
+        """ Get entry ``i``.
+
+        Like libtcd, returns ``u'Unknown'`` if ``i`` is out of range.
+
+        """
+        if 0 <= i < len(self.texts):
+            return self.texts[i]
+        return u'Unknown'
+
+    def find(self, text):
+        """ Find the index of ``text``, or -1 if it is not in the table.
+        """
+        return self.indexes.get(text, -1)
+
+    def add(self, i, text, alias=None):
+        """ Record that entry ``i`` is ``text``.
+
+        ``alias``, if given, is another text which also maps to ``i``.
+        (E.g. the text which was passed to libtcd, if libtcd stored a
+        truncated version of it.)
+
+        """
+        texts = self.texts
+        if i == len(texts):
+            texts.append(text)
+        else:
+            texts[i] = text
+        self.indexes.setdefault(text, i)
+        if alias is not None:
+            self.indexes.setdefault(alias, i)
+
+
+def _clear_record(rec):
+    """ Zero a (reused) record buffer.
+    """
+    memset(addressof(rec), 0, sizeof(rec))
+    return rec
+
+
 class _SequenceMixin(object):
+    #: The type of raw record read (``TIDE_RECORD`` or
+    #: ``TIDE_STATION_HEADER``.)
+    _record_class = _libtcd.TIDE_RECORD
+
     def __len__(self):          # pragma: NO COVER
         raise NotImplementedError()
 
-    def _get_record(self, i):   # pragma: NO COVER
+    def _get_record(self, i, buf=None):  # pragma: NO COVER
+        """ Read record ``i``.  Returns ``None`` if there is no such record.
+
+        If ``buf`` (an instance of :attr:`_record_class`) is given, the
+        record is read into it, otherwise a new record is allocated.
+
+        """
+        raise NotImplementedError()
+
+    def _get_next_record(self, buf=None):  # pragma: NO COVER
         raise NotImplementedError()
 
     def _unpack_record(self, rec):  # pragma: NO COVER
         raise NotImplementedError()
 
+    @contextmanager
+    def _reading(self):
+        """ Context manager for reading records.
+
+        This yields the object from which records should actually be
+        read: an object with the same ``_get_record``, ``_read_chunk``
+        and ``_iter_headers`` methods as ``self`` (usually ``self``
+        itself.)
+
+        """
+        with self:
+            yield self
+
     def __iter__(self):
-        try:
-            for i in count():
-                yield self[i]
-        except IndexError:
-            pass
+        return self.iter_records()
+
+    def iter_records(self, chunk_size=64):
+        """ Iterate sequentially over all the stations in the database.
+
+        Records are read in chunks of (at most) ``chunk_size``
+        records.  The global lock is acquired once per chunk and held
+        only while the raw records of that chunk are read from the
+        database; the records are unpacked after the lock is released.
+        Within a chunk, records are fetched using libtcd's sequential
+        ``read_next_tide_record`` (or ``get_next_partial_tide_record``),
+        rather than by random access.
+
+        The same ``chunk_size`` record buffers are reused for every
+        chunk.  (Each record is unpacked, which copies all the data
+        needed from it, before the next chunk is read.)
+
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        buffers = [self._record_class() for _ in range(chunk_size)]
+        start = 0
+        while True:
+            with self._reading() as reader:
+                records = reader._read_chunk(start, chunk_size, buffers)
+            for rec in records:
+                yield self._unpack_record(rec)
+            if len(records) < chunk_size:
+                break
+            start += len(records)
+
+    def _read_chunk(self, start, chunk_size, buffers=None):
+        # The caller must hold the lock.
+        #
+        # If given, records are read into ``buffers`` (a sequence of at
+        # least ``chunk_size`` records.)
+        #
+        # Note that each chunk starts with a random-access read, since
+        # unpacking subordinate stations (which reads their reference
+        # stations) moves libtcd's notion of the "current" record.
+        if buffers is None:
+            buffers = [None] * chunk_size
+        records = []
+        rec = self._get_record(start, buffers[0])
+        while rec is not None:
+            records.append(rec)
+            if len(records) >= chunk_size:
+                break
+            rec = self._get_next_record(buffers[len(records)])
+        return records
 
     def __getitem__(self, i):
         if i < 0:
             i += len(self)
-        with self:
-            rec = self._get_record(i)
+        with self._reading() as reader:
+            rec = reader._get_record(i)
         if rec is None:
             raise IndexError(i)
         return self._unpack_record(rec)
 
     def find(self, name):
-        bname = bytes_(name, _libtcd.ENCODING)
-        with self:
-            i = _libtcd.find_station(bname)
-            if i < 0:
-                raise KeyError(name)
-            rec = self._get_record(i)
-        return self._unpack_record(rec)
+        i = self._names.find(bytes_(name, _libtcd.ENCODING))
+        if i is None:
+            raise KeyError(name)
+        return self[i]
 
     def findall(self, name):
-        bname = bytes_(name, _libtcd.ENCODING)
-        with self:
-            records = self._find_recs(bname)
-        return map(self._unpack_record, records)
+        record_numbers = self._names.findall(bytes_(name, _libtcd.ENCODING))
+        return map(self.__getitem__, record_numbers)
 
-    def _find_recs(self, name):
-        _libtcd.search_station(b"")     # reset search (I hope)
-        matches = []
-        while True:
-            i = _libtcd.search_station(name)
-            if i < 0:
-                break
-            rec = self._get_record(i)
-            if rec.name == name:
-                matches.append(rec)
-        return matches
+    def nearest(self, latitude, longitude, k=1):
+        """ Find the ``k`` stations nearest to the given point.
+
+        Stations are returned in order of increasing (great-circle)
+        distance.
+
+        """
+        neighbors = self.spatial_index.nearest(latitude, longitude, k)
+        return [self[n.record_number] for n in neighbors]
+
+    def within_radius(self, latitude, longitude, distance):
+        """ Find all stations within ``distance`` kilometers of a point.
+
+        Stations are returned in order of increasing distance.
+
+        """
+        neighbors = self.spatial_index.within_radius(
+            latitude, longitude, distance)
+        return [self[n.record_number] for n in neighbors]
+
+    def within_bbox(self, south, west, north, east):
+        """ Find all stations within a latitude/longitude bounding box.
+
+        If ``west`` is greater than ``east``, the box is taken to cross
+        the antimeridian.  Stations are returned in record order.
+
+        """
+        return [self[i]
+                for i in self.spatial_index.within_bbox(
+                    south, west, north, east)]
 
     def index(self, station):
         if hasattr(station, 'reference_station'):
             record_type = _libtcd.SUBORDINATE_STATION
         else:
             record_type = _libtcd.REFERENCE_STATION
-        bname = station.name.encode(_libtcd.ENCODING)
+        bname = bytes_(station.name, _libtcd.ENCODING)
+        i = self._names.index(record_type, bname)
+        if i is None:
+            raise ValueError("Station %r not found" % station.name)
+        return i
 
-        with self:
-            records = self._find_recs(bname)
-        for rec in records:
-            if (rec.record_type, rec.name) == (record_type, bname):
-                return rec.record_number
-        raise ValueError("Station %r not found" % station.name)
 
+class _TcdBase(_SequenceMixin):
+    """ Behavior shared by the database implementations.
+
+    Subclasses must set ``_header`` (a ``DB_HEADER_PUBLIC``) and
+    ``constituents``, and must provide ``_iter_headers``, which iterates
+    over the ``TIDE_STATION_HEADER``\s of all records, and
+    ``_string_table_cache``, which returns a :class:`_StringTableCache`
+    for a given string table.
+
+    """
+    #: If true, stations are unpacked lazily: each attribute is decoded
+    #: from a copy of the raw record when it is first accessed.
+    lazy = False
+
+    def __len__(self):
+        return self._header.number_of_records
+
+    def _unpack_record(self, rec):
+        record_type = rec.record_type
+        if record_type == _libtcd.REFERENCE_STATION:
+            station_class = ReferenceStation
+        elif record_type == _libtcd.SUBORDINATE_STATION:
+            station_class = SubordinateStation
+        else:
+            raise InvalidTcdFile("Invalid record_type (%r)" % record_type)
+        return station_class._unpack(self, rec, self.lazy)
+
+    _name_index = None
+
+    #: The maximum number of unpacked reference stations (of each of
+    #: :class:`ReferenceStation` and :class:`ReferenceStationHeader`)
+    #: to cache for use by subordinate stations.
+    refstation_cache_size = 256
+
+    _refstation_caches = None
+
+    def _refstation_cache(self, refclass):
+        """ Get the cache of unpacked reference stations of type ``refclass``.
+
+        The cache maps record number to reference station.  Subordinate
+        stations which refer to the same reference station share the
+        same (cached) instance of it.
+
+        """
+        caches = self._refstation_caches
+        if caches is None:
+            caches = self.__dict__.setdefault('_refstation_caches', {})
+        cache = caches.get(refclass)
+        if cache is None:
+            # (setdefault, so that racing threads agree on the cache)
+            cache = caches.setdefault(
+                refclass, LRUCache(self.refstation_cache_size))
+        return cache
+
+    def _invalidate_refstations(self, i=None):
+        """ Discard cached reference station(s).
+
+        If ``i`` is ``None``, all cached reference stations are discarded,
+        otherwise only the one with record number ``i``.
+
+        """
+        for cache in (self._refstation_caches or {}).values():
+            if i is None:
+                cache.clear()
+            else:
+                cache.pop(i)
+
+    @property
+    def _names(self):
+        """ The name index for the database.
+
+        This is built (from a single pass over the record headers) when
+        first needed.  Thereafter it is kept up to date by
+        :meth:`append`, :meth:`__setitem__` and :meth:`__delitem__`.
+
+        """
+        if self._name_index is None:
+            with self._reading() as reader:
+                self._name_index = _NameIndex.from_headers(
+                    reader._iter_headers())
+        return self._name_index
+
+    _spatial_index = None
+
+    @property
+    def spatial_index(self):
+        """ A :class:`~libtcd.spatial.SpatialIndex` of station locations.
+
+        This is built from a single pass over the record headers when
+        first needed, and is discarded (to be rebuilt when next needed)
+        whenever the database is modified.
+
+        """
+        spatial_index = self._spatial_index
+        if spatial_index is None:
+            with self._reading() as reader:
+                locations = [
+                    (rec.record_number,) + _coordinates.unpack_coordinates(rec)
+                    for rec in reader._iter_headers()]
+            spatial_index = self._spatial_index = SpatialIndex(locations)
+        return spatial_index
+
+    _fingerprint_table = None
+
+    def fingerprints(self):
+        """ Get the content fingerprints of all the stations.
 
-class Tcd(_SequenceMixin):
+        Returns a list of fingerprints (``bytes``), indexed by record
+        number.  (See :mod:`libtcd.fingerprint`.)  The list is computed
+        in a single pass over the database when first needed, and is
+        discarded whenever the database is modified.
 
-    def __init__(self, filename, constituents):
+        """
+        table = self._fingerprint_table
+        if table is None:
+            from .fingerprint import fingerprint_table
+            table = self._fingerprint_table = fingerprint_table(self)
+        return table
+
+    def to_arrays(self, chunk_size=64):
+        """ Read the entire database into a set of numpy column arrays.
+
+        This requires numpy.  See :func:`libtcd.arrays.to_arrays` for
+        details.
+
+        """
+        from .arrays import to_arrays
+        return to_arrays(self, chunk_size)
+
+
+class Tcd(_TcdBase):
+
+    def __init__(self, filename, constituents, lazy=False):
+        """ Create a new database.
+
+        ``constituents`` is either an (ordered) mapping of names to
+        constituents, or :class:`ConstituentTables`.
+
+        """
         global _current_database
         packed_constituents = self._pack_constituents(constituents)
         self.filename = filename
+        self.lazy = lazy
         bfilename = bytes_(filename, _libtcd.ENCODING)
         with _lock:
             _current_database = None
             _libtcd.create_tide_db(bfilename, *packed_constituents)
             _current_database = self
             self._init()
+            self._name_index = _NameIndex()
 
     @classmethod
-    def open(cls, filename):
+    def open(cls, filename, lazy=False):
         self = cls.__new__(cls)
         self.filename = filename
+        self.lazy = lazy
         with self:
             self._init()
         return self
 
     def __enter__(self):
-        global _current_database
-        bfilename = bytes_(self.filename, _libtcd.ENCODING)
         _lock.acquire()
         try:
-            if _current_database != self:
-                _libtcd.open_tide_db(bfilename)
-                _current_database = self
+            self._make_current()
             return self
         except:
             _lock.release()
@@ -587,41 +1417,219 @@ class Tcd(_SequenceMixin):
     def __exit__(self, exc_typ, exc_val, exc_tb):
         _lock.release()
 
+    def _make_current(self):
+        # Make this the database which libtcd has open.
+        # The caller must hold the lock.
+        global _current_database, _reopen_count
+        if _current_database != self:
+            self._discard_snapshot()
+            bfilename = bytes_(self.filename, _libtcd.ENCODING)
+            _libtcd.open_tide_db(bfilename)
+            _current_database = self
+            _reopen_count += 1
+            self.reopen_count += 1
+            if self._string_tables is not None:
+                # The file may have been changed through another Tcd
+                self._load_string_tables(self)
+
     def close(self):
         global _current_database
         with _lock:
+            self._discard_snapshot()
             if _current_database == self:
                 _libtcd.close_tide_db()
                 _current_database = None
 
+    #: The number of times libtcd has (re)opened this database.
+    reopen_count = 0
+
+    #: Whether to read from a snapshot when the database is not the one
+    #: which libtcd currently has open.  (See :meth:`_reading`.)
+    use_snapshots = True
+
+    _snapshot = None
+    _snapshot_signature = None
+
+    @contextmanager
+    def _reading(self):
+        """ Context manager for reading records.
+
+        If libtcd currently has some other database open, reopening
+        this one would mean re-parsing its entire header and string
+        tables.  Instead, records are read from a snapshot: a
+        :class:`~libtcd.tcdfile.MmapTcd` of the file.  This is safe
+        since, when libtcd does not have the database open, the file on
+        disk is complete and up to date.  (libtcd closes the current
+        database whenever it opens another.)  No snapshot is used if
+        libtcd has the same file open through another :class:`Tcd`.
+
+        The snapshot is discarded whenever libtcd reopens the database,
+        and is rebuilt if the file changes.  The global lock is held
+        while reading, whether or not a snapshot is used.
+
+        """
+        with _lock:
+            reader = None
+            if (_current_database != self
+                    and not self._is_same_file(_current_database)):
+                reader = self._get_snapshot()
+            if reader is None:
+                self._make_current()
+                reader = self
+            yield reader
+
+    def _is_same_file(self, other):
+        # If libtcd has the same file open through another Tcd instance,
+        # the file on disk may be incomplete.
+        return other is not None and other._realpath == self._realpath
+
+    @reify
+    def _realpath(self):
+        return os.path.realpath(self.filename)
+
+    def _get_snapshot(self):
+        # The caller must hold the lock.
+        if not self.use_snapshots:
+            return None
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            self._discard_snapshot()
+            return None
+        signature = (st.st_ino, st.st_size, st.st_mtime)
+        if self._snapshot_signature != signature:
+            self._discard_snapshot()
+            from .tcdfile import MmapTcd
+            try:
+                self._snapshot = MmapTcd(self.filename)
+            except (EnvironmentError, InvalidTcdFile):
+                return None
+            self._snapshot_signature = signature
+            if self._string_tables is not None:
+                # The file may have been changed through another Tcd
+                self._load_string_tables(self._snapshot)
+        return self._snapshot
+
+    def _discard_snapshot(self):
+        # The caller must hold the lock.
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self._snapshot = self._snapshot_signature = None
+            snapshot.close()
+
+    _string_tables = None
+
+    def _string_table_cache(self, table_name):
+        """ Get the Python-side copy of a string table.
+
+        The string tables are copied (from libtcd, or from a snapshot)
+        when first needed, and are kept up to date as entries are
+        added.  Stations are packed and unpacked using the copies,
+        rather than calling libtcd for every field.
+
+        """
+        return self._get_string_tables()[table_name]
+
+    def _get_string_tables(self):
+        tables = self._string_tables
+        if tables is None:
+            with self._reading() as reader:
+                tables = self._load_string_tables(reader)
+        return tables
+
+    def _load_string_tables(self, reader):
+        # The caller must hold the lock.
+        if reader is self:
+            header = _libtcd.get_tide_db_header()
+        tables = {}
+        for table_name, size_field in _STRING_TABLE_SIZES.items():
+            if reader is self:
+                getter = getattr(_libtcd, 'get_' + table_name)
+                texts = (text_type(getter(i), _libtcd.ENCODING)
+                         for i in range(getattr(header, size_field)))
+            else:
+                texts = reader._string_table_cache(table_name).texts
+            tables[table_name] = _StringTableCache(texts)
+        self._string_tables = tables
+        return tables
+
+    def _find_or_add_string(self, table_name, text, finder):
+        """ Find the index of a string table entry.
+
+        If ``text`` is not in the table, ``finder`` (the libtcd
+        ``find_<table_name>`` or ``find_or_add_<table_name>`` function)
+        is called to add it.  Returns -1 if it is not found (and not
+        added.)
+
+        """
+        i = self._string_table_cache(table_name).find(text)
+        if i < 0:
+            with self:
+                i = self._add_string(table_name, text, finder)
+        return i
+
+    def _add_string(self, table_name, text, finder):
+        # The caller must hold the lock.
+        table = self._string_tables[table_name]
+        i = table.find(text)
+        if i < 0:
+            i = finder(bytes_(text, _libtcd.ENCODING))
+            if i >= 0:
+                # Cache the text as stored (libtcd may truncate it)
+                stored = getattr(_libtcd, 'get_' + table_name)(i)
+                table.add(i, text_type(stored, _libtcd.ENCODING), text)
+        return i
+
     @property
     def headers(self):
         return TcdHeaders(self)
 
-    def __len__(self):
-        return self._header.number_of_records
+    def _get_record(self, i, buf=None):
+        if buf is None:
+            return _libtcd.read_tide_record(i)
+        return _libtcd.read_tide_record_into(i, _clear_record(buf))
 
-    def _get_record(self, i):
-        return _libtcd.read_tide_record(i)
+    def _get_next_record(self, buf=None):
+        if buf is None:
+            return _libtcd.read_next_tide_record()
+        return _libtcd.read_next_tide_record_into(_clear_record(buf))
 
-    def _unpack_record(self, rec):
-        record_type = rec.record_type
-        if record_type == _libtcd.REFERENCE_STATION:
-            station_class = ReferenceStation
-        elif record_type == _libtcd.SUBORDINATE_STATION:
-            station_class = SubordinateStation
-        else:
-            raise InvalidTcdFile("Invalid record_type (%r)" % record_type)
-        return station_class._unpack(self, rec)
+    @staticmethod
+    def _iter_headers():
+        # The caller must hold the lock.
+        #
+        # A single header buffer is reused: each header is only valid
+        # until the next is read.
+        buf = _libtcd.TIDE_STATION_HEADER()
+        rec = _libtcd.get_partial_tide_record_into(0, buf)
+        while rec is not None:
+            yield rec
+            rec = _libtcd.get_next_partial_tide_record_into(
+                _clear_record(buf))
 
     def __setitem__(self, i, station):
         rec = station._pack(self)
         with self:
             _libtcd.update_tide_record(i, rec, self._header)
+            self._invalidate_refstations(i)
+            self._spatial_index = self._fingerprint_table = None
+            if self._name_index is not None:
+                self._name_index.replace(i, rec.record_type, rec.name)
 
     def __delitem__(self, i):
         with self:
             _libtcd.delete_tide_record(i, self._header)
+            self._invalidate_refstations()
+            self._spatial_index = self._fingerprint_table = None
+            names = self._name_index
+            if names is not None:
+                record_type, name = names.keys[i]
+                if record_type == _libtcd.SUBORDINATE_STATION:
+                    names.delete(i)
+                else:
+                    # Deleting a reference station also deletes its
+                    # subordinate stations.  Rebuild the index lazily.
+                    self._name_index = None
 
     def append(self, station):
         """ Append station to database.
@@ -632,8 +1640,84 @@ class Tcd(_SequenceMixin):
         rec = station._pack(self)
         with self:
             _libtcd.add_tide_record(rec, self._header)
+            if self._name_index is not None:
+                self._name_index.append(rec.record_type, rec.name)
+            self._spatial_index = self._fingerprint_table = None
             return self._header.number_of_records - 1
 
+    def extend(self, stations):
+        """ Append stations to the database, in bulk.
+
+        This is equivalent to, but much faster than, appending the
+        stations one at a time.  The reference stations of subordinate
+        stations are resolved by identity if they are included in
+        ``stations`` (in any order), otherwise by name.  Those which
+        are not found are appended ahead of ``stations``.  All string
+        table entries are resolved once, and the lock is held for the
+        whole batch.
+
+        Returns a list of the record numbers assigned to ``stations``.
+
+        """
+        stations = list(stations)
+        names = self._names
+        self._get_string_tables()
+        # Subordinate station reference targets: id(refstation) ->
+        # record number, or a reference station in the batch
+        targets = dict((id(station), station) for station in stations
+                       if isinstance(station, ReferenceStation))
+        missing = OrderedDict()         # name -> refstation
+        for station in stations:
+            if not isinstance(station, SubordinateStation):
+                continue
+            refstation = station.reference_station
+            if id(refstation) in targets:
+                continue
+            if not isinstance(refstation, ReferenceStation):
+                raise TypeError("%r is not a ReferenceStation" % refstation)
+            bname = bytes_(refstation.name, _libtcd.ENCODING)
+            i = names.index(_libtcd.REFERENCE_STATION, bname)
+            if i is None:
+                i = missing.setdefault(bname, refstation)
+            targets[id(refstation)] = i
+        batch = list(missing.values()) + stations
+
+        with self:
+            start = self._header.number_of_records
+            numbers = dict((id(station), start + n)
+                           for n, station in enumerate(batch))
+            refstation_numbers = dict(
+                (key, numbers[id(target)]
+                 if isinstance(target, ReferenceStation) else target)
+                for key, target in targets.items())
+
+            for table_name, text, finder in self._batch_strings(batch):
+                if self._add_string(table_name, text, finder) < 0:
+                    raise ValueError(text)
+
+            packer = _BatchPacker(self, refstation_numbers)
+            records = [station._pack(packer) for station in batch]
+            for rec in records:
+                _libtcd.add_tide_record(rec, self._header)
+                if self._name_index is not None:
+                    self._name_index.append(rec.record_type, rec.name)
+            self._spatial_index = self._fingerprint_table = None
+        return list(range(start + len(missing), start + len(batch)))
+
+    @staticmethod
+    def _batch_strings(stations):
+        # The distinct string table entries used by stations:
+        # (table_name, text, finder) triples
+        seen = set()
+        for station in stations:
+            for descriptor in type(station)._PACKED_ATTRS:
+                if isinstance(descriptor, _string_table):
+                    text = getattr(station, descriptor.name)
+                    key = descriptor.table_name, text
+                    if text is not None and key not in seen:
+                        seen.add(key)
+                        yield descriptor.table_name, text, descriptor.finder
+
     def dump_tide_record(self, i):
         """ Dump tide record to stderr (Debugging only.)
         """
@@ -646,53 +1730,104 @@ class Tcd(_SequenceMixin):
     def _init(self):
         self._header = _libtcd.get_tide_db_header()
         self.constituents = self._read_constituents()
+        self._load_string_tables(self)
 
     @staticmethod
     def _pack_constituents(constituents):
-        start_year = max(map(attrgetter('node_factors.start_year'),
-                             constituents.values()))
-        end_year = min(map(attrgetter('node_factors.end_year'),
-                           constituents.values()))
-        num_years = end_year - start_year
+        if isinstance(constituents, ConstituentTables):
+            tables = constituents
+        else:
+            tables = ConstituentTables.from_constituents(constituents)
+        n = len(tables)
+        num_years = tables.number_of_years
         if num_years < 1:
             raise ValueError("num_years is zero")
 
-        n = len(constituents)
-        names = (c_char_p * n)()
-        speeds = (_libtcd.c_float64 * n)()
-        equilibriums = (POINTER(_libtcd.c_float32) * n)()
-        node_factors = (POINTER(_libtcd.c_float32) * n)()
+        # The rows of the tables are passed to libtcd in place
+        row_type = _libtcd.c_float32 * num_years
+        row_size = sizeof(row_type)
 
-        for i, c in enumerate(constituents.values()):
-            names[i] = bytes_(c.name, _libtcd.ENCODING)
-            speeds[i] = c.speed
-            equilibriums[i] = eqs = (_libtcd.c_float32 * num_years)()
-            node_factors[i] = nfs = (_libtcd.c_float32 * num_years)()
-            for j in range(num_years):
-                eqs[j], nfs[j] = c.node_factors[start_year + j]
+        def row_pointers(table):
+            table = _ctypes_table(_libtcd.c_float32, table)
+            return (POINTER(_libtcd.c_float32) * n)(*[
+                row_type.from_buffer(table, i * row_size) for i in range(n)])
 
-        return (n, names, speeds,
-                start_year, num_years, equilibriums, node_factors)
+        names = (c_char_p * n)(*[bytes_(name, _libtcd.ENCODING)
+                                 for name in tables.names])
+        speeds = _ctypes_table(_libtcd.c_float64, tables.speeds)
+        return (n, names, speeds, tables.start_year, num_years,
+                row_pointers(tables.equilibriums),
+                row_pointers(tables.node_factors))
+
+    #: The :class:`ConstituentTables` of the database.
+    constituent_tables = None
 
     def _read_constituents(self):
-        start_year = self._header.start_year
-        number_of_years = self._header.number_of_years
-        constituents = OrderedDict()
-        for i in range(self._header.constituents):
-            name = text_type(_libtcd.get_constituent(i), _libtcd.ENCODING)
-            if name in constituents:
-                raise InvalidTcdFile("duplicate constituent name (%r)" % name)
-            speed = _libtcd.get_speed(i)
-            factors = (NodeFactor(eq, nf)
-                       for eq, nf in zip(_libtcd.get_equilibriums(i),
-                                         _libtcd.get_node_factors(i)))
-            factors = list(islice(factors, number_of_years))
-            node_factors = NodeFactors(start_year, factors)
-            constituents[name] = Constituent(name, speed, node_factors)
-        return constituents
+        self.constituent_tables = self._read_constituent_tables()
+        return self.constituent_tables.constituents()
+
+    def _read_constituent_tables(self):
+        # The tables for all constituents are copied from libtcd with
+        # one memmove per constituent and table.
+        n = self._header.constituents
+        years = self._header.number_of_years
+        names = [text_type(_libtcd.get_constituent(i), _libtcd.ENCODING)
+                 for i in range(n)]
+        speeds = array('d', [_libtcd.get_speed(i) for i in range(n)])
+        equilibriums = array('f', [0.0]) * (n * years)
+        node_factors = array('f', [0.0]) * (n * years)
+        for i in range(n):
+            _copy_floats(equilibriums, i * years,
+                         _libtcd.get_equilibriums(i), years)
+            _copy_floats(node_factors, i * years,
+                         _libtcd.get_node_factors(i), years)
+        return ConstituentTables(names, speeds, self._header.start_year,
+                                 years, equilibriums, node_factors)
+
+
+def _copy_floats(table, offset, values, n):
+    """ Copy ``n`` floats into ``table`` (an ``array('f')``) at ``offset``.
+
+    ``values`` is a ``POINTER(c_float32)``, or any iterable.
+
+    """
+    if isinstance(values, POINTER(_libtcd.c_float32)):
+        if not values:
+            raise InvalidTcdFile("Missing constituent table")
+        address, length = table.buffer_info()
+        assert offset + n <= length
+        memmove(address + offset * table.itemsize, values, n * table.itemsize)
+    else:
+        table[offset:offset + n] = array('f', islice(values, n))
+
+
+class _BatchPacker(object):
+    """ Stands in for a :class:`Tcd` while packing stations in bulk.
+
+    Reference stations are looked up in ``refstation_numbers`` (which
+    maps ``id(refstation)`` to record number), and string table entries
+    must already be in the string table caches.  Packing therefore does
+    not need to acquire the lock.
+
+    """
+    def __init__(self, tcd, refstation_numbers):
+        self.constituents = tcd.constituents
+        self._string_tables = tcd._string_tables
+        self.refstation_numbers = refstation_numbers
+
+    def _string_table_cache(self, table_name):
+        return self._string_tables[table_name]
+
+    def _find_or_add_string(self, table_name, text, finder):
+        return self._string_tables[table_name].find(text)
+
+    def index(self, refstation):
+        return self.refstation_numbers[id(refstation)]
 
 
 class TcdHeaders(_SequenceMixin):
+    _record_class = _libtcd.TIDE_STATION_HEADER
+
     def __init__(self, tcd):
         self.tcd = tcd
 
@@ -702,11 +1837,31 @@ class TcdHeaders(_SequenceMixin):
     def __exit__(self, exc_typ, exc_val, exc_tb):
         self.tcd.__exit__(exc_typ, exc_val, exc_tb)
 
+    @contextmanager
+    def _reading(self):
+        with self.tcd._reading() as reader:
+            yield self if reader is self.tcd else reader.headers
+
     def __len__(self):
         return len(self.tcd)
 
-    def _get_record(self, i):
-        return _libtcd.get_partial_tide_record(i)
+    @property
+    def _names(self):
+        return self.tcd._names
+
+    @property
+    def spatial_index(self):
+        return self.tcd.spatial_index
+
+    def _get_record(self, i, buf=None):
+        if buf is None:
+            return _libtcd.get_partial_tide_record(i)
+        return _libtcd.get_partial_tide_record_into(i, _clear_record(buf))
+
+    def _get_next_record(self, buf=None):
+        if buf is None:
+            return _libtcd.get_next_partial_tide_record()
+        return _libtcd.get_next_partial_tide_record_into(_clear_record(buf))
 
     def _unpack_record(self, rec):
         record_type = rec.record_type
@@ -716,4 +1871,4 @@ class TcdHeaders(_SequenceMixin):
             station_class = SubordinateStationHeader
         else:
             raise InvalidTcdFile("Invalid record_type (%r)" % record_type)
-        return station_class._unpack(self.tcd, rec)
+        return station_class._unpack(self.tcd, rec, self.tcd.lazy)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+""" Columnar access to TCD databases, using numpy.
+
+This module requires numpy.
+
+"""
+from __future__ import absolute_import
+
+from ctypes import Array, addressof, c_char, memmove, sizeof
+
+import numpy
+
+from . import _libtcd
+from .compat import OrderedDict
+
+# TIDE_RECORD fields which are not exported as columns.  (The monologue
+# fields are large and rarely of interest in columnar form.)
+_SKIPPED_FIELDS = frozenset(['record_size', 'comments', 'notes', 'xfields'])
+
+
+def _field_dtypes(struct, base_offset=0):
+    anonymous = getattr(struct, '_anonymous_', ())
+    for name, ctype in struct._fields_:
+        offset = base_offset + getattr(struct, name).offset
+        if name in anonymous:
+            for field in _field_dtypes(ctype, offset):
+                yield field
+        elif name in _SKIPPED_FIELDS:
+            continue
+        elif issubclass(ctype, Array) and ctype._type_ is c_char:
+            yield name, numpy.dtype('S%d' % ctype._length_), offset
+        elif issubclass(ctype, Array):
+            dtype = numpy.dtype((numpy.dtype(ctype._type_), ctype._length_))
+            yield name, dtype, offset
+        else:
+            yield name, numpy.dtype(ctype), offset
+
+
+def _record_dtype(struct):
+    """ Compute a numpy structured dtype matching the layout of a
+    ctypes structure.
+    """
+    names, formats, offsets = zip(*_field_dtypes(struct))
+    return numpy.dtype({
+        'names': list(names),
+        'formats': list(formats),
+        'offsets': list(offsets),
+        'itemsize': sizeof(struct),
+        })
+
+#: A numpy structured dtype which overlays :class:`_libtcd.TIDE_RECORD`
+TIDE_RECORD_DTYPE = _record_dtype(_libtcd.TIDE_RECORD)
+
+_COEFFICIENT_FIELDS = ('amplitude', 'epoch')
+
+
+def to_arrays(tcd, chunk_size=64):
+    """ Read all the records of a database into column arrays.
+
+    Returns an ordered dict mapping field name to a numpy array with one
+    entry per record.  The columns hold the raw (packed) values of the
+    scalar ``TIDE_RECORD`` fields: string-table fields hold string
+    table indexes, dates are packed as ``YYYYMMDD`` integers, time
+    offsets as ``[-]HHMM`` integers, and so on.  Character fields
+    (e.g. ``name``) are byte strings, in :data:`_libtcd.ENCODING`.
+    The ``comments``, ``notes`` and ``xfields`` fields are not
+    included.
+
+    The ``amplitude`` and ``epoch`` columns are dense ``N x C``
+    ``float32`` matrices, where ``C`` is the number of constituents in
+    the database.
+
+    The database is read in a single sequential pass, ``chunk_size``
+    records at a time, directly into a reused numpy buffer.  No station
+    objects are constructed.
+
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    n = len(tcd)
+    n_constituents = len(tcd.constituents)
+
+    columns = OrderedDict()
+    for name in TIDE_RECORD_DTYPE.names:
+        dtype, offset = TIDE_RECORD_DTYPE.fields[name]
+        if name in _COEFFICIENT_FIELDS:
+            columns[name] = numpy.zeros((n, n_constituents), dtype.base)
+        else:
+            columns[name] = numpy.zeros(n, dtype)
+
+    chunk = numpy.zeros(chunk_size, TIDE_RECORD_DTYPE)
+    chunk_address = chunk.ctypes.data
+    itemsize = TIDE_RECORD_DTYPE.itemsize
+    # TIDE_RECORDs overlaying the chunk, so records are read in place
+    buffers = [_libtcd.TIDE_RECORD.from_buffer(chunk, j * itemsize)
+               for j in range(chunk_size)]
+    start = 0
+    while start < n:
+        with tcd._reading() as reader:
+            records = reader._read_chunk(
+                start, min(chunk_size, n - start), buffers)
+        if not records:
+            break
+        for j, rec in enumerate(records):
+            address = chunk_address + j * itemsize
+            if addressof(rec) != address:
+                memmove(address, addressof(rec), itemsize)
+        stop = start + len(records)
+        for name, column in columns.items():
+            values = chunk[name][:len(records)]
+            if name in _COEFFICIENT_FIELDS:
+                values = values[:, :n_constituents]
+            column[start:stop] = values
+        start = stop
+
+    if start < n:
+        for name in columns:
+            columns[name] = columns[name][:start]
+    return columns
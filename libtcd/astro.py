@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+""" Equilibrium arguments and node factors of tidal constituents.
+
+The equilibrium argument (``V0 + u``) and node factor (``f``) of each
+constituent are computed from the astronomical arguments, following
+Schureman's *Manual of Harmonic Analysis and Prediction of Tides*
+(1958).  These are the formulas used to generate the yearly tables in
+the harmonics files distributed with XTide, whose convention is
+followed by :func:`year_tables`: ``V0`` is computed for the start of
+each year (UTC), ``u`` and ``f`` for the middle of the year.
+
+The functions here are vectorized.  They are used to extend the yearly
+tables of a database beyond its range of years (see
+:func:`extend_constituents`), and can also compute the equilibrium
+arguments and node factors at any time, not just per year.
+
+Only the constituents in :data:`CONSTITUENTS` are supported: the basic
+constituents of Schureman's tables, and the compound (shallow water)
+constituents formed from them.
+
+This module requires numpy.
+
+"""
+from __future__ import absolute_import
+
+import warnings
+
+import numpy
+from six.moves import range
+
+from .api import Constituent, ConstituentTables, NodeFactors
+from .compat import OrderedDict
+from .predict import as_seconds
+
+# The astronomical arguments are the hour angle of the mean sun (T), and
+# the mean longitudes of the moon (s), the sun (h), the lunar perigee
+# (p), the moon's ascending node (N) and the solar perigee (p1).  Those
+# other than T are polynomials (Schureman's Table 1) in the number of
+# days (and Julian centuries) since 1900 January 0.5 (GMT).
+_EPOCH_DAYS = 25567.5           # days from then to 1970-01-01T00:00Z
+_POLYNOMIALS = numpy.array([
+    # s
+    [270.434164, 13.1763965268, -0.0000850, 0.000000039],
+    # h
+    [279.696678, 0.9856473354, 0.00002267, 0.0],
+    # p
+    [334.329556, 0.1114040803, -0.0103250, -0.000012],
+    # N
+    [259.183275, -0.0529539222, 0.0020778, 0.000002],
+    # p1
+    [281.220844, 0.0000470684, 0.0004530, 0.000003],
+    ])
+
+#: The rates of change of the astronomical arguments, in degrees per hour.
+ARGUMENT_SPEEDS = numpy.concatenate([[15.0], _POLYNOMIALS[:, 1] / 24.0])
+
+_INCLINATION = numpy.radians(5.145)     # of the moon's orbit to the ecliptic
+_OBLIQUITY = numpy.radians(23.452)      # of the ecliptic
+
+# The formulas for the nodal corrections (u and f)
+_NODAL_FORMULAS = (None, 'Mm', 'Mf', 'O1', 'M1', 'J1', 'OO1', 'K1',
+                   'M2', 'K2', 'L2', 'M3')
+
+# The basic constituents: name, coefficients of (T, s, h, p, p1) in V,
+# a constant phase (degrees), and the formula for the nodal corrections.
+_BASIC_CONSTITUENTS = (
+    ('SA', (0, 0, 1, 0, 0), 0, None),
+    ('SSA', (0, 0, 2, 0, 0), 0, None),
+    ('MSM', (0, 1, -2, 1, 0), 0, 'Mm'),
+    ('MM', (0, 1, 0, -1, 0), 0, 'Mm'),
+    ('MF', (0, 2, 0, 0, 0), 0, 'Mf'),
+    ('2Q1', (1, -4, 1, 2, 0), 90, 'O1'),
+    ('SIG1', (1, -4, 3, 0, 0), 90, 'O1'),
+    ('Q1', (1, -3, 1, 1, 0), 90, 'O1'),
+    ('RHO1', (1, -3, 3, -1, 0), 90, 'O1'),
+    ('O1', (1, -2, 1, 0, 0), 90, 'O1'),
+    ('M1', (1, -1, 1, 0, 0), -90, 'M1'),
+    ('CHI1', (1, -1, 3, -1, 0), -90, 'J1'),
+    ('PI1', (1, 0, -2, 0, 1), 90, None),
+    ('P1', (1, 0, -1, 0, 0), 90, None),
+    ('S1', (1, 0, 0, 0, 0), 0, None),
+    ('K1', (1, 0, 1, 0, 0), -90, 'K1'),
+    ('PSI1', (1, 0, 2, 0, -1), -90, None),
+    ('PHI1', (1, 0, 3, 0, 0), -90, None),
+    ('THE1', (1, 1, -1, 1, 0), -90, 'J1'),
+    ('J1', (1, 1, 1, -1, 0), -90, 'J1'),
+    ('SO1', (1, 2, -1, 0, 0), -90, 'J1'),
+    ('OO1', (1, 2, 1, 0, 0), -90, 'OO1'),
+    ('2N2', (2, -4, 2, 2, 0), 0, 'M2'),
+    ('MU2', (2, -4, 4, 0, 0), 0, 'M2'),
+    ('N2', (2, -3, 2, 1, 0), 0, 'M2'),
+    ('NU2', (2, -3, 4, -1, 0), 0, 'M2'),
+    ('M2', (2, -2, 2, 0, 0), 0, 'M2'),
+    ('LDA2', (2, -1, 0, 1, 0), 180, 'M2'),
+    ('L2', (2, -1, 2, -1, 0), 180, 'L2'),
+    ('T2', (2, 0, -1, 0, 1), 0, None),
+    ('S2', (2, 0, 0, 0, 0), 0, None),
+    ('R2', (2, 0, 1, 0, -1), 180, None),
+    ('K2', (2, 0, 2, 0, 0), 0, 'K2'),
+    ('M3', (3, -3, 3, 0, 0), 0, 'M3'),
+    ('S3', (3, 0, 0, 0, 0), 0, None),
+    )
+
+# The compound constituents, as combinations of the basic constituents.
+# The V and u of a compound constituent are the (weighted) sums of those
+# of its components, its f is the product of theirs.
+_COMPOUND_CONSTITUENTS = (
+    ('M4', ((2, 'M2'),)),
+    ('M6', ((3, 'M2'),)),
+    ('M8', ((4, 'M2'),)),
+    ('S4', ((2, 'S2'),)),
+    ('S6', ((3, 'S2'),)),
+    ('MK3', ((1, 'M2'), (1, 'K1'))),
+    ('2MK3', ((2, 'M2'), (-1, 'K1'))),
+    ('MN4', ((1, 'M2'), (1, 'N2'))),
+    ('MS4', ((1, 'M2'), (1, 'S2'))),
+    ('2SM2', ((2, 'S2'), (-1, 'M2'))),
+    ('MSF', ((1, 'S2'), (-1, 'M2'))),
+    ('2MK5', ((2, 'M2'), (1, 'K1'))),
+    ('2MK6', ((2, 'M2'), (1, 'K2'))),
+    ('2MN2', ((2, 'M2'), (-1, 'N2'))),
+    ('2MN6', ((2, 'M2'), (1, 'N2'))),
+    ('2MS6', ((2, 'M2'), (1, 'S2'))),
+    ('2NM6', ((2, 'N2'), (1, 'M2'))),
+    ('2SK5', ((2, 'S2'), (1, 'K1'))),
+    ('2SM6', ((2, 'S2'), (1, 'M2'))),
+    ('3MK7', ((3, 'M2'), (1, 'K1'))),
+    ('3MN8', ((3, 'M2'), (1, 'N2'))),
+    ('3MS2', ((3, 'M2'), (-2, 'S2'))),
+    ('3MS4', ((3, 'M2'), (-1, 'S2'))),
+    ('3MS8', ((3, 'M2'), (1, 'S2'))),
+    ('M10', ((5, 'M2'),)),
+    ('M12', ((6, 'M2'),)),
+    ('MK4', ((1, 'M2'), (1, 'K2'))),
+    ('MKS2', ((1, 'M2'), (1, 'K2'), (-1, 'S2'))),
+    ('MNS2', ((1, 'M2'), (1, 'N2'), (-1, 'S2'))),
+    ('MO3', ((1, 'M2'), (1, 'O1'))),
+    ('MSK6', ((1, 'M2'), (1, 'S2'), (1, 'K2'))),
+    ('MSN2', ((1, 'M2'), (1, 'S2'), (-1, 'N2'))),
+    ('MSN6', ((1, 'M2'), (1, 'S2'), (1, 'N2'))),
+    ('NLK2', ((1, 'N2'), (1, 'L2'), (-1, 'K2'))),
+    ('NO1', ((1, 'N2'), (-1, 'O1'))),
+    ('OP2', ((1, 'O1'), (1, 'P1'))),
+    ('KP1', ((1, 'K2'), (-1, 'P1'))),
+    ('SK3', ((1, 'S2'), (1, 'K1'))),
+    ('SK4', ((1, 'S2'), (1, 'K2'))),
+    ('SN4', ((1, 'S2'), (1, 'N2'))),
+    ('SNK6', ((1, 'S2'), (1, 'N2'), (1, 'K2'))),
+    ('SO3', ((1, 'S2'), (1, 'O1'))),
+    ('2PO1', ((2, 'P1'), (-1, 'O1'))),
+    ('2NS2', ((2, 'N2'), (-1, 'S2'))),
+    ('MLN2S2', ((1, 'M2'), (1, 'L2'), (1, 'N2'), (-2, 'S2'))),
+    ('2ML2S2', ((2, 'M2'), (1, 'L2'), (-2, 'S2'))),
+    ('SKM2', ((1, 'S2'), (1, 'K2'), (-1, 'M2'))),
+    ('2MS2K2', ((2, 'M2'), (1, 'S2'), (-2, 'K2'))),
+    ('MKL2S2', ((1, 'M2'), (1, 'K2'), (1, 'L2'), (-2, 'S2'))),
+    ('M2(KS)2', ((1, 'M2'), (2, 'K2'), (-2, 'S2'))),
+    ('2SN(MK)2', ((2, 'S2'), (1, 'N2'), (-1, 'M2'), (-1, 'K2'))),
+    ('2KM(SN)2', ((2, 'K2'), (1, 'M2'), (-1, 'S2'), (-1, 'N2'))),
+    ('NO3', ((1, 'N2'), (1, 'O1'))),
+    ('2MLS4', ((2, 'M2'), (1, 'L2'), (-1, 'S2'))),
+    ('ML4', ((1, 'M2'), (1, 'L2'))),
+    ('N4', ((2, 'N2'),)),
+    ('SL4', ((1, 'S2'), (1, 'L2'))),
+    ('MNO5', ((1, 'M2'), (1, 'N2'), (1, 'O1'))),
+    ('2MO5', ((2, 'M2'), (1, 'O1'))),
+    ('MSK5', ((1, 'M2'), (1, 'S2'), (1, 'K1'))),
+    ('3KM5', ((3, 'K1'), (1, 'M2'))),
+    ('2MP5', ((2, 'M2'), (1, 'P1'))),
+    ('3MP5', ((3, 'M2'), (-1, 'P1'))),
+    ('MNK5', ((1, 'M2'), (1, 'N2'), (1, 'K1'))),
+    ('2NMLS6', ((2, 'N2'), (1, 'M2'), (1, 'L2'), (-1, 'S2'))),
+    ('MSL6', ((1, 'M2'), (1, 'S2'), (1, 'L2'))),
+    ('2ML6', ((2, 'M2'), (1, 'L2'))),
+    ('2MNLS6', ((2, 'M2'), (1, 'N2'), (1, 'L2'), (-1, 'S2'))),
+    ('3MLS6', ((3, 'M2'), (1, 'L2'), (-1, 'S2'))),
+    ('2MNO7', ((2, 'M2'), (1, 'N2'), (1, 'O1'))),
+    ('2NMK7', ((2, 'N2'), (1, 'M2'), (1, 'K1'))),
+    ('2MSO7', ((2, 'M2'), (1, 'S2'), (1, 'O1'))),
+    ('MSKO7', ((1, 'M2'), (1, 'S2'), (1, 'K2'), (1, 'O1'))),
+    ('2MSN8', ((2, 'M2'), (1, 'S2'), (1, 'N2'))),
+    ('2(MS)8', ((2, 'M2'), (2, 'S2'))),
+    ('2(MN)8', ((2, 'M2'), (2, 'N2'))),
+    ('2MSL8', ((2, 'M2'), (1, 'S2'), (1, 'L2'))),
+    ('4MLS8', ((4, 'M2'), (1, 'L2'), (-1, 'S2'))),
+    ('3ML8', ((3, 'M2'), (1, 'L2'))),
+    ('3MK8', ((3, 'M2'), (1, 'K2'))),
+    ('2MSK8', ((2, 'M2'), (1, 'S2'), (1, 'K2'))),
+    ('2M2NK9', ((2, 'M2'), (2, 'N2'), (1, 'K1'))),
+    ('3MNK9', ((3, 'M2'), (1, 'N2'), (1, 'K1'))),
+    ('4MK9', ((4, 'M2'), (1, 'K1'))),
+    ('3MSK9', ((3, 'M2'), (1, 'S2'), (1, 'K1'))),
+    ('4MN10', ((4, 'M2'), (1, 'N2'))),
+    ('3MNS10', ((3, 'M2'), (1, 'N2'), (1, 'S2'))),
+    ('4MS10', ((4, 'M2'), (1, 'S2'))),
+    ('3MSL10', ((3, 'M2'), (1, 'S2'), (1, 'L2'))),
+    ('3M2S10', ((3, 'M2'), (2, 'S2'))),
+    ('4MSK11', ((4, 'M2'), (1, 'S2'), (1, 'K1'))),
+    ('4MNS12', ((4, 'M2'), (1, 'N2'), (1, 'S2'))),
+    ('5MS12', ((5, 'M2'), (1, 'S2'))),
+    ('4MSL12', ((4, 'M2'), (1, 'S2'), (1, 'L2'))),
+    ('4M2S12', ((4, 'M2'), (2, 'S2'))),
+    ('3MKS2', ((3, 'M2'), (-1, 'K2'), (-1, 'S2'))),
+    ('MSK2', ((1, 'M2'), (1, 'S2'), (-1, 'K2'))),
+    ('2MP3', ((2, 'M2'), (-1, 'P1'))),
+    ('4MS4', ((4, 'M2'), (-2, 'S2'))),
+    ('2MNS4', ((2, 'M2'), (1, 'N2'), (-1, 'S2'))),
+    ('2MSK4', ((2, 'M2'), (1, 'S2'), (-1, 'K2'))),
+    ('3MN4', ((3, 'M2'), (-1, 'N2'))),
+    ('2MSN4', ((2, 'M2'), (1, 'S2'), (-1, 'N2'))),
+    ('3MK5', ((3, 'M2'), (-1, 'K1'))),
+    ('3MO5', ((3, 'M2'), (-1, 'O1'))),
+    ('3MNS6', ((3, 'M2'), (1, 'N2'), (-1, 'S2'))),
+    ('4MS6', ((4, 'M2'), (-1, 'S2'))),
+    ('2MNU6', ((2, 'M2'), (1, 'NU2'))),
+    ('3MSK6', ((3, 'M2'), (1, 'S2'), (-1, 'K2'))),
+    ('MKNU6', ((1, 'M2'), (1, 'K2'), (1, 'NU2'))),
+    ('3MSN6', ((3, 'M2'), (1, 'S2'), (-1, 'N2'))),
+    ('2MNK8', ((2, 'M2'), (1, 'N2'), (1, 'K2'))),
+    ('2(MS)N10', ((2, 'M2'), (2, 'S2'), (1, 'N2'))),
+    )
+
+_BASIC_NAMES = [c[0] for c in _BASIC_CONSTITUENTS]
+_V_COEFFICIENTS = numpy.array([c[1] for c in _BASIC_CONSTITUENTS],
+                              dtype=numpy.float64)
+_V_PHASES = numpy.array([c[2] for c in _BASIC_CONSTITUENTS],
+                        dtype=numpy.float64)
+_NODAL_INDEX = numpy.array([_NODAL_FORMULAS.index(c[3])
+                            for c in _BASIC_CONSTITUENTS])
+
+# The u of M1 includes an angle (Q) which advances, on average, with p.
+# Its conventional speed includes that.
+_SPEED_COEFFICIENTS = _V_COEFFICIENTS.copy()
+_SPEED_COEFFICIENTS[_BASIC_NAMES.index('M1'), 3] = 1
+
+
+def _combinations():
+    combinations = OrderedDict()
+    for i, name in enumerate(_BASIC_NAMES):
+        combinations[name] = ((1, i),)
+    for name, components in _COMPOUND_CONSTITUENTS:
+        combinations[name] = tuple((n, _BASIC_NAMES.index(basic))
+                                   for n, basic in components)
+    return combinations
+
+_COMBINATIONS = _combinations()
+
+#: The names of the supported constituents.
+CONSTITUENTS = tuple(_COMBINATIONS)
+
+
+def _weights(names):
+    """ Get the ``C x B`` matrix of the weights of the basic constituents
+    in each of the named constituents.
+    """
+    weights = numpy.zeros((len(names), len(_BASIC_NAMES)))
+    for i, name in enumerate(names):
+        try:
+            combination = _COMBINATIONS[name]
+        except KeyError:
+            raise KeyError("unsupported constituent (%r)" % name)
+        for n, j in combination:
+            weights[i, j] += n
+    return weights
+
+
+def speeds(names):
+    """ Compute the speeds (in degrees per hour) of constituents.
+    """
+    doodson = _SPEED_COEFFICIENTS.dot(ARGUMENT_SPEEDS[[0, 1, 2, 3, 5]])
+    return _weights(names).dot(doodson)
+
+
+def astronomical_arguments(times):
+    """ Compute the astronomical arguments at the given times.
+
+    ``times`` may be anything accepted by
+    :func:`~libtcd.predict.as_seconds`.  Returns an array of shape
+    ``(6,) + times.shape``, holding ``T``, ``s``, ``h``, ``p``, ``N``
+    and ``p1`` in degrees (not reduced modulo 360.)
+
+    """
+    seconds = as_seconds(times)
+    days = seconds / 86400.0 + _EPOCH_DAYS
+    centuries = days / 36525.0
+    T = 180.0 + (seconds % 86400.0) / 240.0
+    c0, c1, c2, c3 = (_POLYNOMIALS[:, k, None] for k in range(4))
+    flat_days = days.reshape(1, -1)
+    flat_centuries = centuries.reshape(1, -1)
+    args = (c0 + c1 * flat_days
+            + (c2 + c3 * flat_centuries) * flat_centuries ** 2)
+    return numpy.concatenate([T.reshape(1, -1), args]) \
+        .reshape((6,) + seconds.shape)
+
+
+def _nodal_corrections(N, p):
+    """ Compute the nodal corrections for each of the formulas in
+    ``_NODAL_FORMULAS``.
+
+    ``N`` and ``p`` are flat arrays (in degrees.)  Returns ``f`` and
+    ``u`` (in degrees) as ``len(_NODAL_FORMULAS) x len(N)`` arrays.
+
+    """
+    N = numpy.radians(N)
+    i, omega = _INCLINATION, _OBLIQUITY
+    # The inclination of the moon's orbit to the equator (I), the
+    # longitude in the moon's orbit of its intersection with the
+    # equator (xi), and the right ascension of that intersection (nu)
+    I = numpy.arccos(numpy.cos(i) * numpy.cos(omega)
+                     - numpy.sin(i) * numpy.sin(omega) * numpy.cos(N))
+    tan_half_N = numpy.tan(N / 2)
+    a = numpy.arctan(numpy.cos((omega - i) / 2) / numpy.cos((omega + i) / 2)
+                     * tan_half_N) - N / 2
+    b = numpy.arctan(numpy.sin((omega - i) / 2) / numpy.sin((omega + i) / 2)
+                     * tan_half_N) - N / 2
+    xi = -(a + b)
+    nu = a - b
+
+    sin_I = numpy.sin(I)
+    sin_2I = numpy.sin(2 * I)
+    cos_half_I2 = numpy.cos(I / 2) ** 2
+    # Schureman's equations 224 and 232
+    nu1 = numpy.arctan2(sin_2I * numpy.sin(nu),
+                        sin_2I * numpy.cos(nu) + 0.3347)
+    nu2 = numpy.arctan2(sin_I ** 2 * numpy.sin(2 * nu),
+                        sin_I ** 2 * numpy.cos(2 * nu) + 0.0727)
+    # L2 (equations 213-215)
+    P = numpy.radians(p) - xi
+    tan_half_I2 = numpy.tan(I / 2) ** 2
+    R = numpy.arctan2(numpy.sin(2 * P),
+                      1 / (6 * tan_half_I2) - numpy.cos(2 * P))
+    Ra_inv = numpy.sqrt(1 - 12 * tan_half_I2 * numpy.cos(2 * P)
+                        + 36 * tan_half_I2 ** 2)
+    # M1 (equations 197, 203 and 206)
+    Q = numpy.arctan2(0.483 * numpy.sin(P), numpy.cos(P))
+    Qa_inv = numpy.sqrt(2.310 + 1.435 * numpy.cos(2 * P))
+
+    f_O1 = sin_I * cos_half_I2 / 0.3800
+    f_M2 = cos_half_I2 ** 2 / 0.9154
+    f = numpy.array([
+        numpy.ones_like(I),                                     # None
+        (2.0 / 3.0 - sin_I ** 2) / 0.5021,                      # Mm
+        sin_I ** 2 / 0.1578,                                    # Mf
+        f_O1,                                                   # O1
+        f_O1 * Qa_inv,                                          # M1
+        sin_2I / 0.7214,                                        # J1
+        sin_I * numpy.sin(I / 2) ** 2 / 0.0164,                 # OO1
+        numpy.sqrt(0.8965 * sin_2I ** 2                         # K1
+                   + 0.6001 * sin_2I * numpy.cos(nu) + 0.1006),
+        f_M2,                                                   # M2
+        numpy.sqrt(19.0444 * sin_I ** 4                         # K2
+                   + 2.7702 * sin_I ** 2 * numpy.cos(2 * nu) + 0.0981),
+        f_M2 * Ra_inv,                                          # L2
+        cos_half_I2 ** 3 / 0.8758,                              # M3
+        ])
+    zero = numpy.zeros_like(I)
+    u = numpy.degrees([
+        zero,                                                   # None
+        zero,                                                   # Mm
+        -2 * xi,                                                # Mf
+        2 * xi - nu,                                            # O1
+        xi - nu + Q,                                            # M1
+        -nu,                                                    # J1
+        -2 * xi - nu,                                           # OO1
+        -nu1,                                                   # K1
+        2 * xi - 2 * nu,                                        # M2
+        -nu2,                                                   # K2
+        2 * xi - 2 * nu - R,                                    # L2
+        3 * xi - 3 * nu,                                        # M3
+        ])
+    return f, u
+
+
+def _evaluate(names, v_times, nodal_times):
+    """ Compute the equilibrium arguments and node factors of constituents.
+
+    ``V`` is computed at ``v_times``, ``u`` and ``f`` at
+    ``nodal_times``.  (Both are flat arrays of seconds since the epoch.)
+    Returns two ``C x len(v_times)`` arrays.
+
+    """
+    weights = _weights(names)
+    args = astronomical_arguments(v_times)
+    V = _V_COEFFICIENTS.dot(args[[0, 1, 2, 3, 5]]) + _V_PHASES[:, None]
+    if nodal_times is not v_times:
+        args = astronomical_arguments(nodal_times)
+    f, u = _nodal_corrections(args[4], args[3])
+    equilibriums = weights.dot(V + u[_NODAL_INDEX])
+    node_factors = numpy.exp(
+        numpy.abs(weights).dot(numpy.log(f[_NODAL_INDEX])))
+    return numpy.mod(equilibriums, 360.0), node_factors
+
+
+def equilibrium_arguments(names, times):
+    """ Compute the equilibrium arguments (``V + u``, in degrees) of
+    constituents at the given times.
+
+    ``times`` may be anything accepted by
+    :func:`~libtcd.predict.as_seconds`.  Returns an array of shape
+    ``(len(names),) + times.shape``.
+
+    """
+    seconds = as_seconds(times)
+    flat = seconds.reshape(-1)
+    equilibriums, _ = _evaluate(names, flat, flat)
+    return equilibriums.reshape((len(names),) + seconds.shape)
+
+
+def node_factors(names, times):
+    """ Compute the node factors of constituents at the given times.
+
+    ``times`` may be anything accepted by
+    :func:`~libtcd.predict.as_seconds`.  Returns an array of shape
+    ``(len(names),) + times.shape``.
+
+    """
+    seconds = as_seconds(times)
+    flat = seconds.reshape(-1)
+    _, factors = _evaluate(names, flat, flat)
+    return factors.reshape((len(names),) + seconds.shape)
+
+
+def _year_starts(start_year, number_of_years):
+    years = numpy.arange(start_year - 1970,
+                         start_year - 1970 + number_of_years + 1)
+    return years.astype('datetime64[Y]').astype('datetime64[s]') \
+        .astype(numpy.int64).astype(numpy.float64)
+
+
+def year_tables(names, start_year, number_of_years):
+    """ Compute the yearly equilibrium arguments and node factors of
+    constituents.
+
+    Returns ``(equilibriums, node_factors)``: two ``C x Y`` matrices for
+    the ``Y = number_of_years`` years starting with ``start_year``.
+
+    """
+    boundaries = _year_starts(start_year, number_of_years)
+    starts = boundaries[:-1]
+    middles = (boundaries[:-1] + boundaries[1:]) / 2
+    return _evaluate(names, starts, middles)
+
+
+def constituent_tables(names, start_year, number_of_years):
+    """ Compute :class:`~libtcd.api.ConstituentTables` for constituents.
+    """
+    equilibriums, factors = year_tables(names, start_year, number_of_years)
+    return ConstituentTables(names, speeds(names), start_year,
+                             number_of_years, equilibriums, factors)
+
+
+def extend_constituents(constituents, start_year, end_year):
+    """ Extend the yearly tables of constituents.
+
+    ``constituents`` is a mapping of name to
+    :class:`~libtcd.api.Constituent` (e.g. ``tcd.constituents``.)
+    Returns a new ordered mapping, in which the :class:`NodeFactors` of
+    each supported constituent cover (at least) the years from
+    ``start_year`` up to, but not including, ``end_year``.  Values are
+    computed only for the years not already covered.
+
+    Unsupported constituents are returned unchanged, with a warning:
+    stations which use them still can not be predicted outside the
+    years of their tables.
+
+    """
+    supported = [c for c in constituents.values()
+                 if c.name in _COMBINATIONS and len(c.node_factors)]
+    unsupported = [c.name for c in constituents.values()
+                   if c.name not in _COMBINATIONS and len(c.node_factors)]
+    if unsupported:
+        warnings.warn("can not extend the tables of unsupported "
+                      "constituents: %s" % ", ".join(unsupported),
+                      stacklevel=2)
+    if supported:
+        start_year = min([start_year] + [c.node_factors.start_year
+                                         for c in supported])
+        end_year = max([end_year] + [c.node_factors.end_year
+                                     for c in supported])
+        equilibriums, factors = year_tables(
+            [c.name for c in supported], start_year, end_year - start_year)
+        equilibriums = equilibriums.astype(numpy.float32)
+        factors = factors.astype(numpy.float32)
+
+    extended = OrderedDict()
+    i = 0
+    for name, constituent in constituents.items():
+        node_factors = constituent.node_factors
+        if constituent.name not in _COMBINATIONS or not len(node_factors):
+            extended[name] = constituent
+            continue
+        offset = node_factors.start_year - start_year
+        eqs, nfs = node_factors._slices(node_factors.start_year,
+                                        node_factors.end_year)
+        equilibriums[i, offset:offset + len(node_factors)] = eqs
+        factors[i, offset:offset + len(node_factors)] = nfs
+        extended[name] = Constituent(
+            constituent.name, constituent.speed,
+            NodeFactors.from_arrays(start_year, equilibriums[i], factors[i]))
+        i += 1
+    return extended
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+""" A cache of tide predictions.
+
+:class:`PredictionCache` caches the predicted tide at stations of a
+database over evenly spaced times (say, "the next seven days, every six
+minutes, at station X".)  Predictions are kept as ``float32`` series in
+memory, in an LRU cache of limited total size, and optionally as files
+in a directory, where they persist between processes.
+
+Predictions are keyed by the station's fingerprint (see
+:mod:`libtcd.fingerprint`), a digest of the database's constituent
+tables, and the start, step and number of the times.  A cached
+prediction is therefore never used for a station which has since
+changed.  When stations of a database are changed or deleted (by
+:meth:`~libtcd.api.Tcd.__setitem__` or
+:meth:`~libtcd.api.Tcd.__delitem__`), the predictions held in memory
+for them are discarded the next time the cache is used with the
+database (or by :meth:`PredictionCache.invalidate`.)  Those stored on
+disk are left alone, since other processes may be using them; remove
+them with :meth:`PredictionCache.prune`.
+
+This module requires numpy.
+
+"""
+from __future__ import absolute_import
+
+from binascii import hexlify
+from operator import attrgetter
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import weakref
+
+import numpy
+from six import integer_types
+
+from .api import ConstituentTables
+from .compat import bytes_
+from .predict import as_seconds, predict
+from .util import LRUCache, remove_if_exists
+from . import _libtcd
+
+_DTYPE = numpy.dtype('<f4')
+_FINGERPRINT_DIRNAME = re.compile(r'\A[0-9a-f]{40}\Z')
+
+
+def constituents_digest(tcd):
+    """ Compute a digest of the constituent tables of a database.
+    """
+    tables = tcd.constituent_tables
+    if tables is None:
+        tables = ConstituentTables.from_constituents(tcd.constituents)
+    speeds, equilibriums, node_factors = tables.as_numpy()
+    h = hashlib.sha1()
+    for name in tables.names:
+        h.update(bytes_(name, 'utf-8'))
+        h.update(b'\0')
+    h.update(repr((tables.start_year, tables.number_of_years))
+             .encode('ascii'))
+    for table in speeds, equilibriums, node_factors:
+        h.update(numpy.ascontiguousarray(table).tobytes())
+    return h.digest()
+
+
+class _DatabaseState(object):
+    # What the cache knows about a database
+    def __init__(self, tcd):
+        self.constituents_digest = constituents_digest(tcd)
+        self.fingerprints = tcd.fingerprints()
+
+
+class PredictionCache(object):
+    """ A cache of predictions at the stations of databases.
+
+    At most ``maxbytes`` of predictions are kept in memory.  If
+    ``directory`` is given, predictions are also stored there: one file
+    of raw little-endian ``float32`` values per prediction, in a
+    subdirectory per station fingerprint.
+
+    """
+    def __init__(self, maxbytes=64 * 1024 * 1024, directory=None):
+        self.directory = directory
+        self._memory = LRUCache(maxbytes, sizeof=attrgetter('nbytes'))
+        self._databases = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def predict(self, tcd, station, start, end, step=360.0):
+        """ Predict the tide at a station of a database.
+
+        ``station`` is the record number or the name of the station.
+        ``start`` and ``end`` may be anything accepted by
+        :func:`~libtcd.predict.as_seconds`.  Returns the heights at
+        the times from ``start`` up to (but not including) ``end``,
+        spaced by ``step`` seconds, as a read-only ``float32`` array.
+
+        """
+        start = float(as_seconds(start))
+        step = float(step)
+        if step <= 0:
+            raise ValueError("step must be positive")
+        end = float(as_seconds(end))
+        count = max(int(numpy.ceil((end - start) / step)), 0)
+        i = self._record_number(tcd, station)
+        with self._lock:
+            state = self._state(tcd)
+            fingerprint = state.fingerprints[i]
+            key = (fingerprint, state.constituents_digest,
+                   start, step, count)
+            heights = self._memory.get(key)
+            if heights is not None:
+                self.hits += 1
+                return heights
+
+        heights = self._load(key)
+        if heights is not None:
+            hit = 'disk_hits'
+        else:
+            hit = 'misses'
+            times = start + numpy.arange(count) * step
+            heights = predict(tcd[i], times).astype(_DTYPE)
+            heights.flags.writeable = False
+            self._store(key, heights)
+        with self._lock:
+            setattr(self, hit, getattr(self, hit) + 1)
+            self._memory[key] = heights
+        return heights
+
+    @staticmethod
+    def _record_number(tcd, station):
+        if isinstance(station, integer_types):
+            n = len(tcd)
+            i = station + n if station < 0 else station
+            if not 0 <= i < n:
+                raise IndexError(station)
+            return i
+        i = tcd._names.find(bytes_(station, _libtcd.ENCODING))
+        if i is None:
+            raise KeyError(station)
+        return i
+
+    def _state(self, tcd):
+        # The caller must hold self._lock
+        state = self._databases.get(tcd)
+        if state is None:
+            state = self._databases[tcd] = _DatabaseState(tcd)
+        else:
+            fingerprints = tcd.fingerprints()
+            if fingerprints is not state.fingerprints:
+                # The database has been modified
+                self._discard_stale(state, fingerprints)
+        return state
+
+    def _discard_stale(self, state, fingerprints):
+        stale = set(state.fingerprints).difference(fingerprints)
+        for key in self._memory.keys():
+            if key[0] in stale:
+                self._memory.pop(key)
+        state.fingerprints = fingerprints
+
+    def invalidate(self, tcd):
+        """ Discard the predictions held in memory for stations of
+        ``tcd`` which have been changed or deleted.
+        """
+        with self._lock:
+            if tcd in self._databases:
+                self._state(tcd)
+
+    def prune(self, tcds):
+        """ Remove the predictions stored on disk, except those for the
+        (current) stations of the databases in ``tcds``.
+
+        Returns the number of stations whose predictions were removed.
+
+        """
+        if self.directory is None or not os.path.isdir(self.directory):
+            return 0
+        keep = set()
+        for tcd in tcds:
+            keep.update(self._dirname(fingerprint)
+                        for fingerprint in tcd.fingerprints())
+        removed = 0
+        for name in os.listdir(self.directory):
+            dirname = os.path.join(self.directory, name)
+            if (_FINGERPRINT_DIRNAME.match(name) and dirname not in keep
+                    and os.path.isdir(dirname)):
+                shutil.rmtree(dirname, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def clear(self):
+        """ Discard all the predictions held in memory.
+        """
+        with self._lock:
+            self._memory.clear()
+
+    def _dirname(self, fingerprint):
+        return os.path.join(self.directory,
+                            hexlify(fingerprint).decode('ascii'))
+
+    def _filename(self, key):
+        fingerprint, digest, start, step, count = key
+        h = hashlib.sha1(digest)
+        h.update(repr((start, step, count)).encode('ascii'))
+        return os.path.join(self._dirname(fingerprint),
+                            hexlify(h.digest()).decode('ascii') + '.f4')
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            heights = numpy.fromfile(self._filename(key), dtype=_DTYPE)
+        except (IOError, OSError):
+            return None
+        if len(heights) != key[-1]:
+            return None
+        heights.flags.writeable = False
+        return heights
+
+    def _store(self, key, heights):
+        if self.directory is None:
+            return
+        filename = self._filename(key)
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not os.path.isdir(dirname):
+                    raise
+        # Write to a temporary file, then rename it into place, so that
+        # readers never see a partial file
+        fd, tmpname = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(heights.tobytes())
+            os.rename(tmpname, filename)
+        except Exception:
+            remove_if_exists(tmpname)
+            raise
+
+    @property
+    def memory_used(self):
+        """ The total size (in bytes) of the predictions held in memory.
+        """
+        return self._memory.size
+
+    @property
+    def hit_rate(self):
+        """ The fraction of requests answered from memory or disk.
+        """
+        requests = self.hits + self.disk_hits + self.misses
+        if not requests:
+            return 0.0
+        return float(self.hits + self.disk_hits) / requests
+
+    def stats(self):
+        """ Get the cache statistics, as a ``dict``.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+                'entries': len(self._memory),
+                'memory_used': self.memory_used,
+                'memory_limit': self._memory.maxsize,
+                }
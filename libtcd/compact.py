@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+""" Compact in-memory representations of stations.
+
+Ordinary stations keep their state in an instance ``__dict__``, and
+their coefficients as a list of :class:`~libtcd.api.Coefficient`
+namedtuples.  That is convenient but bulky: holding every station of
+a large database in memory can take hundreds of megabytes.
+
+The classes here use ``__slots__``.  Coefficients are stored as
+parallel ``array``\\s of constituent indexes, amplitudes and epochs.
+Values which are typically shared among many stations (country, time
+zone, datum, units, time offsets, etc.) are interned per
+:class:`CompactCatalog`, so that each distinct value is stored once.
+
+"""
+from __future__ import absolute_import
+
+from array import array
+from itertools import chain
+import sys
+
+from six.moves import zip
+
+from .api import (
+    Coefficient,
+    ReferenceStation,
+    SubordinateStation,
+    )
+from .compat import OrderedDict
+
+#: The target size, in bytes, of a compact reference station with 32
+#: coefficients on a 64-bit CPython, as measured by :func:`footprint`.
+#: (The same station, uncompacted, takes about 5.5kB.)
+TARGET_BYTES_PER_STATION = 1536
+
+# Attributes whose values are (usually) unique to each station.  All
+# other (hashable) attribute values are interned.
+_UNIQUE_ATTRS = frozenset([
+    'name',
+    'record_number',
+    'latitude',
+    'longitude',
+    'comments',
+    'notes',
+    'station_id',
+    ])
+
+
+def _attr_names(station_class):
+    names = set(chain.from_iterable(
+        d.unpacked_names for d in station_class._PACKED_ATTRS))
+    names.difference_update(['coefficients', 'xfields'])
+    return tuple(sorted(names))
+
+
+class _CompactStation(object):
+    __slots__ = ('_xfields',)
+
+    _station_class = None
+    _ATTRS = ()
+    _CACHED = ()                        # slots which are not pickled
+
+    @property
+    def xfields(self):
+        return OrderedDict(self._xfields or ())
+
+    def __repr__(self):
+        return "<{0.__class__.__name__}: {0.name}>".format(self)
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self._slots()
+                    if name not in self._CACHED)
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def _slots(cls):
+        return chain.from_iterable(
+            getattr(c, '__slots__', ()) for c in cls.__mro__)
+
+    def to_station(self):
+        """ Convert to an ordinary (non-compact) station.
+        """
+        station_class = self._station_class
+        station = station_class.__new__(station_class)
+        for name in self._ATTRS:
+            setattr(station, name, getattr(self, name))
+        station.xfields = self.xfields
+        return station
+
+
+class CompactReferenceStation(_CompactStation):
+    _station_class = ReferenceStation
+    _ATTRS = _attr_names(ReferenceStation)
+    __slots__ = _ATTRS + (
+        '_constituents', 'constituent_indexes', 'amplitudes', 'epochs',
+        '_station')
+    _CACHED = ('_station',)
+
+    @property
+    def coefficients(self):
+        constituents = self._constituents
+        return [Coefficient(amplitude, epoch, constituents[i])
+                for i, amplitude, epoch in zip(self.constituent_indexes,
+                                               self.amplitudes,
+                                               self.epochs)]
+
+    def to_station(self):
+        station = super(CompactReferenceStation, self).to_station()
+        station.coefficients = self.coefficients
+        return station
+
+    def _shared_station(self):
+        # The ordinary station shared by the subordinate stations which
+        # refer to this one
+        try:
+            return self._station
+        except AttributeError:
+            station = self._station = self.to_station()
+            return station
+
+
+class CompactSubordinateStation(_CompactStation):
+    _station_class = SubordinateStation
+    _ATTRS = _attr_names(SubordinateStation)
+    __slots__ = _ATTRS
+
+    def to_station(self):
+        station = super(CompactSubordinateStation, self).to_station()
+        if self.reference_station is not None:
+            station.reference_station = \
+                self.reference_station._shared_station()
+        return station
+
+
+class CompactCatalog(object):
+    """ A list of compact stations, sharing constituents and interned values.
+
+    ``constituents`` is the (ordered) mapping of constituents of the
+    database the stations come from.
+
+    """
+    def __init__(self, constituents):
+        self.constituents = constituents
+        self._constituents = tuple(constituents.values())
+        self._constituent_indexes = dict(
+            (name, i) for i, name in enumerate(constituents))
+        self._interned = {}
+        self._refstations = {}
+        self._unnumbered = {}           # id -> reference station
+        self.stations = []
+
+    @classmethod
+    def from_tcd(cls, tcd):
+        """ Build a catalog holding all the stations of a database.
+        """
+        catalog = cls(tcd.constituents)
+        for station in tcd:
+            catalog.append(station)
+        return catalog
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __getitem__(self, i):
+        return self.stations[i]
+
+    def __iter__(self):
+        return iter(self.stations)
+
+    def append(self, station):
+        """ Add a station to the catalog.
+
+        Returns the compact version of the station.
+
+        """
+        compact = self.compact(station)
+        self.stations.append(compact)
+        return compact
+
+    def compact(self, station):
+        """ Convert a station to its compact form.
+
+        Subordinate stations which refer to the same reference station
+        (either the same instance, or stations with the same record
+        number) share a single compact reference station.
+
+        """
+        if isinstance(station, ReferenceStation):
+            key = self._refstation_key(station)
+            compact = self._refstations.get(key)
+            if compact is None:
+                compact = self._compact(CompactReferenceStation, station)
+                self._refstations[key] = compact
+            return compact
+        elif isinstance(station, SubordinateStation):
+            return self._compact(CompactSubordinateStation, station)
+        raise TypeError(
+            "%r is neither a ReferenceStation nor SubordinateStation"
+            % station)
+
+    def _refstation_key(self, refstation):
+        if refstation.record_number is not None:
+            return refstation.record_number
+        # Keep (only) unnumbered stations alive, so that their ids are
+        # not reused
+        self._unnumbered.setdefault(id(refstation), refstation)
+        return 'id', id(refstation)
+
+    def _intern(self, value):
+        try:
+            return self._interned.setdefault(value, value)
+        except TypeError:                   # unhashable
+            return value
+
+    def _compact(self, compact_class, station):
+        compact = compact_class.__new__(compact_class)
+        for name in compact_class._ATTRS:
+            value = getattr(station, name)
+            if name == 'reference_station':
+                if value is not None:
+                    value = self.compact(value)
+            elif name not in _UNIQUE_ATTRS:
+                value = self._intern(value)
+            setattr(compact, name, value)
+        xfields = station.xfields
+        compact._xfields = tuple(xfields.items()) if xfields else None
+
+        if compact_class is CompactReferenceStation:
+            indexes = self._constituent_indexes
+            coefficients = sorted(
+                station.coefficients,
+                key=lambda coeff: indexes.get(coeff.constituent.name, -1))
+            try:
+                compact.constituent_indexes = array('H', [
+                    indexes[coeff.constituent.name]
+                    for coeff in coefficients])
+            except KeyError as ex:
+                raise ValueError("Unknown constituent: %s" % ex.args[0])
+            compact.amplitudes = array(
+                'f', [coeff.amplitude for coeff in coefficients])
+            compact.epochs = array(
+                'f', [coeff.epoch for coeff in coefficients])
+            compact._constituents = self._constituents
+        return compact
+
+
+def footprint(station):
+    """ Compute the memory used by a compact station, in bytes.
+
+    This counts the station object itself, its coefficient arrays, and
+    those of its attribute values which are not shared with other
+    stations.  (Interned values, the constituents and reference
+    stations are not counted.)
+
+    """
+    size = sys.getsizeof(station)
+    for name in _UNIQUE_ATTRS:
+        value = getattr(station, name)
+        if value is not None:
+            size += sys.getsizeof(value)
+    if station._xfields:
+        size += sys.getsizeof(station._xfields)
+        size += sum(map(sys.getsizeof,
+                        chain.from_iterable(station._xfields)))
+    if isinstance(station, CompactReferenceStation):
+        size += sum(map(sys.getsizeof, (station.constituent_indexes,
+                                        station.amplitudes,
+                                        station.epochs)))
+    return size
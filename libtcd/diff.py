@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+""" Compare two TCD databases, and patch one to match the other.
+
+:func:`diff` matches the stations of two databases by record type and
+name, using only a pass over their record headers.  (The ``n``-th
+station with a given type and name in one database is matched with the
+``n``-th in the other.)  Matched stations are then compared by their
+fingerprints (see :mod:`libtcd.fingerprint`), which are computed from
+the raw records in a single pass over each database.  No stations are
+unpacked.
+
+:func:`apply_diff` applies the differences to a database in place,
+using ``append``, ``__setitem__`` and ``__delitem__``.
+
+"""
+from __future__ import absolute_import
+
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from . import _libtcd
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+StationChange = namedtuple('StationChange',
+                           ['change', 'record_type', 'name', 'old', 'new'])
+StationChange.__doc__ = """ A difference between two databases.
+
+``change`` is one of :data:`ADDED`, :data:`REMOVED` or :data:`CHANGED`.
+``old`` and ``new`` are the record numbers of the station in the old
+and new databases (``None`` where the station does not exist.)
+``name`` is the (encoded) station name.
+"""
+
+
+def _record_keys(tcd):
+    """ Get the key of each record, in record order.
+
+    The key of a record is ``(record_type, name, n)``, where ``n``
+    counts the previous records with the same type and name.
+
+    """
+    keys = []
+    counts = {}
+    with tcd._reading() as reader:
+        for header in reader._iter_headers():
+            key = header.record_type, header.name
+            n = counts.get(key, 0)
+            counts[key] = n + 1
+            keys.append(key + (n,))
+    return keys
+
+
+def diff(old, new):
+    """ Find the differences between two databases.
+
+    Yields a :class:`StationChange` for each station which has been
+    added, removed or changed in ``new``, relative to ``old``.  (A
+    subordinate station is changed if its reference station is.)
+    Changes are yielded in (new) record order, followed by removals in
+    (old) record order.
+
+    """
+    old_keys = _record_keys(old)
+    new_keys = _record_keys(new)
+    common = set(old_keys).intersection(new_keys)
+    old_numbers = dict((key, i) for i, key in enumerate(old_keys))
+    old_fingerprints = old.fingerprints()
+    new_fingerprints = new.fingerprints()
+
+    for i, key in enumerate(new_keys):
+        record_type, name, _ = key
+        if key not in common:
+            yield StationChange(ADDED, record_type, name, None, i)
+            continue
+        j = old_numbers[key]
+        if new_fingerprints[i] != old_fingerprints[j]:
+            yield StationChange(CHANGED, record_type, name, j, i)
+
+    for i, key in enumerate(old_keys):
+        if key not in common:
+            record_type, name, _ = key
+            yield StationChange(REMOVED, record_type, name, i, None)
+
+
+def _subordinates_by_reference(tcd):
+    """ Map the record number of each reference station to those of the
+    subordinate stations which refer to it.
+    """
+    subordinates = {}
+    with tcd._reading() as reader:
+        for j, header in enumerate(reader._iter_headers()):
+            if header.record_type == _libtcd.SUBORDINATE_STATION:
+                subordinates.setdefault(header.reference_station, []) \
+                    .append(j)
+    return subordinates
+
+
+def _delete(target, removed):
+    """ Delete the removed stations from ``target``.
+    """
+    # Deleting a record renumbers the following records.  Subordinate
+    # stations are deleted first, in descending order.  Deleting a
+    # reference station also deletes the subordinate stations which
+    # refer to it (wherever they are stored.)  ``deleted`` holds the
+    # (sorted) record numbers, before any deletions, of the deleted
+    # records, from which the current number of a record is computed.
+    subordinates_of = _subordinates_by_reference(target)
+    deleted = sorted(c.old for c in removed
+                     if c.record_type == _libtcd.SUBORDINATE_STATION)
+    for i in reversed(deleted):
+        del target[i]
+    for c in removed:
+        if c.record_type == _libtcd.REFERENCE_STATION:
+            del target[c.old - bisect_left(deleted, c.old)]
+            insort(deleted, c.old)
+            for j in subordinates_of.get(c.old, ()):
+                k = bisect_left(deleted, j)
+                if k == len(deleted) or deleted[k] != j:
+                    deleted.insert(k, j)
+
+
+def apply_diff(target, source, changes):
+    """ Apply changes (as computed by :func:`diff`) to a database.
+
+    ``target`` is the old database (or an identical copy), which is
+    modified in place to match ``source``, the new database.  Added
+    reference stations are appended before added subordinate stations,
+    so that the latter can refer to the former.  Removed stations are
+    deleted last: subordinate stations first, then reference stations.
+
+    Returns a ``dict`` mapping each kind of change to the number of
+    stations changed.
+
+    """
+    added = []
+    changed = []
+    removed = []
+    for change in changes:
+        {ADDED: added, CHANGED: changed, REMOVED: removed}[change.change] \
+            .append(change)
+
+    def stations(record_type):
+        return [source[c.new] for c in added if c.record_type == record_type]
+
+    target.extend(stations(_libtcd.REFERENCE_STATION))
+    target.extend(stations(_libtcd.SUBORDINATE_STATION))
+
+    for c in changed:
+        target[c.old] = source[c.new]
+
+    if removed:
+        _delete(target, removed)
+
+    return {ADDED: len(added), CHANGED: len(changed), REMOVED: len(removed)}
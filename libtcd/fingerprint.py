@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+""" Content fingerprints of stations.
+
+A fingerprint is a SHA-1 digest computed directly from the fields of a
+station's raw ``TIDE_RECORD``, without unpacking it.  Fingerprints are
+stable: they do not depend on the record number, on how the string
+tables of the database are numbered, or on the order of its
+constituents.  Identical stations in different databases have the same
+fingerprint.
+
+The fingerprint of a subordinate station covers (the fingerprint of)
+its reference station, so a change to a reference station changes the
+fingerprints of all its subordinate stations.
+
+Use :meth:`~libtcd.api.Tcd.fingerprints` to get the (cached)
+fingerprints of all the stations of a database.
+
+"""
+from __future__ import absolute_import
+
+from array import array
+from ctypes import Array, addressof, c_char, sizeof, string_at
+import hashlib
+import struct
+
+from six.moves import range, zip
+
+from . import _libtcd
+from .api import ReferenceStation, SubordinateStation, _string_table
+from .compat import OrderedDict
+
+
+def _fields(struct_class):
+    anonymous = getattr(struct_class, '_anonymous_', ())
+    for name, ctype in struct_class._fields_:
+        if name in anonymous:
+            for field in _fields(ctype):
+                yield field
+        else:
+            yield name, ctype
+
+
+def _record_layout():
+    # Split the fields of TIDE_RECORD into those which can be
+    # fingerprinted by their raw bytes, (NUL-terminated) strings, and
+    # those needing special treatment.
+    string_tables = {}              # packed_name -> table_name
+    for station_class in ReferenceStation, SubordinateStation:
+        for cls in station_class.__mro__:
+            for descriptor in cls.__dict__.get('_PACKED_ATTRS', ()):
+                if isinstance(descriptor, _string_table):
+                    string_tables[descriptor.packed_name] \
+                        = descriptor.table_name
+    special = set(string_tables)
+    special.update(['record_number', 'record_size', 'reference_station',
+                    'amplitude', 'epoch'])
+
+    raw = []                        # (offset, size)
+    strings = []
+    for name, ctype in _fields(_libtcd.TIDE_RECORD):
+        if name in special:
+            continue
+        elif issubclass(ctype, Array) and ctype._type_ is c_char:
+            strings.append(name)
+        else:
+            offset = getattr(_libtcd.TIDE_RECORD, name).offset
+            if raw and sum(raw[-1]) == offset:
+                raw[-1] = raw[-1][0], raw[-1][1] + sizeof(ctype)
+            else:
+                raw.append((offset, sizeof(ctype)))
+    # (Sorted: the order of _PACKED_ATTRS varies between processes)
+    return raw, strings, sorted(string_tables.items())
+
+_RAW_SLICES, _STRING_FIELDS, _STRING_TABLE_FIELDS = _record_layout()
+
+_AMPLITUDE_OFFSET = _libtcd.TIDE_RECORD.amplitude.offset
+_EPOCH_OFFSET = _libtcd.TIDE_RECORD.epoch.offset
+
+
+class _RecordDigester(object):
+    """ Compute the digests of the raw records of a database.
+
+    The digest of a record covers all its fields except the record
+    number and size, and (for subordinate stations) the reference
+    station.
+
+    """
+    def __init__(self, tcd):
+        self.tcd = tcd
+        self.constituents = [name.encode('utf-8')
+                             for name in tcd.constituents]
+
+    def __call__(self, rec):
+        h = hashlib.sha1()
+        update = h.update
+        base = addressof(rec)
+        for offset, size in _RAW_SLICES:
+            update(string_at(base + offset, size))
+        for name in _STRING_FIELDS:
+            update(getattr(rec, name))
+            update(b'\0')
+        string_table = self.tcd._string_table_cache
+        for name, table_name in _STRING_TABLE_FIELDS:
+            text = string_table(table_name).get(getattr(rec, name))
+            update(text.encode('utf-8'))
+            update(b'\0')
+        if rec.record_type == _libtcd.REFERENCE_STATION:
+            # Coefficients are identified by constituent name, so that
+            # the order of the constituents does not matter
+            size = 4 * len(self.constituents)
+            amplitudes = array('f', string_at(base + _AMPLITUDE_OFFSET, size))
+            epochs = array('f', string_at(base + _EPOCH_OFFSET, size))
+            coefficients = sorted(
+                coeff for coeff in zip(self.constituents, amplitudes, epochs)
+                if coeff[1] != 0.0)
+            for name, amplitude, epoch in coefficients:
+                update(name)
+                update(struct.pack('<ff', amplitude, epoch))
+        return h.digest()
+
+
+def _with_refstation(digest, refstation_fingerprint):
+    return hashlib.sha1(digest + refstation_fingerprint).digest()
+
+
+def iter_raw_records(tcd, chunk_size=64):
+    """ Iterate over the raw records of a database.
+
+    Record buffers are reused: each record is only valid until the next
+    is yielded.
+
+    """
+    buffers = [tcd._record_class() for _ in range(chunk_size)]
+    start = 0
+    while True:
+        with tcd._reading() as reader:
+            records = reader._read_chunk(start, chunk_size, buffers)
+        for rec in records:
+            yield rec
+        if len(records) < chunk_size:
+            break
+        start += len(records)
+
+
+def fingerprint_table(tcd, chunk_size=64):
+    """ Compute the fingerprints of all the stations of a database.
+
+    Returns a list of fingerprints (``bytes``), indexed by record
+    number.  The database is read in a single sequential pass.
+
+    """
+    digest = _RecordDigester(tcd)
+    table = []
+    refstations = []                # (i, refstation record number)
+    for i, rec in enumerate(iter_raw_records(tcd, chunk_size)):
+        table.append(digest(rec))
+        if rec.record_type == _libtcd.SUBORDINATE_STATION:
+            refstations.append((i, rec.reference_station))
+    # Reference stations' fingerprints are their digests
+    digests = list(table)
+    for i, j in refstations:
+        refstation = digests[j] if 0 <= j < len(digests) else b''
+        table[i] = _with_refstation(digests[i], refstation)
+    return table
+
+
+def record_fingerprint(tcd, rec):
+    """ Compute the fingerprint of a single raw record of a database.
+    """
+    digest = _RecordDigester(tcd)
+    if rec.record_type != _libtcd.SUBORDINATE_STATION:
+        return digest(rec)
+    i = rec.reference_station
+    refstation = b''
+    if i >= 0:
+        with tcd._reading() as reader:
+            refrec = reader._get_record(i)
+        if refrec is not None:
+            refstation = digest(refrec)
+    return _with_refstation(digest(rec), refstation)
+
+
+def duplicates(tcd):
+    """ Find stations with identical contents.
+
+    Returns a list of lists of the record numbers of stations which
+    have the same fingerprint.
+
+    """
+    groups = OrderedDict()
+    for i, fingerprint in enumerate(tcd.fingerprints()):
+        groups.setdefault(fingerprint, []).append(i)
+    return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+""" Opt-in instrumentation of libtcd calls and lock contention.
+
+When enabled (see :func:`enable`), this keeps:
+
+- a count and timing histogram for every libtcd function (everything
+  declared in :mod:`libtcd._libtcd`),
+- timing histograms of the time spent waiting for, and holding, the
+  global lock which serializes access to libtcd,
+- a timing histogram of ``Tcd._make_current`` (which reopens the
+  database, when libtcd has a different one open), and the number of
+  reopens,
+- the number of records decoded (and a histogram of the time taken to
+  decode each), and of the attributes of lazily unpacked stations
+  decoded on first access.
+
+Instrumentation works by replacing the module-level functions of
+:mod:`libtcd._libtcd`, the lock in :mod:`libtcd.api`, and a few
+methods with wrappers.  Nothing is wrapped while it is disabled, so it
+costs nothing then.
+
+:func:`snapshot` returns the current metrics as a ``dict``.  Functions
+registered with :func:`add_exporter` are called with a snapshot by
+:func:`export`; use these to feed an external metrics system.
+
+"""
+from __future__ import absolute_import
+
+from functools import wraps
+from threading import Lock
+import time
+
+from six.moves import range
+
+from . import _libtcd
+from . import api
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+#: The upper bounds (in seconds) of the histogram buckets.  There is
+#: also a final bucket for times exceeding the last bound.
+BUCKET_BOUNDS = tuple(1e-6 * 2 ** n for n in range(0, 24, 2))
+
+
+class Histogram(object):
+    """ A histogram of durations, with power-of-four buckets.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        for i, bound in enumerate(BUCKET_BOUNDS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(BUCKET_BOUNDS)
+        self.buckets[i] += 1
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': list(self.buckets),
+            }
+
+
+_metrics_lock = Lock()
+_histograms = {}                # (kind, name) -> Histogram
+_reopen_base = 0                # api.get_reopen_count() at reset
+_exporters = []
+
+
+def _observe(kind, name, seconds):
+    key = kind, name
+    with _metrics_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+def _timed(kind, name, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = _clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _observe(kind, name, _clock() - start)
+    wrapper._instrumented = func
+    return wrapper
+
+
+class _InstrumentedLock(object):
+    """ A wrapper around a lock, which times waits and holds.
+    """
+    def __init__(self, lock):
+        self._instrumented = lock
+        self._acquired_at = None
+
+    def acquire(self, blocking=True):
+        start = _clock()
+        acquired = self._instrumented.acquire(blocking)
+        if acquired:
+            now = _clock()
+            _observe('lock', 'wait', now - start)
+            self._acquired_at = now
+        return acquired
+
+    def release(self):
+        # Only the thread holding the lock touches _acquired_at
+        acquired_at, self._acquired_at = self._acquired_at, None
+        self._instrumented.release()
+        if acquired_at is not None:
+            _observe('lock', 'hold', _clock() - acquired_at)
+
+    def locked(self):
+        return self._instrumented.locked()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_typ, exc_val, exc_tb):
+        self.release()
+
+
+# The instrumented methods: (class, method name, histogram key)
+_METHODS = [
+    (api.Tcd, '_make_current', ('tcd', 'make_current')),
+    (api._TcdBase, '_unpack_record', ('decode', 'record')),
+    (api.TcdHeaders, '_unpack_record', ('decode', 'header')),
+    (api._lazy_attr, '__get__', ('decode', 'attribute')),
+    ]
+
+_enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    """ Start collecting metrics.
+    """
+    global _enabled
+    with _metrics_lock:
+        if _enabled:
+            return
+        _enabled = True
+    for name in _libtcd._declared:
+        func = getattr(_libtcd, name)
+        setattr(_libtcd, name, _timed('libtcd', name, func))
+    api._lock = _InstrumentedLock(api._lock)
+    for cls, name, key in _METHODS:
+        setattr(cls, name, _timed(key[0], key[1], cls.__dict__[name]))
+
+
+def disable():
+    """ Stop collecting metrics.
+
+    The metrics collected so far are kept (see :func:`reset`.)
+
+    """
+    global _enabled
+    with _metrics_lock:
+        if not _enabled:
+            return
+        _enabled = False
+    for name in _libtcd._declared:
+        _unwrap(_libtcd, name)
+    _unwrap(api, '_lock')
+    for cls, name, key in _METHODS:
+        if hasattr(cls.__dict__[name], '_instrumented'):
+            setattr(cls, name, cls.__dict__[name]._instrumented)
+
+
+def _unwrap(obj, name):
+    # Leave alone anything which has been replaced since we wrapped it
+    wrapped = getattr(getattr(obj, name), '_instrumented', None)
+    if wrapped is not None:
+        setattr(obj, name, wrapped)
+
+
+def reset():
+    """ Discard all metrics collected so far.
+    """
+    global _reopen_base
+    with _metrics_lock:
+        _histograms.clear()
+        _reopen_base = api.get_reopen_count()
+
+
+def snapshot():
+    """ Get the current metrics.
+
+    Returns a ``dict`` with keys:
+
+    ``libtcd``
+        a ``dict`` mapping libtcd function names to histogram
+        snapshots (``dict``\\s with ``count``, ``total``, ``min``,
+        ``max`` and ``buckets`` — see :data:`BUCKET_BOUNDS`.)
+
+    ``lock``
+        histogram snapshots for ``wait`` and ``hold`` times.
+
+    ``tcd``
+        a histogram snapshot for ``make_current``.
+
+    ``decode``
+        histogram snapshots for decoding ``record``\\s (stations),
+        ``header``\\s and the ``attribute``\\s of lazily unpacked
+        stations.
+
+    ``reopens``
+        the number of database reopens.
+
+    ``records_decoded``
+        the total number of records (and headers) decoded.
+
+    """
+    with _metrics_lock:
+        metrics = dict((kind, {}) for kind in ('libtcd', 'lock', 'tcd',
+                                               'decode'))
+        for (kind, name), histogram in _histograms.items():
+            metrics.setdefault(kind, {})[name] = histogram.snapshot()
+        metrics['reopens'] = api.get_reopen_count() - _reopen_base
+    metrics['records_decoded'] = sum(
+        metrics['decode'][name]['count']
+        for name in ('record', 'header') if name in metrics['decode'])
+    return metrics
+
+
+def add_exporter(exporter):
+    """ Register a function to be called with snapshots by :func:`export`.
+    """
+    _exporters.append(exporter)
+
+
+def remove_exporter(exporter):
+    _exporters.remove(exporter)
+
+
+def export():
+    """ Pass a :func:`snapshot` to each registered exporter.
+    """
+    metrics = snapshot()
+    for exporter in list(_exporters):
+        exporter(metrics)
+    return metrics
+
+reset()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+""" Decode TCD files in parallel, using a pool of processes.
+
+libtcd can only have one database open per process, so a single
+process can only use one core for decoding.  :class:`ParallelTcd`
+shards the records of a file into ranges, which are decoded by a
+:mod:`multiprocessing` pool.  Each worker process opens the file
+itself, with its own instance of libtcd.
+
+Workers return stations in a compact, picklable form: the attribute
+values of each station, with coefficients given by constituent index
+and reference stations by record number.  These are rebuilt into
+stations in the parent process.  Coefficients refer to the parent's
+:attr:`ParallelTcd.constituents`, and subordinate stations which refer
+to the same reference station share a single instance of it.
+
+"""
+from __future__ import absolute_import
+
+import multiprocessing
+
+from six.moves import range, zip
+
+from . import _libtcd
+from .api import (
+    Coefficient,
+    InvalidTcdFile,
+    ReferenceStation,
+    SubordinateStation,
+    Tcd,
+    _coefficients,
+    _reference_station,
+    )
+from .compat import OrderedDict
+from .util import LRUCache
+
+_STATION_CLASSES = {
+    _libtcd.REFERENCE_STATION: ReferenceStation,
+    _libtcd.SUBORDINATE_STATION: SubordinateStation,
+    }
+
+# Databases opened by this (worker) process: (tcd_class, filename) -> tcd
+_worker_databases = {}
+
+
+def _worker_database(tcd_class, filename):
+    key = tcd_class, filename
+    tcd = _worker_databases.get(key)
+    if tcd is None:
+        tcd = _worker_databases[key] = tcd_class.open(filename)
+    return tcd
+
+
+# Record buffers, reused by each shard decoded in this (worker) process:
+# record_class -> list of records
+_worker_record_buffers = {}
+
+
+def _worker_buffers(record_class, n):
+    buffers = _worker_record_buffers.setdefault(record_class, [])
+    while len(buffers) < n:
+        buffers.append(record_class())
+    return buffers
+
+
+def _station_state(tcd, rec):
+    """ Unpack a record to a list of ``(attribute, value)`` pairs.
+
+    This is like ``StationHeader._unpack``, except that coefficients
+    are unpacked to ``(constituent_index, amplitude, epoch)`` triples,
+    and reference stations are left as record numbers.
+
+    """
+    station_class = _STATION_CLASSES.get(rec.record_type)
+    if station_class is None:
+        tcd._unpack_record(rec)         # raises InvalidTcdFile
+    n_constituents = len(tcd.constituents)
+    state = []
+    for descriptor in station_class._PACKED_ATTRS:
+        if isinstance(descriptor, _coefficients):
+            coeffs = [(i, amplitude, epoch)
+                      for i, amplitude, epoch in zip(range(n_constituents),
+                                                     rec.amplitude,
+                                                     rec.epoch)
+                      if amplitude != 0.0]
+            state.append((descriptor.name, coeffs))
+        elif isinstance(descriptor, _reference_station):
+            i = getattr(rec, descriptor.packed_name)
+            if i == descriptor.null_value:
+                i = None
+            state.append((descriptor.name, i))
+        else:
+            state.extend(descriptor.unpack(tcd, rec))
+    return station_class, state
+
+
+def _decode_records(args):
+    """ Worker: decode a range of records.
+
+    Returns ``(names, rows)``.  ``names`` maps record type to a tuple
+    of attribute names.  ``rows`` is a list of ``(record_type,
+    values)``, one per record, where ``values`` is a tuple of attribute
+    values in the order given by ``names``.
+
+    """
+    tcd_class, filename, start, stop = args
+    tcd = _worker_database(tcd_class, filename)
+    buffers = _worker_buffers(tcd._record_class, stop - start)
+    with tcd._reading() as reader:
+        records = reader._read_chunk(start, stop - start, buffers)
+    names = {}
+    rows = []
+    for rec in records:
+        station_class, state = _station_state(tcd, rec)
+        record_type = rec.record_type
+        attrs, values = zip(*state)
+        if record_type not in names:
+            names[record_type] = attrs
+        elif names[record_type] != attrs:   # pragma: NO COVER
+            raise AssertionError("Inconsistent station attributes")
+        rows.append((record_type, values))
+    return names, rows
+
+
+def _describe_database(args):
+    """ Worker: get the length and constituents of a database.
+    """
+    tcd_class, filename = args
+    tcd = _worker_database(tcd_class, filename)
+    return len(tcd), list(tcd.constituents.values())
+
+
+class ParallelTcd(object):
+    """ A read-only database, decoded by a pool of worker processes.
+
+    ``processes`` is the number of worker processes (by default, the
+    number of CPUs.)  Records are decoded in shards of ``shard_size``
+    records.  Each worker reads the file using ``tcd_class`` (by
+    default :class:`~libtcd.api.Tcd`; any class with an ``open``
+    classmethod and the ``Tcd`` read API, e.g.
+    :class:`~libtcd.tcdfile.MmapTcd`, will do.)
+
+    Stations are rebuilt in the parent process as
+    :class:`~libtcd.api.ReferenceStation`\\s and
+    :class:`~libtcd.api.SubordinateStation`\\s.
+
+    """
+    #: The maximum number of reference stations to keep (beyond those
+    #: decoded in the current shard) for use by subordinate stations.
+    refstation_cache_size = 256
+
+    def __init__(self, filename, processes=None, shard_size=256,
+                 tcd_class=Tcd):
+        if shard_size < 1:
+            raise ValueError("shard_size must be positive")
+        self.filename = filename
+        self.shard_size = shard_size
+        self.tcd_class = tcd_class
+        self._pool = multiprocessing.Pool(processes)
+        try:
+            self._len, constituents = self._pool.apply(
+                _describe_database, ((tcd_class, filename),))
+        except:
+            self.close()
+            raise
+        self.constituents = OrderedDict((c.name, c) for c in constituents)
+        self._constituents_by_index = constituents
+        self._refstations = LRUCache(self.refstation_cache_size)
+
+    def close(self):
+        """ Shut down the worker processes.
+        """
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_typ, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._len
+
+    def _shards(self, start, stop):
+        for i in range(start, stop, self.shard_size):
+            yield (self.tcd_class, self.filename,
+                   i, min(i + self.shard_size, stop))
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def iter_records(self, start=0, stop=None):
+        """ Iterate over the stations in a range of records.
+
+        The shards are decoded in parallel.  Stations are yielded in
+        record order.
+
+        """
+        if stop is None or stop > len(self):
+            stop = len(self)
+        results = self._pool.imap(_decode_records, self._shards(start, stop))
+        for names, rows in results:
+            for station in self._rebuild(names, rows):
+                yield station
+
+    def decode_all(self):
+        """ Decode all records.  Returns a list of stations.
+        """
+        return list(self.iter_records())
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        names, rows = self._pool.apply(
+            _decode_records, ((self.tcd_class, self.filename, i, i + 1),))
+        station, = self._rebuild(names, rows)
+        return station
+
+    def _rebuild(self, names, rows):
+        stations = []
+        refstations = {}
+        for record_type, values in rows:
+            station_class = _STATION_CLASSES[record_type]
+            station = station_class.__new__(station_class)
+            station.__dict__.update(zip(names[record_type], values))
+            if record_type == _libtcd.REFERENCE_STATION:
+                station.coefficients = [
+                    Coefficient(amplitude, epoch,
+                                self._constituents_by_index[i])
+                    for i, amplitude, epoch in station.coefficients]
+                refstations[station.record_number] = station
+                self._refstations[station.record_number] = station
+            stations.append(station)
+        for station in stations:
+            if isinstance(station, SubordinateStation):
+                i = station.reference_station
+                if i is not None:
+                    refstation = refstations.get(i)
+                    if refstation is None:
+                        refstation = self._get_refstation(i)
+                    station.reference_station = refstation
+        return stations
+
+    def _get_refstation(self, i):
+        refstation = self._refstations.get(i)
+        if refstation is None:
+            refstation = self[i]        # caches it
+            if not isinstance(refstation, ReferenceStation):
+                raise InvalidTcdFile("Reference station has bad record_type")
+        return refstation
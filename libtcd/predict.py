@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+""" Harmonic tide prediction.
+
+This module requires numpy.
+
+The predicted height (or current) at time ``t`` is computed as::
+
+    datum_offset + sum(f[i] * A[i] * cos(speed[i] * (t - t0) + V0u[i] - g[i]))
+
+where, for each constituent ``i``, ``A[i]`` is the amplitude, ``f[i]``
+the node factor and ``V0u[i]`` the equilibrium argument for the year
+containing ``t``, ``t0`` is the start of that year (UTC), and ``g[i]``
+is the station's epoch, corrected from the meridian of the station's
+``zone_offset`` to Greenwich.
+
+"""
+from __future__ import absolute_import
+
+import calendar
+from collections import namedtuple
+
+import numpy
+
+from .util import timedelta_total_minutes
+
+_EPOCH = numpy.datetime64(0, 's')
+
+#: Times (in seconds since the epoch), heights, and a boolean array which
+#: is true for highs and false for lows.
+Extrema = namedtuple('Extrema', ['times', 'heights', 'is_high'])
+
+
+def as_seconds(times):
+    """ Convert times to (floating point) seconds since the POSIX epoch.
+
+    ``times`` may be a scalar or an array of: numbers (which are taken
+    to be POSIX timestamps), ``numpy.datetime64`` values (taken to be
+    UTC), or :class:`datetime.datetime` instances.  Naive datetimes are
+    taken to be UTC.
+
+    """
+    times = numpy.asarray(times)
+    if times.dtype.kind == 'M':
+        return (times - _EPOCH) / numpy.timedelta64(1, 's')
+    elif times.dtype.kind == 'O':
+        seconds = [calendar.timegm(dt.utctimetuple()) + dt.microsecond * 1e-6
+                   for dt in times.ravel()]
+        return numpy.array(seconds, dtype=numpy.float64).reshape(times.shape)
+    return times.astype(numpy.float64)
+
+
+def _split_years(seconds):
+    # Compute the year of each time and the start of that year (in
+    # seconds since the epoch.)
+    years = numpy.floor(seconds).astype(numpy.int64) \
+        .astype('datetime64[s]').astype('datetime64[Y]')
+    year_starts = years.astype('datetime64[s]').astype(numpy.int64)
+    return years.astype(numpy.int64) + 1970, year_starts
+
+
+def _is_evenly_spaced(hours):
+    if len(hours) < 3:
+        return False
+    steps = numpy.diff(hours)
+    step = steps[0]
+    return step > 0 and numpy.allclose(steps, step, rtol=0, atol=1e-9)
+
+
+class Harmonics(object):
+    """ The harmonic constants of a reference station, in array form.
+
+    ``speeds`` (degrees per hour), ``amplitudes`` and ``epochs``
+    (degrees) are length-``C`` vectors, one entry per constituent.
+    ``equilibriums`` (degrees) and ``node_factors`` are ``C x Y``
+    matrices giving the equilibrium arguments and node factors for
+    the ``Y`` years starting with ``start_year``.  ``zone_offset``
+    is the station's meridian, in hours east of Greenwich.
+
+    If ``hydraulic`` is true, the station is a hydraulic current
+    station (with units of knots squared) and the square root of the
+    harmonic sum (with the sign preserved) is returned.
+
+    """
+    #: Evenly spaced times are evaluated in blocks of this many samples.
+    block_size = 256
+
+    #: Unevenly spaced times are evaluated in chunks of this many samples.
+    chunk_size = 32768
+
+    def __init__(self, speeds, amplitudes, epochs,
+                 start_year, equilibriums, node_factors,
+                 datum_offset=0.0, zone_offset=0.0, hydraulic=False):
+        self.speeds = numpy.asarray(speeds, dtype=numpy.float64)
+        self.amplitudes = numpy.asarray(amplitudes, dtype=numpy.float64)
+        self.epochs = numpy.asarray(epochs, dtype=numpy.float64)
+        self.start_year = start_year
+        self.equilibriums = self._as_table(equilibriums)
+        self.node_factors = self._as_table(node_factors)
+        self.datum_offset = datum_offset
+        self.zone_offset = zone_offset
+        self.hydraulic = hydraulic
+
+        self._speeds_rad = numpy.radians(self.speeds)
+        # Epochs, corrected to Greenwich
+        self._phases = self.epochs - self.speeds * zone_offset
+
+    def _as_table(self, values):
+        table = numpy.asarray(values, dtype=numpy.float64)
+        if table.size == 0:
+            return table.reshape(len(self.speeds), 0)
+        return table.reshape(len(self.speeds), -1)
+
+    @property
+    def end_year(self):
+        return self.start_year + self.equilibriums.shape[1]
+
+    @classmethod
+    def from_station(cls, station, constituents=None):
+        """ Construct from a :class:`~libtcd.api.ReferenceStation`.
+
+        If given, ``constituents`` is a mapping of name to
+        :class:`~libtcd.api.Constituent` whose node factors are used in
+        place of the station's own.  (See
+        :func:`libtcd.astro.extend_constituents`.)
+
+        """
+        coefficients = [c for c in station.coefficients if c.amplitude != 0]
+        if constituents is None:
+            constituents = [c.constituent for c in coefficients]
+        else:
+            constituents = [constituents[c.constituent.name]
+                            for c in coefficients]
+        if constituents:
+            start_year = max(c.node_factors.start_year for c in constituents)
+            end_year = min(c.node_factors.end_year for c in constituents)
+        else:
+            start_year = end_year = 0
+        years = range(start_year, end_year)
+        equilibriums = [[c.node_factors[year].equilibrium for year in years]
+                        for c in constituents]
+        node_factors = [[c.node_factors[year].node_factor for year in years]
+                        for c in constituents]
+        zone_offset = station.zone_offset
+        return cls(
+            speeds=[c.speed for c in constituents],
+            amplitudes=[c.amplitude for c in coefficients],
+            epochs=[c.epoch for c in coefficients],
+            start_year=start_year,
+            equilibriums=equilibriums,
+            node_factors=node_factors,
+            datum_offset=station.datum_offset or 0.0,
+            zone_offset=(timedelta_total_minutes(zone_offset) / 60.0
+                         if zone_offset is not None else 0.0),
+            hydraulic=station.level_units == u'knots^2')
+
+    def _year_terms(self, years):
+        """ Compute amplitudes and phases (in radians) for given years.
+
+        Returns two ``C x len(years)`` matrices.
+        """
+        i = numpy.asarray(years) - self.start_year
+        if not len(self.speeds):
+            empty = numpy.zeros((0, len(i)))
+            return empty, empty
+        if numpy.any(i < 0) or numpy.any(i >= self.equilibriums.shape[1]):
+            raise ValueError(
+                "Times out of the range of years (%d-%d) covered by the "
+                "node factors" % (self.start_year, self.end_year - 1))
+        amplitudes = self.amplitudes[:, None] * self.node_factors[:, i]
+        phases = numpy.radians(self.equilibriums[:, i] - self._phases[:, None])
+        return amplitudes, phases
+
+    def predict(self, times, derivative=0):
+        """ Predict the tide at the given times.
+
+        ``times`` may be anything accepted by :func:`as_seconds`.
+        Returns an array of heights (in the station's level units) of the
+        same shape as ``times``.
+
+        If ``derivative`` is non-zero, that time derivative (per hour) of
+        the harmonic sum is computed instead.  (For hydraulic current
+        stations, this is the derivative of the sum before the square
+        root is taken.)
+
+        """
+        seconds = as_seconds(times)
+        shape = seconds.shape
+        seconds = seconds.ravel()
+        heights = numpy.zeros(seconds.shape, dtype=numpy.float64)
+
+        years, year_starts = _split_years(seconds)
+        unique_years, inverse = numpy.unique(years, return_inverse=True)
+        inverse = inverse.ravel()
+        amplitudes, phases = self._year_terms(unique_years)
+        if derivative:
+            # d^k/dt^k cos(w t + p) = w^k cos(w t + p + k pi/2)
+            amplitudes = amplitudes * self._speeds_rad[:, None] ** derivative
+            phases = phases + derivative * (numpy.pi / 2)
+        for k in range(len(unique_years)):
+            which = numpy.flatnonzero(inverse == k)
+            hours = (seconds[which] - year_starts[which]) / 3600.0
+            heights[which] = self._harmonic_sum(
+                hours, amplitudes[:, k], phases[:, k])
+
+        if not derivative:
+            heights += self.datum_offset
+            if self.hydraulic:
+                heights = numpy.sign(heights) * numpy.sqrt(numpy.abs(heights))
+        return heights.reshape(shape)
+
+    def extrema(self, start, end, step=600.0, tolerance=1.0):
+        """ Find the highs and lows between ``start`` and ``end``.
+
+        The time derivative of the harmonic sum is evaluated on a grid
+        with a spacing of ``step`` seconds.  Each sign change of the
+        derivative brackets an extremum, which is then located (to within
+        ``tolerance`` seconds) by bisection.  All brackets are refined
+        simultaneously.
+
+        Returns an :class:`Extrema`.
+
+        """
+        start = float(as_seconds(start))
+        end = float(as_seconds(end))
+        n_steps = max(int(numpy.ceil((end - start) / step)), 1)
+        grid = start + numpy.arange(n_steps + 1) * step
+        rates = self.predict(grid, derivative=1)
+
+        highs = (rates[:-1] > 0) & (rates[1:] <= 0)
+        lows = (rates[:-1] < 0) & (rates[1:] >= 0)
+        k = numpy.flatnonzero(highs | lows)
+        is_high = highs[k]
+        lo = grid[k]
+        hi = grid[k + 1]
+        n_iter = int(numpy.ceil(numpy.log2(step / tolerance))) if k.size else 0
+        for i in range(max(n_iter, 0)):
+            mid = (lo + hi) / 2
+            rate = self.predict(mid, derivative=1)
+            # Before a high the tide is rising; before a low it is falling
+            before = numpy.where(is_high, rate > 0, rate < 0)
+            lo = numpy.where(before, mid, lo)
+            hi = numpy.where(before, hi, mid)
+        times = (lo + hi) / 2
+
+        keep = (times >= start) & (times <= end)
+        times = times[keep]
+        return Extrema(times, self.predict(times), is_high[keep])
+
+    def _harmonic_sum(self, hours, amplitudes, phases):
+        if not len(amplitudes):
+            return numpy.zeros(len(hours))
+        if _is_evenly_spaced(hours):
+            return self._harmonic_sum_even(hours, amplitudes, phases)
+        speeds = self._speeds_rad
+        result = numpy.empty(len(hours))
+        for start in range(0, len(hours), self.chunk_size):
+            stop = start + self.chunk_size
+            args = numpy.multiply.outer(speeds, hours[start:stop])
+            args += phases[:, None]
+            numpy.cos(args, out=args)
+            result[start:stop] = amplitudes.dot(args)
+        return result
+
+    def _harmonic_sum_even(self, hours, amplitudes, phases):
+        # For evenly spaced times, the sum for each block of B samples is
+        # computed as the real part of the product of a (block x C)
+        # matrix of complex phasors, evaluated at the start of each
+        # block, with a (C x B) matrix of per-step phase rotations.
+        # This replaces one cosine per constituent per sample with
+        # (mostly) complex multiply-adds.
+        speeds = self._speeds_rad
+        n = len(hours)
+        step = hours[1] - hours[0]
+        block = min(self.block_size, n)
+        n_blocks = -(-n // block)
+        rotations = numpy.exp(
+            1j * numpy.multiply.outer(speeds, numpy.arange(block) * step))
+        block_starts = hours[0] + numpy.arange(n_blocks) * (block * step)
+        phasors = amplitudes * numpy.exp(
+            1j * (numpy.multiply.outer(block_starts, speeds) + phases))
+        return phasors.dot(rotations).real.ravel()[:n]
+
+
+def _offset_seconds(offset):
+    if offset is None:
+        return 0.0
+    return timedelta_total_minutes(offset) * 60.0
+
+
+def _is_subordinate(station):
+    return hasattr(station, 'reference_station')
+
+
+class SubordinateOffsets(object):
+    """ The offsets of a subordinate station, relative to its reference
+    station.
+
+    Times of highs (lows) are shifted by ``max_time_add``
+    (``min_time_add``) seconds; heights of highs (lows) are multiplied by
+    ``max_level_multiply`` (``min_level_multiply``) and then have
+    ``max_level_add`` (``min_level_add``) added to them.
+
+    """
+    def __init__(self, min_time_add=0.0, min_level_add=0.0,
+                 min_level_multiply=1.0,
+                 max_time_add=0.0, max_level_add=0.0,
+                 max_level_multiply=1.0):
+        self.min_time_add = min_time_add
+        self.min_level_add = min_level_add
+        self.min_level_multiply = min_level_multiply
+        self.max_time_add = max_time_add
+        self.max_level_add = max_level_add
+        self.max_level_multiply = max_level_multiply
+
+    @classmethod
+    def from_station(cls, station):
+        """ Construct from a :class:`~libtcd.api.SubordinateStation`.
+        """
+        return cls(
+            min_time_add=_offset_seconds(station.min_time_add),
+            min_level_add=station.min_level_add or 0.0,
+            min_level_multiply=station.min_level_multiply or 1.0,
+            max_time_add=_offset_seconds(station.max_time_add),
+            max_level_add=station.max_level_add or 0.0,
+            max_level_multiply=station.max_level_multiply or 1.0)
+
+    @property
+    def max_abs_time_add(self):
+        return max(abs(self.min_time_add), abs(self.max_time_add))
+
+    def apply(self, extrema):
+        """ Apply the offsets to the extrema of the reference station.
+
+        Returns the (time-ordered) :class:`Extrema` for the subordinate
+        station.
+
+        """
+        times, heights, is_high = extrema
+        times = times + numpy.where(
+            is_high, self.max_time_add, self.min_time_add)
+        heights = heights * numpy.where(
+            is_high, self.max_level_multiply, self.min_level_multiply)
+        heights += numpy.where(is_high, self.max_level_add, self.min_level_add)
+        order = numpy.argsort(times, kind='mergesort')
+        return Extrema(times[order], heights[order], is_high[order])
+
+
+def interpolate_extrema(extrema, times):
+    """ Interpolate a tide curve between successive extrema.
+
+    Between each pair of successive extrema, the tide is taken to follow
+    a half-cosine curve.  ``times`` may be anything accepted by
+    :func:`as_seconds`; they must all fall between the first and last
+    of the extrema.
+
+    """
+    seconds = as_seconds(times)
+    ext_times, ext_heights = extrema.times, extrema.heights
+    i = numpy.searchsorted(ext_times, seconds, side='right') - 1
+    # the final extremum itself is interpolated from the last interval
+    i = numpy.where(seconds == ext_times[-1:], len(ext_times) - 2, i)
+    if numpy.any(i < 0) or numpy.any(i >= len(ext_times) - 1):
+        raise ValueError("Times are not bracketed by the extrema")
+    t0 = ext_times[i]
+    t1 = ext_times[i + 1]
+    h0 = ext_heights[i]
+    h1 = ext_heights[i + 1]
+    return ((h0 + h1) / 2
+            + (h0 - h1) / 2 * numpy.cos(numpy.pi * (seconds - t0) / (t1 - t0)))
+
+# Padding (in seconds) added to the reference station's time span, beyond
+# any time offsets, so that the subordinate's times are bracketed by
+# extrema.  (The longest interval between extrema is somewhat over a day.)
+_EXTREMA_PADDING = 2 * 86400.0
+
+
+class _Predictor(object):
+    """ Predicts tides at many stations, sharing the work done for
+    reference stations among all their subordinate stations.
+    """
+    def __init__(self, step=600.0):
+        self.step = step
+        self._harmonics = {}            # id(refstation) -> (ref, Harmonics)
+        self._extrema = {}              # (id(refstation), span) -> Extrema
+
+    def harmonics(self, refstation):
+        key = id(refstation)
+        if key not in self._harmonics:
+            # Keep a reference to the station, so its id is not reused
+            self._harmonics[key] = (refstation,
+                                    Harmonics.from_station(refstation))
+        return self._harmonics[key][1]
+
+    def reference_extrema(self, refstation, start, end):
+        key = id(refstation), start, end
+        extrema = self._extrema.get(key)
+        if extrema is None:
+            extrema = self.harmonics(refstation).extrema(
+                start, end, step=self.step)
+            self._extrema[key] = extrema
+        return extrema
+
+    def subordinate_extrema(self, station, start, end, padding=None):
+        offsets = SubordinateOffsets.from_station(station)
+        if padding is None:
+            padding = offsets.max_abs_time_add + _EXTREMA_PADDING
+        extrema = offsets.apply(self.reference_extrema(
+            station.reference_station, start - padding, end + padding))
+        return extrema
+
+    def extrema(self, station, start, end, padding=None):
+        start = float(as_seconds(start))
+        end = float(as_seconds(end))
+        if not _is_subordinate(station):
+            return self.reference_extrema(station, start, end)
+        extrema = self.subordinate_extrema(station, start, end, padding)
+        keep = (extrema.times >= start) & (extrema.times <= end)
+        return Extrema(*(a[keep] for a in extrema))
+
+    def predict(self, station, times):
+        if not _is_subordinate(station):
+            return self.harmonics(station).predict(times)
+        seconds = as_seconds(times)
+        if seconds.size == 0:
+            return numpy.zeros(seconds.shape)
+        extrema = self.subordinate_extrema(
+            station, float(seconds.min()), float(seconds.max()))
+        return interpolate_extrema(extrema, seconds)
+
+
+def predict(station, times):
+    """ Predict the tide at a station.
+
+    ``times`` may be anything accepted by :func:`as_seconds`.  Returns
+    an array of heights (in the station's level units, including the
+    station's datum offset), with the same shape as ``times``.
+
+    For a reference station, the harmonic sum is evaluated directly.
+    For a subordinate station, the highs and lows of its reference
+    station are found (see :meth:`Harmonics.extrema`), the subordinate
+    station's offsets are applied to them, and the tide is interpolated
+    between the corrected highs and lows.  (Slack water offsets,
+    ``flood_begins`` and ``ebb_begins``, are not used.)
+
+    """
+    return _Predictor().predict(station, times)
+
+
+def extrema(station, start, end, step=600.0):
+    """ Find the highs and lows at a station between ``start`` and ``end``.
+
+    ``start`` and ``end`` may be anything accepted by :func:`as_seconds`.
+    Returns an :class:`Extrema`.
+
+    """
+    return _Predictor(step).extrema(station, start, end)
+
+
+def tide_tables(stations, start, end, step=600.0):
+    """ Find the highs and lows at many stations.
+
+    This is equivalent to ``[extrema(s, start, end) for s in stations]``,
+    except that the highs and lows of each reference station are only
+    computed once, no matter how many of the subordinate stations refer
+    to it.  (Subordinate stations share reference stations by identity,
+    as they do when read from a :class:`~libtcd.api.Tcd`.)
+
+    """
+    stations = list(stations)
+    offsets = [SubordinateOffsets.from_station(station)
+               for station in stations if _is_subordinate(station)]
+    padding = max([o.max_abs_time_add for o in offsets] + [0.0]) \
+        + _EXTREMA_PADDING
+    predictor = _Predictor(step)
+    return [predictor.extrema(station, start, end, padding)
+            for station in stations]
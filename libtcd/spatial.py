@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+""" Spatial indexing of station locations.
+
+Station locations are indexed by their positions on the unit sphere,
+using a k-d tree.  Since the chord distance between two points on the
+sphere increases monotonically with their great-circle distance,
+nearest-neighbor and radius queries on the tree give exact
+great-circle results.
+
+"""
+from __future__ import absolute_import
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import heapq
+from math import asin, cos, pi, radians, sin, sqrt
+
+#: Mean radius of the earth, in kilometers
+EARTH_RADIUS = 6371.0088
+
+Neighbor = namedtuple('Neighbor', ['record_number', 'distance'])
+
+
+def great_circle_distance(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS):
+    """ Compute the great-circle distance between two points.
+
+    The coordinates are in degrees.  The distance is returned in the
+    same units as ``radius`` (by default, kilometers.)
+
+    """
+    phi1 = radians(lat1)
+    phi2 = radians(lat2)
+    hav = (sin((phi2 - phi1) / 2) ** 2
+           + cos(phi1) * cos(phi2) * sin(radians(lon2 - lon1) / 2) ** 2)
+    return 2 * radius * asin(min(1.0, sqrt(hav)))
+
+
+def _to_xyz(latitude, longitude):
+    phi = radians(latitude)
+    lam = radians(longitude)
+    cos_phi = cos(phi)
+    return (cos_phi * cos(lam), cos_phi * sin(lam), sin(phi))
+
+
+def _normalize_longitude(longitude):
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+class SpatialIndex(object):
+    """ An index of station locations.
+
+    ``locations`` should be an iterable of ``(record_number, latitude,
+    longitude)`` triples.  Entries whose latitude or longitude is
+    ``None`` are ignored.
+
+    All distances are in the units of ``radius`` (by default,
+    kilometers.)
+
+    """
+    leaf_size = 8
+
+    def __init__(self, locations, radius=EARTH_RADIUS):
+        self.radius = radius
+        points = []
+        for record_number, latitude, longitude in locations:
+            if latitude is None or longitude is None:
+                continue
+            longitude = _normalize_longitude(longitude)
+            points.append(
+                _to_xyz(latitude, longitude)
+                + (record_number, latitude, longitude))
+        self._points = points
+        self._tree = self._build(0, len(points))
+
+        by_latitude = sorted((p[4], p[5], p[3]) for p in points)
+        self._latitudes = [lat for lat, lon, rn in by_latitude]
+        self._by_latitude = by_latitude
+
+    def __len__(self):
+        return len(self._points)
+
+    def _build(self, lo, hi):
+        # Build a k-d tree over self._points[lo:hi], partitioning the
+        # points in place.  Leaves are ``(None, lo, hi)``; internal
+        # nodes are ``(axis, split, left, right)``.
+        points = self._points
+        if hi - lo <= self.leaf_size:
+            return (None, lo, hi)
+        subset = points[lo:hi]
+        spreads = [max(p[axis] for p in subset) - min(p[axis] for p in subset)
+                   for axis in range(3)]
+        axis = spreads.index(max(spreads))
+        subset.sort(key=lambda p: p[axis])
+        points[lo:hi] = subset
+        mid = (lo + hi) // 2
+        split = points[mid][axis]
+        return (axis, split, self._build(lo, mid), self._build(mid, hi))
+
+    def _chord(self, distance):
+        # The chord length (on the unit sphere) corresponding to a
+        # great-circle distance.
+        angle = float(distance) / self.radius
+        if angle >= pi:
+            return 2.0
+        return 2 * sin(angle / 2)
+
+    def _distance(self, chord2):
+        # The great-circle distance corresponding to a squared chord length
+        return 2 * self.radius * asin(min(1.0, sqrt(chord2) / 2))
+
+    def nearest(self, latitude, longitude, k=1):
+        """ Find the ``k`` stations nearest to the given point.
+
+        Returns a list of :class:`Neighbor`\\s, ordered by increasing
+        distance.
+
+        """
+        if k < 1:
+            return []
+        q = _to_xyz(latitude, longitude)
+        points = self._points
+        heap = []               # max-heap (by negated distance) of size k
+
+        def search(node):
+            axis = node[0]
+            if axis is None:
+                for i in range(node[1], node[2]):
+                    p = points[i]
+                    dx = p[0] - q[0]
+                    dy = p[1] - q[1]
+                    dz = p[2] - q[2]
+                    d2 = dx * dx + dy * dy + dz * dz
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d2, p[3]))
+                    elif d2 < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d2, p[3]))
+                return
+            delta = q[axis] - node[1]
+            near, far = (node[2], node[3]) if delta < 0 else (node[3], node[2])
+            search(near)
+            if len(heap) < k or delta * delta < -heap[0][0]:
+                search(far)
+
+        search(self._tree)
+        return [Neighbor(record_number, self._distance(-neg_d2))
+                for neg_d2, record_number in sorted(heap, reverse=True)]
+
+    def within_radius(self, latitude, longitude, distance):
+        """ Find all stations within ``distance`` of the given point.
+
+        Returns a list of :class:`Neighbor`\\s, ordered by increasing
+        distance.
+
+        """
+        q = _to_xyz(latitude, longitude)
+        chord = self._chord(distance)
+        max_d2 = chord * chord
+        points = self._points
+        found = []
+
+        def search(node):
+            axis = node[0]
+            if axis is None:
+                for i in range(node[1], node[2]):
+                    p = points[i]
+                    dx = p[0] - q[0]
+                    dy = p[1] - q[1]
+                    dz = p[2] - q[2]
+                    d2 = dx * dx + dy * dy + dz * dz
+                    if d2 <= max_d2:
+                        found.append((d2, p[3]))
+                return
+            delta = q[axis] - node[1]
+            if delta < 0 or delta * delta <= max_d2:
+                search(node[2])
+            if delta >= 0 or delta * delta <= max_d2:
+                search(node[3])
+
+        search(self._tree)
+        found.sort()
+        return [Neighbor(record_number, self._distance(d2))
+                for d2, record_number in found]
+
+    def within_bbox(self, south, west, north, east):
+        """ Find all stations within a latitude/longitude bounding box.
+
+        The box includes its edges.  If ``west`` is greater than
+        ``east``, the box is taken to cross the antimeridian.
+
+        Returns a list of record numbers in increasing order.
+
+        """
+        if not -180.0 <= west <= 180.0:
+            west = _normalize_longitude(west)
+        if not -180.0 <= east <= 180.0:
+            east = _normalize_longitude(east)
+        lo = bisect_left(self._latitudes, south)
+        hi = bisect_right(self._latitudes, north)
+        candidates = self._by_latitude[lo:hi]
+        if west <= east:
+            found = [rn for lat, lon, rn in candidates if west <= lon <= east]
+        else:
+            found = [rn for lat, lon, rn in candidates
+                     if lon >= west or lon <= east]
+        found.sort()
+        return found
@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+""" A pure-Python, read-only reader for TCD files.
+
+The (version 2) TCD file format is parsed directly from a memory map
+of the file, without using libtcd.  Since libtcd is not involved, there
+is no global state: any number of files may be open at once, and they
+may be read concurrently from any number of threads.
+
+The file consists of an ASCII header (``[KEY] = value`` lines,
+padded to ``[HEADER SIZE]`` bytes), a four byte checksum, the string
+tables (fixed-size, NUL-padded entries), the bit-packed constituent
+speeds, equilibrium arguments and node factors, and finally the
+bit-packed, variable-length station records.  All bit-packed values
+are big-endian, and start at arbitrary bit offsets.
+
+"""
+from __future__ import absolute_import
+
+from array import array
+from binascii import hexlify, unhexlify
+import mmap
+import re
+from threading import Lock
+
+from six import text_type
+from six.moves import range, zip
+
+from . import _libtcd
+from .api import (
+    ConstituentTables,
+    InvalidTcdFile,
+    TcdHeaders,
+    _StringTableCache,
+    _TcdBase,
+    _clear_record,
+    )
+from .util import reify
+
+_END_OF_HEADER = b'[END OF ASCII HEADER DATA]'
+_HEADER_LINE_RE = re.compile(br'^\[([^\]]+)\] = (.*?)\s*$', re.M)
+
+# The string tables, in file order: (table name, header key prefix,
+# whether the table is padded to 2**BITS entries)
+_STRING_TABLES = [
+    ('level_units', 'LEVEL UNIT', False),
+    ('dir_units', 'DIRECTION UNIT', False),
+    ('restriction', 'RESTRICTION', True),
+    ('tzfile', 'TZFILE', True),
+    ('country', 'COUNTRY', True),
+    ('datum', 'DATUM', True),
+    ('legalese', 'LEGALESE', True),
+    ]
+
+# Header keys giving the number of entries in each string table
+_TABLE_COUNT_KEYS = {
+    'level_units': 'LEVEL UNIT TYPES',
+    'dir_units': 'DIRECTION UNIT TYPES',
+    'restriction': 'RESTRICTION TYPES',
+    'tzfile': 'TZFILES',
+    'country': 'COUNTRIES',
+    'datum': 'DATUM TYPES',
+    'legalese': 'LEGALESE TYPES',
+    'constituent': 'CONSTITUENTS',
+    }
+
+
+def _unpack_bits(buf, pos, nbits):
+    """ Extract an unsigned ``nbits`` wide integer from ``buf``.
+
+    ``pos`` is the offset, in bits, of the most significant bit of the
+    value from the most significant bit of ``buf[0]``.
+
+    """
+    if nbits == 0:
+        return 0
+    start = pos >> 3
+    end = (pos + nbits + 7) >> 3
+    value = int(hexlify(buf[start:end]), 16)
+    return (value >> ((end << 3) - pos - nbits)) & ((1 << nbits) - 1)
+
+
+class _BitReader(object):
+    """ Sequential reader of bit-packed values.
+    """
+    def __init__(self, buf, pos=0):
+        self.buf = buf
+        self.pos = pos
+
+    def unsigned(self, nbits):
+        value = _unpack_bits(self.buf, self.pos, nbits)
+        self.pos += nbits
+        return value
+
+    def signed(self, nbits):
+        value = self.unsigned(nbits)
+        if value & (1 << (nbits - 1)):
+            value -= 1 << nbits
+        return value
+
+    def string(self, max_length):
+        """ Read a NUL-terminated string of (bit-packed) 8-bit characters.
+
+        The string is truncated to ``max_length - 1`` characters.
+
+        """
+        buf = self.buf
+        start, shift = divmod(self.pos, 8)
+        window = 64
+        while True:
+            raw = buf[start:start + window + 1]
+            if shift:
+                # Realign the window to the string's bit offset
+                nbytes = len(raw) - 1
+                value = int(hexlify(raw), 16) >> (8 - shift)
+                value &= (1 << (8 * nbytes)) - 1
+                hexdigits = '%0*x' % (2 * nbytes, value) if nbytes else ''
+                aligned = unhexlify(hexdigits.encode('ascii'))
+            else:
+                nbytes = len(raw)
+                aligned = raw
+            end = aligned.find(b'\0')
+            if end >= 0:
+                break
+            if start + len(raw) >= len(buf):
+                raise InvalidTcdFile("Unterminated string in record")
+            window *= 4
+        self.pos += 8 * (end + 1)
+        return aligned[:min(end, max_length - 1)]
+
+
+class _StringTable(object):
+    """ A table of fixed-size, NUL-padded strings.
+
+    The table is decoded when first accessed.
+
+    """
+    def __init__(self, buf, offset, size, count):
+        self.buf = buf
+        self.offset = offset
+        self.size = size
+        self.count = count
+
+    @reify
+    def strings(self):
+        buf = self.buf
+        size = self.size
+        return [buf[offset:offset + size].split(b'\0', 1)[0]
+                for offset in range(self.offset,
+                                    self.offset + self.count * size,
+                                    size)]
+
+    def get(self, i):
+        """ Get string ``i``.
+
+        Like libtcd, returns ``b'Unknown'`` if ``i`` is out of range.
+
+        """
+        if 0 <= i < self.count:
+            return self.strings[i]
+        return b'Unknown'
+
+    def find(self, s):
+        """ Find the index of string ``s``, or -1 if it is not found.
+        """
+        try:
+            return self.strings.index(s)
+        except ValueError:
+            return -1
+
+
+class TcdFile(object):
+    """ A memory-mapped TCD file.
+
+    Only the ASCII header is parsed when the file is opened.  The
+    string tables, the constituent tables and the record offsets are
+    decoded as they are needed.
+
+    """
+    def __init__(self, filename):
+        with open(filename, 'rb') as fp:
+            try:
+                self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise InvalidTcdFile("Empty file")
+        self.filename = filename
+        try:
+            self._parse_header()
+        except:
+            self.close()
+            raise
+        self._offsets = [self._records_offset]
+        self._offsets_lock = Lock()
+
+    def close(self):
+        self._mm.close()
+
+    def _parse_header(self):
+        mm = self._mm
+        end = mm.find(_END_OF_HEADER)
+        if end < 0:
+            raise InvalidTcdFile("Can not find end of ASCII header")
+        fields = dict(
+            (text_type(key, 'ascii'), value)
+            for key, value in _HEADER_LINE_RE.findall(mm[:end]))
+        self._fields = fields
+
+        if self._int('MAJOR REV') < 2:
+            raise InvalidTcdFile("Unsupported TCD version (%s)"
+                                 % self._int('MAJOR REV'))
+        if self._int('END OF FILE') > len(mm):
+            raise InvalidTcdFile("TCD file is truncated")
+        if 'LEGALESE BITS' not in fields:
+            # Older version 2 files have no legalese table, nor legalese
+            # field in their records.  Like libtcd, supply a table
+            # holding just "NULL".
+            fields.update({'LEGALESE BITS': b'0', 'LEGALESE TYPES': b'1'})
+            self._string_tables = {
+                'legalese': _StringTable(b'NULL\0', 0, 5, 1)}
+        else:
+            self._string_tables = {}
+
+        offset = self._int('HEADER SIZE') + 4   # skip the checksum
+        for table_name, prefix, padded in _STRING_TABLES:
+            if table_name in self._string_tables:
+                continue
+            size = self._int(prefix + ' SIZE')
+            if padded:
+                nslots = 1 << self._int(prefix + ' BITS')
+            else:
+                nslots = self._int(_TABLE_COUNT_KEYS[table_name])
+            count = self._int(_TABLE_COUNT_KEYS[table_name])
+            self._string_tables[table_name] = _StringTable(
+                mm, offset, size, count)
+            offset += nslots * size
+
+        n = self._int('CONSTITUENTS')
+        size = self._int('CONSTITUENT SIZE')
+        self._string_tables['constituent'] = _StringTable(
+            mm, offset, size, n)
+        offset += n * size
+
+        years = self._int('NUMBER OF YEARS')
+        self._speeds_offset = offset
+        offset += (n * self._int('SPEED BITS') + 7) // 8
+        self._equilibriums_offset = offset
+        offset += (n * years * self._int('EQUILIBRIUM BITS') + 7) // 8
+        self._node_factors_offset = offset
+        offset += (n * years * self._int('NODE BITS') + 7) // 8
+        self._records_offset = offset
+
+        header = self.header = _libtcd.DB_HEADER_PUBLIC()
+        header.version = fields.get('VERSION', b'')
+        header.major_rev = self._int('MAJOR REV')
+        header.minor_rev = self._int('MINOR REV')
+        header.last_modified = fields.get('LAST MODIFIED', b'')
+        header.number_of_records = self._int('NUMBER OF RECORDS')
+        header.start_year = self._int('START YEAR')
+        header.number_of_years = years
+        header.constituents = n
+        header.level_unit_types = self._int('LEVEL UNIT TYPES')
+        header.dir_unit_types = self._int('DIRECTION UNIT TYPES')
+        header.restriction_types = self._int('RESTRICTION TYPES')
+        header.datum_types = self._int('DATUM TYPES')
+        header.countries = self._int('COUNTRIES')
+        header.tzfiles = self._int('TZFILES')
+        header.legaleses = self._int('LEGALESE TYPES')
+
+    def _int(self, key):
+        try:
+            return int(self._fields[key])
+        except KeyError:
+            raise InvalidTcdFile("Missing header field [%s]" % key)
+        except ValueError:
+            raise InvalidTcdFile("Bad value for header field [%s]" % key)
+
+    def __len__(self):
+        return self.header.number_of_records
+
+    def get_string(self, table_name, i):
+        """ Get entry ``i`` of a string table (as a byte string.)
+
+        The table names are the same as those used by libtcd's
+        ``get_<table_name>`` functions (e.g. ``'country'``,
+        ``'dir_units'``, ``'constituent'``.)
+
+        """
+        return self._string_tables[table_name].get(i)
+
+    def get_strings(self, table_name):
+        """ Get all the entries of a string table (as byte strings.)
+        """
+        return self._string_tables[table_name].strings
+
+    def find_string(self, table_name, s):
+        """ Find a string in a string table.  Returns -1 if not found.
+        """
+        return self._string_tables[table_name].find(s)
+
+    @reify
+    def speeds(self):
+        """ The constituent speeds, in degrees per hour.
+        """
+        nbits = self._int('SPEED BITS')
+        offset = self._int('SPEED OFFSET')
+        scale = float(self._int('SPEED SCALE'))
+        buf = self._mm[self._speeds_offset:self._equilibriums_offset]
+        return array('d', [
+            (_unpack_bits(buf, i * nbits, nbits) + offset) / scale
+            for i in range(self.header.constituents)])
+
+    def _read_table(self, table_offset, prefix, i):
+        nbits = self._int(prefix + ' BITS')
+        offset = self._int(prefix + ' OFFSET')
+        scale = float(self._int(prefix + ' SCALE'))
+        years = self.header.number_of_years
+        if not 0 <= i < self.header.constituents:
+            raise IndexError(i)
+        pos = i * years * nbits
+        start = table_offset + (pos >> 3)
+        end = table_offset + ((pos + years * nbits + 7) >> 3)
+        buf = self._mm[start:end]
+        pos &= 7
+        return array('f', [
+            (_unpack_bits(buf, pos + j * nbits, nbits) + offset) / scale
+            for j in range(years)])
+
+    def get_equilibriums(self, i):
+        """ The yearly equilibrium arguments of constituent ``i``.
+        """
+        return self._read_table(self._equilibriums_offset, 'EQUILIBRIUM', i)
+
+    def get_node_factors(self, i):
+        """ The yearly node factors of constituent ``i``.
+        """
+        return self._read_table(self._node_factors_offset, 'NODE', i)
+
+    def _record_offset(self, i):
+        offsets = self._offsets
+        if i >= len(offsets):
+            nbits = self._int('RECORD SIZE BITS')
+            end_of_file = self._int('END OF FILE')
+            with self._offsets_lock:
+                while len(offsets) <= i:
+                    offset = offsets[-1]
+                    size = _unpack_bits(
+                        self._mm[offset:offset + (nbits + 7) // 8], 0, nbits)
+                    if size == 0 or offset + size > end_of_file:
+                        raise InvalidTcdFile("Bad record size (record %d)"
+                                             % (len(offsets) - 1))
+                    offsets.append(offset + size)
+        return offsets[i]
+
+    def _read_station_header(self, i, header):
+        if not 0 <= i < len(self):
+            return None
+        offset = self._record_offset(i)
+        nbits = self._int('RECORD SIZE BITS')
+        size = _unpack_bits(self._mm[offset:offset + 4], 0, nbits)
+        reader = _BitReader(self._mm[offset:offset + size], nbits)
+
+        header.record_number = i
+        header.record_size = size
+        header.record_type = reader.unsigned(self._int('RECORD TYPE BITS'))
+        header.latitude = (reader.signed(self._int('LATITUDE BITS'))
+                           / float(self._int('LATITUDE SCALE')))
+        header.longitude = (reader.signed(self._int('LONGITUDE BITS'))
+                            / float(self._int('LONGITUDE SCALE')))
+        header.tzfile = reader.unsigned(self._int('TZFILE BITS'))
+        header.name = reader.string(_libtcd.ONELINER_LENGTH)
+        header.reference_station = reader.signed(self._int('STATION BITS'))
+        return reader
+
+    def read_header(self, i, header=None):
+        """ Read the header of record ``i``.
+
+        Returns a ``TIDE_STATION_HEADER``, or ``None`` if there is no
+        such record.  If ``header`` is given, it is read into that.
+
+        """
+        if header is None:
+            header = _libtcd.TIDE_STATION_HEADER()
+        else:
+            _clear_record(header)
+        if self._read_station_header(i, header) is None:
+            return None
+        return header
+
+    def read_record(self, i, rec=None):
+        """ Read record ``i``.
+
+        Returns a ``TIDE_RECORD``, or ``None`` if there is no such record.
+        If ``rec`` is given, the record is read into that.
+
+        """
+        if rec is None:
+            rec = _libtcd.TIDE_RECORD()
+        else:
+            _clear_record(rec)
+        reader = self._read_station_header(i, rec.header)
+        if reader is None:
+            return None
+        unsigned = reader.unsigned
+        signed = reader.signed
+        string = reader.string
+        bits = self._int
+        oneliner = _libtcd.ONELINER_LENGTH
+        monologue = _libtcd.MONOLOGUE_LENGTH
+
+        rec.country = unsigned(bits('COUNTRY BITS'))
+        rec.source = string(oneliner)
+        rec.restriction = unsigned(bits('RESTRICTION BITS'))
+        rec.comments = string(monologue)
+        rec.notes = string(monologue)
+        rec.legalese = unsigned(bits('LEGALESE BITS'))
+        rec.station_id_context = string(oneliner)
+        rec.station_id = string(oneliner)
+        rec.date_imported = unsigned(bits('DATE BITS'))
+        rec.xfields = string(monologue)
+        rec.direction_units = unsigned(bits('DIRECTION UNIT BITS'))
+        rec.min_direction = unsigned(bits('DIRECTION BITS'))
+        rec.max_direction = unsigned(bits('DIRECTION BITS'))
+        rec.level_units = unsigned(bits('LEVEL UNIT BITS'))
+
+        if rec.record_type == _libtcd.REFERENCE_STATION:
+            rec.datum_offset = (signed(bits('DATUM OFFSET BITS'))
+                                / float(bits('DATUM OFFSET SCALE')))
+            rec.datum = unsigned(bits('DATUM BITS'))
+            rec.zone_offset = signed(bits('TIME BITS'))
+            rec.expiration_date = unsigned(bits('DATE BITS'))
+            rec.months_on_station = unsigned(bits('MONTHS ON STATION BITS'))
+            rec.last_date_on_station = unsigned(bits('DATE BITS'))
+            rec.confidence = unsigned(bits('CONFIDENCE VALUE BITS'))
+
+            constituent_bits = bits('CONSTITUENT BITS')
+            amplitude_bits = bits('AMPLITUDE BITS')
+            amplitude_scale = float(bits('AMPLITUDE SCALE'))
+            epoch_bits = bits('EPOCH BITS')
+            epoch_scale = float(bits('EPOCH SCALE'))
+            n_constituents = self.header.constituents
+            for _ in range(unsigned(constituent_bits)):
+                j = unsigned(constituent_bits)
+                if j >= n_constituents:
+                    raise InvalidTcdFile("Constituent index out of range "
+                                         "(record %d)" % i)
+                rec.amplitude[j] = unsigned(amplitude_bits) / amplitude_scale
+                rec.epoch[j] = unsigned(epoch_bits) / epoch_scale
+
+        elif rec.record_type == _libtcd.SUBORDINATE_STATION:
+            time_bits = bits('TIME BITS')
+            level_add_bits = bits('LEVEL ADD BITS')
+            level_add_scale = float(bits('LEVEL ADD SCALE'))
+            level_multiply_bits = bits('LEVEL MULTIPLY BITS')
+            level_multiply_scale = float(bits('LEVEL MULTIPLY SCALE'))
+
+            rec.min_time_add = signed(time_bits)
+            rec.min_level_add = signed(level_add_bits) / level_add_scale
+            rec.min_level_multiply = (unsigned(level_multiply_bits)
+                                      / level_multiply_scale)
+            rec.max_time_add = signed(time_bits)
+            rec.max_level_add = signed(level_add_bits) / level_add_scale
+            rec.max_level_multiply = (unsigned(level_multiply_bits)
+                                      / level_multiply_scale)
+            rec.flood_begins = signed(time_bits)
+            rec.ebb_begins = signed(time_bits)
+        return rec
+
+
+class _RandomAccessMixin(object):
+    def _read_chunk(self, start, chunk_size, buffers=None):
+        # Records are read by random access, so there is no "current
+        # record" state to be shared between threads.
+        stop = min(start + chunk_size, len(self))
+        if buffers is None:
+            return [self._get_record(i) for i in range(start, stop)]
+        return [self._get_record(i, buf)
+                for i, buf in zip(range(start, stop), buffers)]
+
+
+class MmapTcd(_RandomAccessMixin, _TcdBase):
+    """ A read-only TCD database, read without using libtcd.
+
+    This supports the same read-only API as :class:`libtcd.api.Tcd`
+    (indexing, iteration, :meth:`find`, :attr:`headers`, etc.)
+    Since it does not use libtcd, it does not acquire the global lock.
+    Instances may be used concurrently from multiple threads.
+
+    """
+    def __init__(self, filename, lazy=False):
+        self.filename = filename
+        self.lazy = lazy
+        self._file = TcdFile(filename)
+        self._header = self._file.header
+        self._string_tables = {}
+
+    @classmethod
+    def open(cls, filename, lazy=False):
+        return cls(filename, lazy)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_typ, exc_val, exc_tb):
+        pass
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def headers(self):
+        return MmapTcdHeaders(self)
+
+    @reify
+    def constituent_tables(self):
+        """ The :class:`~libtcd.api.ConstituentTables` of the database.
+        """
+        tcdfile = self._file
+        n = self._header.constituents
+        names = [text_type(tcdfile.get_string('constituent', i),
+                           _libtcd.ENCODING)
+                 for i in range(n)]
+        equilibriums = array('f')
+        node_factors = array('f')
+        for i in range(n):
+            equilibriums.extend(tcdfile.get_equilibriums(i))
+            node_factors.extend(tcdfile.get_node_factors(i))
+        return ConstituentTables(names, tcdfile.speeds,
+                                 self._header.start_year,
+                                 self._header.number_of_years,
+                                 equilibriums, node_factors)
+
+    @reify
+    def constituents(self):
+        return self.constituent_tables.constituents()
+
+    def _get_record(self, i, buf=None):
+        return self._file.read_record(i, buf)
+
+    def _iter_headers(self):
+        # A single header buffer is reused: each header is only valid
+        # until the next is read.
+        read_header = self._file.read_header
+        buf = _libtcd.TIDE_STATION_HEADER()
+        return (read_header(i, buf) for i in range(len(self)))
+
+    def _string_table_cache(self, table_name):
+        table = self._string_tables.get(table_name)
+        if table is None:
+            texts = (text_type(s, _libtcd.ENCODING)
+                     for s in self._file.get_strings(table_name))
+            table = self._string_tables[table_name] = _StringTableCache(texts)
+        return table
+
+
+class MmapTcdHeaders(_RandomAccessMixin, TcdHeaders):
+    def _get_record(self, i, buf=None):
+        return self.tcd._file.read_header(i, buf)
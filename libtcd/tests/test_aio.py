@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import sys
+import threading
+
+from pkg_resources import resource_filename
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip("libtcd.aio requires python >= 3.5", allow_module_level=True)
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+SEATTLE = u"Seattle, Puget Sound, Washington"
+TACOMA = u"Tacoma Narrows Bridge, Puget Sound, Washington"
+
+
+@pytest.fixture
+def loop(request):
+    import asyncio
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def fin():
+        asyncio.set_event_loop(None)
+        loop.close()
+    request.addfinalizer(fin)
+    return loop
+
+
+@pytest.fixture
+def mmap_tcd(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+@pytest.fixture
+def atcd(request, loop, mmap_tcd):
+    from libtcd.aio import AsyncTcd
+    atcd = AsyncTcd(mmap_tcd)
+    request.addfinalizer(lambda: loop.run_until_complete(atcd.close()))
+    return atcd
+
+
+def test_getitem(loop, atcd):
+    station = loop.run_until_complete(atcd[1])
+    assert station.name == TACOMA
+    assert station.reference_station.name == SEATTLE
+    assert loop.run_until_complete(atcd[-1]).name == TACOMA
+    with pytest.raises(IndexError):
+        loop.run_until_complete(atcd[2])
+
+
+def test_find(loop, atcd):
+    assert loop.run_until_complete(atcd.find(SEATTLE)).record_number == 0
+    with pytest.raises(KeyError):
+        loop.run_until_complete(atcd.find(u'Nowhere'))
+
+
+def test_headers(loop, atcd):
+    headers = loop.run_until_complete(atcd.headers())
+    assert [h.name for h in headers] == [SEATTLE, TACOMA]
+
+
+def test_call(loop, atcd, mmap_tcd):
+    assert loop.run_until_complete(atcd.call(len)) == 2
+    assert loop.run_until_complete(
+        atcd.call(lambda tcd, i: tcd is mmap_tcd and i, 42)) == 42
+
+
+def test_append_to_read_only(loop, atcd):
+    station = loop.run_until_complete(atcd[0])
+    with pytest.raises((AttributeError, TypeError)):
+        loop.run_until_complete(atcd.append(station))
+
+
+def test_iter_records(loop, atcd):
+    records = atcd.iter_records(chunk_size=1)
+    assert records.__aiter__() is records
+    names = []
+    while True:
+        try:
+            station = loop.run_until_complete(records.__anext__())
+        except StopAsyncIteration:
+            break
+        names.append(station.name)
+    assert names == [SEATTLE, TACOMA]
+    with pytest.raises(StopAsyncIteration):
+        loop.run_until_complete(records.__anext__())
+
+
+def test_iter_records_bad_chunk_size(atcd):
+    with pytest.raises(ValueError):
+        atcd.iter_records(chunk_size=0)
+
+
+def test_concurrent_reads_are_batched(loop, atcd, mmap_tcd):
+    import asyncio
+    mmap_tcd.find(TACOMA)   # build the name index, cache the refstation
+    reading = mmap_tcd._reading
+    readings = []
+
+    def counting_reading():
+        readings.append(1)
+        return reading()
+    mmap_tcd._reading = counting_reading
+
+    # Block the owner thread while the reads are queued
+    started = threading.Event()
+    unblock = threading.Event()
+
+    def block(tcd):
+        started.set()
+        unblock.wait()
+    blocked = atcd.call(block)
+    started.wait()
+    reads = [atcd[0], atcd.find(TACOMA), atcd[1], atcd[5]]
+    unblock.set()
+    loop.run_until_complete(blocked)
+    results = loop.run_until_complete(
+        asyncio.gather(*reads, return_exceptions=True))
+    assert [s.name for s in results[:3]] == [SEATTLE, TACOMA, TACOMA]
+    assert isinstance(results[3], IndexError)
+    assert len(readings) == 1
+
+
+def test_open(loop):
+    from libtcd.aio import AsyncTcd
+    from libtcd.tcdfile import MmapTcd
+    atcd = AsyncTcd.open(TCD_FILENAME, tcd_class=MmapTcd)
+    try:
+        assert loop.run_until_complete(atcd[0]).name == SEATTLE
+    finally:
+        loop.run_until_complete(atcd.close())
+
+
+def test_open_failure(loop, tmpdir):
+    from libtcd.aio import AsyncTcd
+    from libtcd.tcdfile import MmapTcd
+    atcd = AsyncTcd.open(str(tmpdir.join('missing.tcd')), tcd_class=MmapTcd)
+    try:
+        with pytest.raises(EnvironmentError):
+            loop.run_until_complete(atcd[0])
+    finally:
+        loop.run_until_complete(atcd.close())
+
+
+def test_requests_after_close(loop, mmap_tcd):
+    from libtcd.aio import AsyncTcd
+    atcd = AsyncTcd(mmap_tcd)
+    pending = atcd[0]
+    closed = atcd.close()
+    with pytest.raises(RuntimeError):
+        loop.run_until_complete(atcd[1])
+    assert loop.run_until_complete(pending).name == SEATTLE
+    loop.run_until_complete(closed)
+    with pytest.raises(RuntimeError):
+        loop.run_until_complete(atcd.find(TACOMA))
+    loop.run_until_complete(atcd.close())   # idempotent
+
+
+def test_queued_appends_fail_separately(loop):
+    import asyncio
+    from libtcd.aio import AsyncTcd
+
+    class Database(object):
+        def __init__(self):
+            self.stations = []
+
+        def append(self, station):
+            if station is None:
+                raise TypeError("not a station")
+            self.stations.append(station)
+            return len(self.stations) - 1
+
+    db = Database()
+    atcd = AsyncTcd(db)
+    try:
+        started = threading.Event()
+        unblock = threading.Event()
+
+        def block(tcd):
+            started.set()
+            unblock.wait()
+        blocked = atcd.call(block)
+        started.wait()
+        appends = [atcd.append(u'a'), atcd.append(None), atcd.append(u'b')]
+        unblock.set()
+        loop.run_until_complete(blocked)
+        results = loop.run_until_complete(
+            asyncio.gather(*appends, return_exceptions=True))
+    finally:
+        loop.run_until_complete(atcd.close())
+    assert results[0] == 0
+    assert isinstance(results[1], TypeError)
+    assert results[2] == 1
+    assert db.stations == [u'a', u'b']
@@ -6,6 +6,7 @@ from __future__ import absolute_import
 from ctypes import c_float
 import datetime
 from functools import partial
+import pickle
 from shutil import copyfileobj
 import tempfile
 from pkg_resources import resource_filename
@@ -56,6 +57,92 @@ class TestNodeFactors(object):
         with pytest.raises(KeyError):
             test_factors[1971]
 
+    def test_from_arrays(self):
+        from array import array
+        from libtcd.api import NodeFactors, NodeFactor
+        eqs = array('f', [1.0, 2.0, 3.0, 4.0])
+        nfs = array('f', [0.5, 1.5, 2.5, 3.5])
+        factors = NodeFactors.from_arrays(1970, eqs, nfs, 2, 2)
+        assert list(factors) == [1970, 1971]
+        assert factors[1971] == NodeFactor(4.0, 3.5)
+        assert factors.values() == [NodeFactor(3.0, 2.5),
+                                    NodeFactor(4.0, 3.5)]
+        nfs[2] = 0.25                   # a view, not a copy
+        assert factors[1970] == NodeFactor(3.0, 0.25)
+
+    def test_pickle(self):
+        from array import array
+        from libtcd.api import NodeFactors
+        eqs = array('f', range(100))
+        factors = NodeFactors.from_arrays(1970, eqs, eqs, 10, 2)
+        unpickled = pickle.loads(pickle.dumps(factors))
+        assert len(unpickled._node_factors) == 2
+        assert unpickled == factors
+
+
+class TestConstituentTables(object):
+    def make_one(self, names=(u'J1', u'K1'), speeds=(15.5, 15.0),
+                 equilibriums=(1.0, 2.0, 3.0, 4.0, 5.0, 6.0),
+                 node_factors=(0.5, 1.5, 2.5, 3.5, 4.5, 5.5)):
+        from array import array
+        from libtcd.api import ConstituentTables
+        return ConstituentTables(list(names), array('d', speeds), 1970, 3,
+                                 array('f', equilibriums),
+                                 array('f', node_factors))
+
+    def test_constituents(self):
+        from libtcd.api import NodeFactor
+        tables = self.make_one()
+        assert len(tables) == 2
+        assert tables.end_year == 1973
+        constituents = tables.constituents()
+        assert list(constituents) == [u'J1', u'K1']
+        k1 = constituents[u'K1']
+        assert k1.speed == 15.0
+        assert k1.node_factors.start_year == 1970
+        assert list(k1.node_factors.values()) == [
+            NodeFactor(4.0, 3.5), NodeFactor(5.0, 4.5), NodeFactor(6.0, 5.5)]
+
+    def test_duplicate_names(self):
+        from libtcd.api import InvalidTcdFile
+        tables = self.make_one(names=(u'J1', u'J1'))
+        with pytest.raises(InvalidTcdFile):
+            tables.constituents()
+
+    @pytest.mark.parametrize('kwargs', [
+        {'speeds': (1.0,)},
+        {'node_factors': (1.0,) * 5},
+        ])
+    def test_bad_shape(self, kwargs):
+        with pytest.raises(ValueError):
+            self.make_one(**kwargs)
+
+    def test_as_numpy(self):
+        numpy = pytest.importorskip('numpy')
+        tables = self.make_one()
+        speeds, equilibriums, node_factors = tables.as_numpy()
+        assert speeds.tolist() == [15.5, 15.0]
+        assert equilibriums.shape == (2, 3)
+        assert equilibriums.dtype == numpy.float32
+        assert node_factors[1].tolist() == [3.5, 4.5, 5.5]
+        tables.node_factors[0] = 42.0   # shares memory
+        assert node_factors[0, 0] == 42.0
+
+
+def test_copy_floats():
+    from array import array
+    from ctypes import cast, POINTER
+    from libtcd import _libtcd
+    from libtcd.api import _copy_floats, InvalidTcdFile
+    table = array('f', [0.0] * 4)
+    values = (_libtcd.c_float32 * 3)(1.0, 2.0, 3.0)
+    _copy_floats(table, 1, cast(values, POINTER(_libtcd.c_float32)), 2)
+    assert table.tolist() == [0.0, 1.0, 2.0, 0.0]
+    _copy_floats(table, 3, iter([4.0, 5.0]), 1)
+    assert table.tolist() == [0.0, 1.0, 2.0, 4.0]
+    with pytest.raises(InvalidTcdFile):
+        _copy_floats(table, 0, POINTER(_libtcd.c_float32)(), 1)
+
 
 class TestStationHeader(object):
     def make_one(self, *args, **kwargs):
@@ -76,6 +163,68 @@ class TestStationHeader(object):
         header = self.make_one('Testing')
         assert repr(header) == "<StationHeader: Testing>"
 
+class TestNameIndex(object):
+    def make_one(self):
+        from libtcd.api import _NameIndex
+        return _NameIndex()
+
+    @pytest.fixture
+    def index(self):
+        index = self.make_one()
+        index.append(1, b'Ref')
+        index.append(2, b'Sub')
+        index.append(2, b'Ref')
+        index.append(1, b'Ref')
+        return index
+
+    def test_from_headers(self):
+        from libtcd.api import _NameIndex
+        from libtcd._libtcd import TIDE_STATION_HEADER
+        headers = [
+            TIDE_STATION_HEADER(record_number=0, record_type=1, name=b'a'),
+            TIDE_STATION_HEADER(record_number=1, record_type=2, name=b'b'),
+            ]
+        index = _NameIndex.from_headers(headers)
+        assert index.keys == [(1, b'a'), (2, b'b')]
+
+    def test_from_headers_raises_invalid_tcd_file(self):
+        from libtcd.api import _NameIndex, InvalidTcdFile
+        from libtcd._libtcd import TIDE_STATION_HEADER
+        headers = [TIDE_STATION_HEADER(record_number=1, record_type=1)]
+        with pytest.raises(InvalidTcdFile):
+            _NameIndex.from_headers(headers)
+
+    def test_len(self, index):
+        assert len(index) == 4
+
+    def test_find(self, index):
+        assert index.find(b'Ref') == 0
+        assert index.find(b'Sub') == 1
+        assert index.find(b'Missing') is None
+
+    def test_findall(self, index):
+        assert index.findall(b'Ref') == [0, 2, 3]
+        assert index.findall(b'Missing') == []
+
+    def test_index(self, index):
+        assert index.index(1, b'Ref') == 0
+        assert index.index(2, b'Ref') == 2
+        assert index.index(2, b'Missing') is None
+
+    def test_replace(self, index):
+        index.replace(0, 2, b'New')
+        assert index.findall(b'Ref') == [2, 3]
+        assert index.index(2, b'New') == 0
+        index.replace(3, 2, b'New')
+        assert index.findall(b'New') == [0, 3]
+
+    def test_delete(self, index):
+        index.delete(1)
+        assert index.keys == [(1, b'Ref'), (2, b'Ref'), (1, b'Ref')]
+        assert index.find(b'Sub') is None
+        assert index.findall(b'Ref') == [0, 1, 2]
+
+
 ################################################################
 TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
 
@@ -172,6 +321,14 @@ class TestApi(object):
         assert list(constituents)[0] == 'J1'
         assert constituents['J1'].speed == dummy_constituents['J1'].speed
 
+    def test_create_from_constituent_tables(self, test_tcd):
+        from libtcd.api import Tcd
+        tmpfile = tempfile.NamedTemporaryFile()
+        tcd = Tcd(tmpfile.name, test_tcd.constituent_tables)
+        assert list(tcd.constituents) == list(test_tcd.constituents)
+        assert tcd.constituent_tables.node_factors \
+            == test_tcd.constituent_tables.node_factors
+
     def test_len(self, test_tcd):
         assert len(test_tcd) == 2
 
@@ -233,6 +390,58 @@ class TestApi(object):
         tcd.append(dummy_substation)
         assert len(tcd) == 2
 
+    def test_extend(self, new_tcd, dummy_refstation, dummy_substation):
+        from libtcd.api import SubordinateStation
+        other = SubordinateStation(name=u'Elsewhere',
+                                   reference_station=dummy_refstation)
+        tcd = new_tcd
+        assert tcd.extend([dummy_substation, dummy_refstation, other]) \
+            == [0, 1, 2]
+        assert len(tcd) == 3
+        assert tcd[0].reference_station.name == dummy_refstation.name
+        assert tcd[2].reference_station.record_number == 1
+        assert tcd.find(u'Elsewhere').record_number == 2
+
+    def test_extend_appends_missing_refstations(self, new_tcd,
+                                                dummy_substation):
+        tcd = new_tcd
+        assert tcd.extend([dummy_substation]) == [1]
+        assert tcd[0].name == dummy_substation.reference_station.name
+        assert tcd[1].reference_station.record_number == 0
+
+    def test_extend_finds_existing_refstations(self, temp_tcd):
+        from libtcd.api import SubordinateStation
+        seattle = temp_tcd[0]
+        station = SubordinateStation(name=u'Near Seattle',
+                                     reference_station=seattle,
+                                     country=u'Atlantis')
+        assert temp_tcd.extend([station]) == [2]
+        assert temp_tcd[2].reference_station.record_number == 0
+        assert temp_tcd[2].country == u'Atlantis'
+
+    def test_extend_raises_type_error(self, new_tcd, dummy_substation):
+        dummy_substation.reference_station = dummy_substation
+        with pytest.raises(TypeError):
+            new_tcd.extend([dummy_substation])
+        assert len(new_tcd) == 0
+        check_not_locked()
+
+    def test_string_tables_are_cached(self, test_tcd, monkeypatch):
+        from libtcd import _libtcd
+
+        def get_country(i):
+            raise AssertionError("not cached")   # pragma: NO COVER
+        test_tcd[0]
+        monkeypatch.setattr(_libtcd, 'get_country', get_country)
+        assert test_tcd[0].country == u'U.S.A.'
+
+    def test_added_strings_are_cached(self, temp_tcd, dummy_refstation):
+        dummy_refstation.country = u'Atlantis'
+        i = temp_tcd.append(dummy_refstation)
+        table = temp_tcd._string_table_cache('country')
+        assert table.get(table.find(u'Atlantis')) == u'Atlantis'
+        assert temp_tcd[i].country == u'Atlantis'
+
     def test_iter(self, test_tcd):
         stations = list(test_tcd)
         assert [s.name for s in stations] == [
@@ -241,6 +450,24 @@ class TestApi(object):
             ]
         assert len(stations[0].coefficients) == 32
 
+    @pytest.mark.parametrize('chunk_size', [1, 2, 64])
+    def test_iter_records(self, test_tcd, chunk_size):
+        stations = list(test_tcd.iter_records(chunk_size=chunk_size))
+        assert [s.record_number for s in stations] == [0, 1]
+        assert stations[1].reference_station.name == stations[0].name
+
+    def test_headers_iter_records(self, test_tcd):
+        headers = list(test_tcd.headers.iter_records(chunk_size=1))
+        assert [h.name for h in headers] == [
+            "Seattle, Puget Sound, Washington",
+            "Tacoma Narrows Bridge, Puget Sound, Washington",
+            ]
+        check_not_locked()
+
+    def test_iter_records_raises_value_error(self, test_tcd):
+        with pytest.raises(ValueError):
+            list(test_tcd.iter_records(chunk_size=0))
+
     def test_find(self, test_tcd):
         s = test_tcd.find("Seattle, Puget Sound, Washington")
         assert s.record_number == 0
@@ -255,6 +482,86 @@ class TestApi(object):
         stations = new_tcd.findall(dummy_refstation.name)
         assert [s.record_number for s in stations] == [0, 1]
 
+    def test_headers_findall(self, test_tcd):
+        name = u"Tacoma Narrows Bridge, Puget Sound, Washington"
+        headers = list(test_tcd.headers.findall(name))
+        assert [h.record_number for h in headers] == [1]
+
+    def test_find_after_setitem(self, temp_tcd, dummy_refstation):
+        temp_tcd.find("Seattle, Puget Sound, Washington")  # build index
+        temp_tcd[1] = dummy_refstation
+        assert temp_tcd.find(dummy_refstation.name).record_number == 1
+        assert list(temp_tcd.findall(
+            "Tacoma Narrows Bridge, Puget Sound, Washington")) == []
+
+    def test_index_after_delitem(self, new_tcd, dummy_substation):
+        new_tcd.append(dummy_substation)
+        new_tcd.append(dummy_substation)
+        assert new_tcd.index(dummy_substation) == 1
+        del new_tcd[1]
+        assert new_tcd.index(dummy_substation) == 1
+        del new_tcd[0]
+        with pytest.raises(ValueError):
+            new_tcd.index(dummy_substation)
+        new_tcd.append(dummy_substation)
+        assert new_tcd.index(dummy_substation) == 1
+
+    def test_index_raises_value_error(self, test_tcd, dummy_refstation):
+        with pytest.raises(ValueError):
+            test_tcd.index(dummy_refstation)
+
+    def test_subordinates_share_reference_station(
+            self, new_tcd, dummy_substation):
+        new_tcd.append(dummy_substation)
+        new_tcd.append(dummy_substation)
+        ref, sub1, sub2 = new_tcd
+        assert sub1.reference_station is sub2.reference_station
+        assert sub1.reference_station.name == ref.name
+
+    def test_reference_station_cache_is_bounded(
+            self, new_tcd, dummy_substation):
+        from libtcd.api import ReferenceStation
+        new_tcd.refstation_cache_size = 1
+        new_tcd.append(dummy_substation)
+        dummy_substation.reference_station = ReferenceStation(u'Other', [])
+        new_tcd.append(dummy_substation)
+        subs = [new_tcd[1], new_tcd[3]]
+        assert [sub.reference_station.name for sub in subs] \
+            == [u'Somewhere', u'Other']
+        assert len(new_tcd._refstation_cache(ReferenceStation)) == 1
+
+    def test_setitem_invalidates_reference_station_cache(
+            self, temp_tcd, dummy_refstation):
+        assert temp_tcd[1].reference_station.name \
+            == u"Seattle, Puget Sound, Washington"
+        refstation = temp_tcd[0]
+        refstation.name = u'Renamed'
+        temp_tcd[0] = refstation
+        assert temp_tcd[1].reference_station.name == u'Renamed'
+
+    def test_nearest(self, test_tcd):
+        stations = test_tcd.nearest(47.27, -122.55)
+        assert [s.record_number for s in stations] == [1]
+        headers = test_tcd.headers.nearest(47.6, -122.3, k=5)
+        assert [h.record_number for h in headers] == [0, 1]
+
+    def test_within_radius(self, test_tcd):
+        stations = test_tcd.within_radius(47.6, -122.3, 10)
+        assert [s.record_number for s in stations] == [0]
+
+    def test_within_bbox(self, test_tcd):
+        headers = test_tcd.headers.within_bbox(47, -123, 48, -122)
+        assert [h.record_number for h in headers] == [0, 1]
+        assert test_tcd.within_bbox(0, 0, 10, 10) == []
+
+    def test_append_invalidates_spatial_index(
+            self, new_tcd, dummy_refstation):
+        assert len(new_tcd.spatial_index) == 0
+        dummy_refstation.latitude = 10.0
+        dummy_refstation.longitude = 20.0
+        new_tcd.append(dummy_refstation)
+        assert len(new_tcd.headers.spatial_index) == 1
+
     def test_dump_tide_record(self, test_tcd, capfd):
         test_tcd.dump_tide_record(0)
         out, err = capfd.readouterr()
@@ -295,6 +602,43 @@ class TestApi(object):
         with pytest.raises(ValueError):
             uninitialized_tcd._pack_constituents(constituents)
 
+    def test_pack_constituent_tables(self, uninitialized_tcd):
+        from ctypes import addressof
+        from libtcd.api import ConstituentTables
+        numpy = pytest.importorskip('numpy')
+        equilibriums = numpy.arange(6, dtype=numpy.float32).reshape(2, 3)
+        tables = ConstituentTables(
+            [u'J1', u'K1'], numpy.array([15.5, 15.0]), 1970, 3,
+            equilibriums, numpy.ones((2, 3), dtype=numpy.float64))
+        n, names, speeds, start_year, num_years, eqs, nfs \
+            = uninitialized_tcd._pack_constituents(tables)
+        assert (n, start_year, num_years) == (2, 1970, 3)
+        assert list(names) == [b'J1', b'K1']
+        assert list(speeds) == [15.5, 15.0]
+        assert eqs[1][:3] == [3.0, 4.0, 5.0]
+        assert nfs[1][:3] == [1.0, 1.0, 1.0]
+        # float32 tables are passed in place
+        assert addressof(eqs[1].contents) \
+            == equilibriums.ctypes.data + 3 * equilibriums.itemsize
+
+    def test_pack_read_only_constituent_tables(self, uninitialized_tcd):
+        from libtcd.api import ConstituentTables
+        numpy = pytest.importorskip('numpy')
+        table = numpy.frombuffer(numpy.ones(2, dtype=numpy.float32).tobytes(),
+                                 dtype=numpy.float32)
+        tables = ConstituentTables([u'J1'], [15.5], 1970, 2, table, table)
+        packed = uninitialized_tcd._pack_constituents(tables)
+        assert packed[5][0][:2] == [1.0, 1.0]
+
+    def test_constituent_tables_from_constituents(self):
+        from libtcd.api import ConstituentTables
+        from libtcd.tcdfile import MmapTcd
+        tcd = MmapTcd(TCD_FILENAME)
+        tables = ConstituentTables.from_constituents(tcd.constituents)
+        assert tables.names == tcd.constituent_tables.names
+        assert tables.start_year == 1970
+        assert tables.equilibriums == tcd.constituent_tables.equilibriums
+
     @pytest.fixture
     def patch_constituents(self, monkeypatch):
         from libtcd import _libtcd
@@ -321,6 +665,317 @@ class TestApi(object):
         with pytest.raises(InvalidTcdFile):
             tcd._read_constituents()
 
+    def test_read_constituent_tables(self, uninitialized_tcd,
+                                     patch_constituents):
+        tcd = uninitialized_tcd
+        tcd._header.start_year = 1970
+        tcd._header.number_of_years = 1
+        tcd._header.constituents = 2
+        tables = tcd._read_constituent_tables()
+        assert tables.names == [u'Foo1', u'Foo1']
+        assert list(tables.equilibriums) == [1.0, 1.0]
+        assert list(tables.node_factors) == [2.0, 2.0]
+
+
+class Test_StringTableCache(object):
+    def make_one(self, texts=(u'Unknown', u'foo')):
+        from libtcd.api import _StringTableCache
+        return _StringTableCache(texts)
+
+    def test_get(self):
+        table = self.make_one()
+        assert len(table) == 2
+        assert table.get(1) == u'foo'
+        assert table.get(2) == u'Unknown'
+        assert table.get(-1) == u'Unknown'
+
+    def test_find(self):
+        table = self.make_one()
+        assert table.find(u'foo') == 1
+        assert table.find(u'bar') == -1
+
+    def test_add(self):
+        table = self.make_one()
+        table.add(2, u'bar', alias=u'bar baz')
+        assert table.get(2) == u'bar'
+        assert table.find(u'bar') == 2
+        assert table.find(u'bar baz') == 2
+
+    def test_first_duplicate_wins(self):
+        table = self.make_one([u'foo', u'foo'])
+        assert table.find(u'foo') == 0
+
+
+class TestSnapshots(object):
+    SEATTLE = u"Seattle, Puget Sound, Washington"
+    TACOMA = u"Tacoma Narrows Bridge, Puget Sound, Washington"
+
+    @pytest.fixture
+    def tcd_file(self, tmpdir):
+        path = tmpdir.join('test.tcd')
+        with open(TCD_FILENAME, 'rb') as fp:
+            path.write_binary(fp.read())
+        return str(path)
+
+    @pytest.fixture
+    def unopened_tcd(self, tcd_file, monkeypatch, request):
+        # A Tcd which libtcd does not currently have open
+        from libtcd import api
+        from libtcd.tcdfile import MmapTcd
+        mmap_tcd = MmapTcd(tcd_file)
+        request.addfinalizer(mmap_tcd.close)
+        tcd = api.Tcd.__new__(api.Tcd)
+        tcd.filename = tcd_file
+        tcd._header = mmap_tcd._header
+        tcd.constituents = mmap_tcd.constituents
+        monkeypatch.setattr(api, '_current_database', None)
+
+        def make_current():
+            raise AssertionError("database reopened")   # pragma: NO COVER
+        monkeypatch.setattr(tcd, '_make_current', make_current)
+        return tcd
+
+    def test_reads_from_snapshot(self, unopened_tcd):
+        from libtcd.api import get_reopen_count
+        count = get_reopen_count()
+        tcd = unopened_tcd
+        assert tcd[0].datum == u'Mean Lower Low Water'
+        assert tcd[1].reference_station.name == self.SEATTLE
+        assert [h.name for h in tcd.headers] == [self.SEATTLE, self.TACOMA]
+        assert tcd.find(self.TACOMA).record_number == 1
+        assert tcd._string_table_cache('tzfile').find(
+            u':America/Los_Angeles') == 115
+        assert get_reopen_count() == count
+        assert tcd.reopen_count == 0
+        check_not_locked()
+
+    def test_snapshot_is_reused(self, unopened_tcd):
+        unopened_tcd[0]
+        snapshot = unopened_tcd._snapshot
+        unopened_tcd.headers[1]
+        assert unopened_tcd._snapshot is snapshot
+
+    def test_snapshot_is_rebuilt_if_file_changes(self, unopened_tcd):
+        unopened_tcd[0]
+        snapshot = unopened_tcd._snapshot
+        st = os.stat(unopened_tcd.filename)
+        os.utime(unopened_tcd.filename, (st.st_atime, st.st_mtime + 10))
+        assert unopened_tcd[0].name == self.SEATTLE
+        assert unopened_tcd._snapshot is not snapshot
+
+    def test_no_snapshot_if_same_file_is_current(
+            self, unopened_tcd, monkeypatch):
+        from libtcd import api
+        other = api.Tcd.__new__(api.Tcd)
+        other.filename = unopened_tcd.filename
+        monkeypatch.setattr(api, '_current_database', other)
+        with pytest.raises(AssertionError):
+            unopened_tcd[0]
+        check_not_locked()
+
+    def test_alternating_reads_do_not_reopen(self, test_tcd, temp_tcd):
+        from libtcd.api import get_reopen_count
+        count = get_reopen_count()
+        for n in range(3):
+            assert test_tcd[1].name == self.TACOMA
+            assert temp_tcd[1].reference_station.name == self.SEATTLE
+        assert get_reopen_count() == count
+
+    def test_write_after_snapshot_read(self, test_tcd, temp_tcd,
+                                       dummy_refstation):
+        temp_tcd[1]
+        assert test_tcd[0].name == self.SEATTLE   # uses snapshot
+        test_tcd_count = test_tcd.reopen_count
+        temp_tcd[1] = dummy_refstation
+        assert temp_tcd[1].name == dummy_refstation.name
+        assert test_tcd.reopen_count == test_tcd_count
+
+    def test_same_file_open_elsewhere(self, temp_tcd):
+        from libtcd.api import Tcd
+        other = Tcd.open(temp_tcd.filename)
+        count = temp_tcd.reopen_count
+        del other[1]
+        assert temp_tcd.headers[0].name == self.SEATTLE
+        assert temp_tcd.reopen_count == count + 1
+
+    def test_string_tables_reloaded_with_snapshot(self, test_tcd, temp_tcd,
+                                                  dummy_refstation):
+        from libtcd.api import Tcd
+        assert temp_tcd[0].country == u'U.S.A.'    # loads string tables
+        other = Tcd.open(temp_tcd.filename)
+        dummy_refstation.country = u'Atlantis'
+        dummy_refstation.tzfile = u':Atlantis/Poseidonis'
+        other.append(dummy_refstation)
+        assert test_tcd[0].name == self.SEATTLE    # closes other
+        count = temp_tcd.reopen_count
+        station = temp_tcd[2]                      # uses snapshot
+        assert station.country == u'Atlantis'
+        assert station.tzfile == u':Atlantis/Poseidonis'
+        assert temp_tcd.reopen_count == count
+
+
+class TestLazyStations(object):
+    @pytest.fixture
+    def lazy_tcd(self, request):
+        from libtcd.tcdfile import MmapTcd
+        tcd = MmapTcd(TCD_FILENAME, lazy=True)
+        request.addfinalizer(tcd.close)
+        return tcd
+
+    @pytest.fixture
+    def eager_tcd(self, request):
+        from libtcd.tcdfile import MmapTcd
+        tcd = MmapTcd(TCD_FILENAME)
+        request.addfinalizer(tcd.close)
+        return tcd
+
+    def test_is_instance(self, lazy_tcd):
+        from libtcd.api import ReferenceStation, SubordinateStation
+        ref, sub = lazy_tcd
+        assert isinstance(ref, ReferenceStation)
+        assert isinstance(sub, SubordinateStation)
+        assert repr(ref) == "<ReferenceStation: %s>" % ref.name
+
+    def test_attributes_are_unpacked_on_access(self, lazy_tcd):
+        station = lazy_tcd[0]
+        assert 'comments' not in station.__dict__
+        assert station.latitude == pytest.approx(47.6033)
+        assert 'longitude' in station.__dict__
+        assert 'comments' not in station.__dict__
+        assert 'xfields' not in station.__dict__
+
+    def test_matches_eager_unpack(self, lazy_tcd, eager_tcd):
+        for lazy, eager in zip(lazy_tcd, eager_tcd):
+            lazy._unpack_all()
+            state = dict(vars(lazy))
+            del state['_lazy_tcd'], state['_lazy_rec']
+            expected = dict(vars(eager))
+            if 'reference_station' in state:
+                assert state.pop('reference_station').name \
+                    == expected.pop('reference_station').name
+            if 'coefficients' in state:
+                assert [(c.amplitude, c.epoch, c.constituent.name)
+                        for c in state.pop('coefficients')] \
+                    == [(c.amplitude, c.epoch, c.constituent.name)
+                        for c in expected.pop('coefficients')]
+            assert state == expected
+
+    def test_headers(self, lazy_tcd):
+        from libtcd.api import ReferenceStationHeader
+        header = lazy_tcd.headers[1]
+        assert isinstance(header.reference_station, ReferenceStationHeader)
+        assert header.reference_station.name \
+            == u"Seattle, Puget Sound, Washington"
+
+    def test_setattr(self, lazy_tcd):
+        station = lazy_tcd[0]
+        station.latitude = 12.0
+        assert station.latitude == 12.0
+        assert station.longitude == pytest.approx(-122.34)
+
+    def test_pickle(self, lazy_tcd):
+        from libtcd.api import SubordinateStation
+        station = pickle.loads(pickle.dumps(lazy_tcd[1]))
+        assert type(station) is SubordinateStation
+        assert station.reference_station.name \
+            == u"Seattle, Puget Sound, Washington"
+        assert '_lazy_rec' not in vars(station)
+
+    def test_record_fields_copy(self):
+        from libtcd._libtcd import TIDE_RECORD
+        from libtcd.api import _RecordFields
+        rec = TIDE_RECORD(name=b'foo')
+        rec.amplitude[0] = 1.5
+        fields = _RecordFields(rec, ['name', 'amplitude'])
+        rec.amplitude[0] = 2.5
+        assert fields.record_class is TIDE_RECORD
+        assert fields.name == b'foo'
+        assert fields.amplitude[0] == 1.5
+        assert not hasattr(fields, 'comments')
+
+    def test_libtcd_lazy(self):
+        from libtcd.api import Tcd
+        tcd = Tcd.open(TCD_FILENAME, lazy=True)
+        sub = tcd[1]
+        assert 'reference_station' not in vars(sub)
+        assert sub.reference_station.name \
+            == u"Seattle, Puget Sound, Washington"
+
+
+class TestCompiledStations(object):
+    @pytest.fixture
+    def mmap_tcd(self, request):
+        from libtcd.tcdfile import MmapTcd
+        tcd = MmapTcd(TCD_FILENAME)
+        request.addfinalizer(tcd.close)
+        return tcd
+
+    @staticmethod
+    def unpack_by_descriptor(cls, tcd, rec):
+        state = {}
+        for descriptor in cls._PACKED_ATTRS:
+            state.update(descriptor.unpack(tcd, rec))
+        return state
+
+    def test_unpack_matches_descriptors(self, mmap_tcd):
+        for i, station in enumerate(mmap_tcd):
+            rec = mmap_tcd._get_record(i)
+            expected = self.unpack_by_descriptor(type(station), mmap_tcd, rec)
+            assert vars(station) == expected
+
+    def test_pack_matches_descriptors(self, mmap_tcd):
+        from ctypes import addressof, sizeof, string_at
+        from libtcd._libtcd import TIDE_RECORD
+        from libtcd.api import _BatchPacker, _STRING_TABLE_SIZES
+
+        def as_bytes(rec):
+            return string_at(addressof(rec), sizeof(rec))
+
+        for table_name in _STRING_TABLE_SIZES:
+            mmap_tcd._string_table_cache(table_name)
+        packer = _BatchPacker(mmap_tcd, {})
+        for station in mmap_tcd:
+            refstation = getattr(station, 'reference_station', None)
+            if refstation is not None:
+                packer.refstation_numbers[id(refstation)] = 0
+            fields = station._TIDE_RECORD_DEFAULTS.copy()
+            for descriptor in station._PACKED_ATTRS:
+                fields.update(descriptor.pack(packer, station))
+            assert as_bytes(station._pack(packer)) \
+                == as_bytes(TIDE_RECORD(**fields))
+
+    def test_custom_descriptor(self):
+        from libtcd._libtcd import TIDE_RECORD
+        from libtcd.api import _attr_descriptor, _compile_pack, _compile_unpack
+
+        class _doubled(_attr_descriptor):
+            def unpack(self, tcd, rec):
+                yield self.name, 2 * getattr(rec, self.packed_name)
+
+            def pack(self, tcd, station):
+                yield self.packed_name, getattr(station, self.name) // 2
+
+        class DummyStation(object):
+            _PACKED_ATTRS = (_doubled('doubled', 'confidence'),)
+            doubled = 8
+
+        unpack = _compile_unpack(DummyStation)
+        assert unpack({}, None, TIDE_RECORD(confidence=3)) == {'doubled': 6}
+        pack = _compile_pack(DummyStation)
+        assert pack(None, DummyStation()).confidence == 4
+
+    def test_packed_attrs_in_declaration_order(self):
+        from libtcd.api import ReferenceStation, _attr_descriptor
+
+        class DummyStation(ReferenceStation):
+            _PACKED_ATTRS = (_attr_descriptor('zebra'),
+                             _attr_descriptor('aardvark'))
+
+        names = [d.name for d in DummyStation._PACKED_ATTRS]
+        inherited = [d.name for d in ReferenceStation._PACKED_ATTRS]
+        assert names == inherited + ['zebra', 'aardvark']
+        assert inherited[0] == 'record_number'
+        assert inherited[-1] == 'coefficients'
 
 
 @pytest.mark.parametrize("seconds,expected", [
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+
+from pkg_resources import resource_filename
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+
+class DummyTcd(object):
+    def __init__(self, records, n_constituents=3):
+        self.records = records
+        self.constituents = dict(('C%d' % i, None)
+                                 for i in range(n_constituents))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_typ, exc_val, exc_tb):
+        pass
+
+    @contextmanager
+    def _reading(self):
+        yield self
+
+    def _read_chunk(self, start, chunk_size, buffers=None):
+        return self.records[start:start + chunk_size]
+
+
+@pytest.fixture
+def records():
+    from libtcd._libtcd import TIDE_RECORD
+    records = []
+    for i in range(5):
+        rec = TIDE_RECORD(record_number=i, record_type=1 + i % 2,
+                          latitude=i + 0.5, longitude=-i - 0.25,
+                          name=b'Station ' + str(i).encode('ascii'),
+                          zone_offset=-800, confidence=i,
+                          reference_station=-1 if i % 2 == 0 else i - 1)
+        rec.amplitude[0] = i
+        rec.amplitude[2] = 2.0 * i
+        rec.amplitude[3] = 99.0       # beyond the number of constituents
+        rec.epoch[1] = 10.0 * i
+        records.append(rec)
+    return records
+
+
+def test_record_dtype_matches_tide_record():
+    from ctypes import sizeof
+    from libtcd._libtcd import TIDE_RECORD
+    from libtcd.arrays import TIDE_RECORD_DTYPE
+    assert TIDE_RECORD_DTYPE.itemsize == sizeof(TIDE_RECORD)
+    assert 'name' in TIDE_RECORD_DTYPE.names
+    assert 'comments' not in TIDE_RECORD_DTYPE.names
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 64])
+def test_to_arrays(records, chunk_size):
+    from libtcd.arrays import to_arrays
+    columns = to_arrays(DummyTcd(records), chunk_size=chunk_size)
+    assert list(columns['record_number']) == [0, 1, 2, 3, 4]
+    assert list(columns['record_type']) == [1, 2, 1, 2, 1]
+    assert list(columns['reference_station']) == [-1, 0, -1, 2, -1]
+    assert list(columns['latitude']) == [0.5, 1.5, 2.5, 3.5, 4.5]
+    assert list(columns['longitude']) == [-0.25, -1.25, -2.25, -3.25, -4.25]
+    assert list(columns['zone_offset']) == [-800] * 5
+    assert columns['name'][3] == b'Station 3'
+    assert columns['amplitude'].shape == (5, 3)
+    assert columns['amplitude'].dtype == numpy.float32
+    assert list(columns['amplitude'][4]) == [4.0, 0.0, 8.0]
+    assert list(columns['epoch'][:, 1]) == [0.0, 10.0, 20.0, 30.0, 40.0]
+
+
+def test_to_arrays_truncated(records):
+    from libtcd.arrays import to_arrays
+
+    class TruncatedTcd(DummyTcd):
+        def __len__(self):
+            return len(self.records) + 3
+
+    columns = to_arrays(TruncatedTcd(records), chunk_size=2)
+    assert len(columns['record_number']) == 5
+    assert columns['amplitude'].shape == (5, 3)
+
+
+def test_to_arrays_raises_value_error(records):
+    from libtcd.arrays import to_arrays
+    with pytest.raises(ValueError):
+        to_arrays(DummyTcd(records), chunk_size=0)
+
+
+def test_tcd_to_arrays():
+    from libtcd.api import Tcd
+    tcd = Tcd.open(TCD_FILENAME)
+    columns = tcd.to_arrays()
+    assert list(columns['record_number']) == [0, 1]
+    assert list(columns['reference_station']) == [-1, 0]
+    assert columns['name'][0] == b'Seattle, Puget Sound, Washington'
+    assert columns['amplitude'].shape == (2, len(tcd.constituents))
+    assert numpy.count_nonzero(columns['amplitude'][0]) == 32
+
+
+def test_mmap_tcd_to_arrays():
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    columns = tcd.to_arrays(chunk_size=1)
+    assert list(columns['record_number']) == [0, 1]
+    assert list(columns['reference_station']) == [-1, 0]
+    assert columns['name'][1] \
+        == b'Tacoma Narrows Bridge, Puget Sound, Washington'
+    assert numpy.count_nonzero(columns['amplitude'][0]) == 32
+    assert numpy.count_nonzero(columns['amplitude'][1]) == 0
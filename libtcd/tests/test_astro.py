@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import datetime
+from pkg_resources import resource_filename
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+
+@pytest.fixture(scope='module')
+def tables(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd.constituent_tables
+
+
+@pytest.fixture
+def constituents():
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    try:
+        return tcd.constituents
+    finally:
+        tcd.close()
+
+
+def angle_difference(a, b):
+    return (numpy.asarray(a) - b + 180.0) % 360.0 - 180.0
+
+
+def test_supported_constituents(tables):
+    from libtcd.astro import CONSTITUENTS
+    assert len(CONSTITUENTS) == len(set(CONSTITUENTS))
+    unsupported = set(tables.names).difference(CONSTITUENTS)
+    assert 'M1' not in unsupported
+    assert 'M1C' in unsupported
+    assert len(unsupported) < 30
+
+
+def test_speeds(tables):
+    from libtcd.astro import CONSTITUENTS, speeds
+    names = [name for name in tables.names if name in CONSTITUENTS]
+    expected = dict(zip(tables.names, tables.speeds))
+    assert numpy.allclose(speeds(names), [expected[name] for name in names],
+                          rtol=0, atol=1e-6)
+
+
+def test_year_tables(tables):
+    from libtcd.astro import CONSTITUENTS, year_tables
+    _, equilibriums, node_factors = tables.as_numpy()
+    rows = [i for i, name in enumerate(tables.names) if name in CONSTITUENTS]
+    names = [tables.names[i] for i in rows]
+    eqs, nfs = year_tables(names, tables.start_year, tables.number_of_years)
+    assert eqs.shape == nfs.shape == (len(names), 68)
+    assert numpy.all((eqs >= 0) & (eqs < 360))
+    # The constituents of highest order (e.g. 4MN10) accumulate some
+    # tenths of a degree of difference
+    assert numpy.all(
+        abs(angle_difference(eqs, equilibriums[rows])) < 0.25)
+    assert numpy.allclose(nfs, node_factors[rows], rtol=0, atol=0.002)
+
+    m2 = names.index('M2')
+    assert abs(angle_difference(eqs[m2, 0], 165.43)) < 0.05
+    assert nfs[m2, 0] == pytest.approx(0.9665, abs=1e-4)
+
+    # M1 has nodal corrections depending on the lunar perigee, too
+    m1 = names.index('M1')
+    assert numpy.all(abs(angle_difference(eqs[m1], equilibriums[rows[m1]]))
+                     < 0.05)
+    assert numpy.allclose(nfs[m1], node_factors[rows[m1]], rtol=0, atol=5e-4)
+
+
+def test_unsupported_constituent():
+    from libtcd.astro import year_tables
+    with pytest.raises(KeyError):
+        year_tables(['M2', 'M1C'], 2000, 1)
+
+
+def test_hourly_values():
+    from libtcd.astro import (equilibrium_arguments, node_factors,
+                              year_tables)
+    times = numpy.datetime64('2020-01-01') \
+        + numpy.arange(48) * numpy.timedelta64(1, 'h')
+    eqs = equilibrium_arguments(['S2', 'M2'], times)
+    assert eqs.shape == (2, 48)
+    # S2 has no nodal corrections and a period of 12 solar hours
+    assert numpy.allclose(eqs[0], (30.0 * numpy.arange(48)) % 360)
+    # M2 advances by its speed (nearly: u changes slowly)
+    steps = angle_difference(eqs[1, 1:], eqs[1, :-1])
+    assert numpy.allclose(steps, 28.9841042, atol=1e-3)
+    year_eqs, year_nfs = year_tables(['M2'], 2020, 1)
+    # The yearly table takes u from the middle of the year
+    assert abs(angle_difference(eqs[1, 0], year_eqs[0, 0])) < 1.0
+    nfs = node_factors(['M2'], times[:1])
+    assert nfs.shape == (1, 1)
+    assert nfs[0, 0] == pytest.approx(year_nfs[0, 0], abs=0.01)
+
+
+def test_times_may_be_datetimes():
+    from libtcd.astro import equilibrium_arguments
+    dt = datetime.datetime(2020, 1, 1, 6)
+    seconds = (dt - datetime.datetime(1970, 1, 1)).total_seconds()
+    assert numpy.allclose(equilibrium_arguments(['M2'], dt),
+                          equilibrium_arguments(['M2'], [seconds])[:, 0])
+
+
+def test_extend_constituents(constituents):
+    from libtcd.astro import extend_constituents, year_tables
+    with pytest.warns(UserWarning) as record:
+        extended = extend_constituents(constituents, 1900, 2100)
+    assert 'M1C' in str(record[0].message)
+    assert list(extended) == list(constituents)
+    m2 = extended['M2']
+    assert m2.speed == constituents['M2'].speed
+    assert m2.node_factors.start_year == 1900
+    assert m2.node_factors.end_year == 2100
+    # Years covered by the file keep their values
+    assert m2.node_factors[1970] == constituents['M2'].node_factors[1970]
+    eqs, nfs = year_tables(['M2'], 2099, 1)
+    assert m2.node_factors[2099].equilibrium == pytest.approx(eqs[0, 0],
+                                                              abs=1e-3)
+    assert m2.node_factors[2099].node_factor == pytest.approx(nfs[0, 0],
+                                                              abs=1e-6)
+    assert extended['M1'].node_factors.end_year == 2100
+    # Unsupported constituents are unchanged
+    assert extended['M1C'] is constituents['M1C']
+
+
+def test_extend_constituents_for_prediction(constituents):
+    from libtcd.astro import extend_constituents
+    from libtcd.predict import Harmonics
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    try:
+        station = tcd[0]
+    finally:
+        tcd.close()
+    assert u'Seattle' in station.name
+    assert any(c.constituent.name == 'M1' and c.amplitude > 0
+               for c in station.coefficients)
+    assert Harmonics.from_station(station).end_year == 2038
+    with pytest.warns(UserWarning):
+        extended = extend_constituents(constituents, 1950, 2100)
+    harmonics = Harmonics.from_station(station, extended)
+    assert harmonics.start_year == 1950
+    assert harmonics.end_year == 2100
+    heights = harmonics.predict(numpy.datetime64('2090-06-01T00:00'))
+    amplitudes = sum(c.amplitude for c in station.coefficients)
+    assert abs(heights - harmonics.datum_offset) <= 1.5 * amplitudes
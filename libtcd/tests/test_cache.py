@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import os
+from pkg_resources import resource_filename
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+SEATTLE = u"Seattle, Puget Sound, Washington"
+TACOMA = u"Tacoma Narrows Bridge, Puget Sound, Washington"
+
+START = numpy.datetime64('2020-06-01T00:00')
+END = numpy.datetime64('2020-06-08T00:00')
+
+
+@pytest.fixture
+def tcd(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+@pytest.fixture
+def cache():
+    from libtcd.cache import PredictionCache
+    return PredictionCache()
+
+
+def test_predict(cache, tcd):
+    from libtcd.predict import as_seconds, predict
+    heights = cache.predict(tcd, SEATTLE, START, END, step=3600)
+    assert heights.dtype == numpy.float32
+    assert heights.shape == (7 * 24,)
+    assert not heights.flags.writeable
+    times = as_seconds(START) + 3600.0 * numpy.arange(7 * 24)
+    assert numpy.allclose(heights, predict(tcd[0], times), atol=1e-4)
+
+
+def test_subordinate_station(cache, tcd):
+    heights = cache.predict(tcd, 1, START, END, step=3600)
+    assert cache.predict(tcd, TACOMA, START, END, step=3600) is heights
+    assert cache.predict(tcd, -1, START, END, step=3600) is heights
+
+
+def test_bad_station(cache, tcd):
+    with pytest.raises(IndexError):
+        cache.predict(tcd, 2, START, END)
+    with pytest.raises(KeyError):
+        cache.predict(tcd, u'Nowhere', START, END)
+
+
+def test_hits(cache, tcd):
+    first = cache.predict(tcd, 0, START, END)
+    assert cache.predict(tcd, 0, START, END) is first
+    cache.predict(tcd, 0, START, END, step=600)
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['hit_rate'] == pytest.approx(1.0 / 3)
+    assert stats['entries'] == 2
+    assert stats['memory_used'] == (7 * 240 + 7 * 144) * 4
+    assert cache.memory_used == stats['memory_used']
+
+
+def test_size_based_eviction(tcd):
+    from libtcd.cache import PredictionCache
+    cache = PredictionCache(maxbytes=1000)
+    cache.predict(tcd, 0, START, END, step=3600)            # 672 bytes
+    cache.predict(tcd, 1, START, END, step=3600)
+    assert cache.stats()['entries'] == 1
+    assert cache.memory_used == 672
+    cache.predict(tcd, 0, START, END, step=3600)
+    assert cache.hits == 0
+
+
+def test_disk_store(tcd, tmpdir):
+    from libtcd.cache import PredictionCache
+    heights = PredictionCache(directory=tmpdir.strpath) \
+        .predict(tcd, 0, START, END, step=3600)
+    cache = PredictionCache(directory=tmpdir.strpath)
+    assert numpy.array_equal(
+        cache.predict(tcd, 0, START, END, step=3600), heights)
+    assert cache.disk_hits == 1
+    assert cache.misses == 0
+    assert cache.hit_rate == 1.0
+
+
+def test_invalidated_when_modified(tcd, tmpdir):
+    from libtcd.cache import PredictionCache
+    cache = PredictionCache(directory=tmpdir.strpath)
+    seattle = cache.predict(tcd, 0, START, END, step=3600)
+    tacoma = cache.predict(tcd, 1, START, END, step=3600)
+    assert len(tmpdir.listdir()) == 2
+
+    # What Tcd.__setitem__ does, when it changes station 0
+    fingerprints = tcd.fingerprints()
+    tcd._fingerprint_table = [b'x' * 20] + fingerprints[1:]
+    cache.invalidate(tcd)
+    assert cache.stats()['entries'] == 1
+    # Predictions on disk are kept (until pruned)
+    assert len(tmpdir.listdir()) == 2
+    assert cache.predict(tcd, 1, START, END, step=3600) is tacoma
+    assert cache.predict(tcd, 0, START, END, step=3600) is not seattle
+    assert cache.misses == 3
+
+
+def test_prune(tcd, tmpdir):
+    from libtcd.cache import PredictionCache
+    cache = PredictionCache(directory=tmpdir.strpath)
+    cache.predict(tcd, 0, START, END, step=3600)
+    cache.predict(tcd, 1, START, END, step=3600)
+    tmpdir.join('README').write('not a prediction')
+    assert cache.prune([tcd]) == 0
+    assert len(tmpdir.listdir()) == 3
+
+    fingerprints = tcd.fingerprints()
+    tcd._fingerprint_table = [b'x' * 20] + fingerprints[1:]
+    assert cache.prune([tcd]) == 1
+    assert sorted(p.basename for p in tmpdir.listdir()) \
+        == sorted([os.path.basename(cache._dirname(fingerprints[1])),
+                   'README'])
+    assert cache.prune([]) == 1
+    assert [p.basename for p in tmpdir.listdir()] == ['README']
+    assert PredictionCache().prune([tcd]) == 0
+
+
+def test_constituents_digest(tcd):
+    from libtcd.api import ConstituentTables
+    from libtcd.cache import constituents_digest
+    digest = constituents_digest(tcd)
+    assert len(digest) == 20
+
+    class Database(object):
+        constituent_tables = None
+        constituents = tcd.constituents
+    assert constituents_digest(Database()) == digest
+    Database.constituent_tables = ConstituentTables.from_constituents(
+        dict((name, c) for name, c in tcd.constituents.items()
+             if name != 'M2'))
+    assert constituents_digest(Database()) != digest
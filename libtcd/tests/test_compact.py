@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import gc
+import pickle
+import weakref
+
+from pkg_resources import resource_filename
+import pytest
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+
+@pytest.fixture
+def mmap_tcd(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd.open(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+@pytest.fixture
+def catalog(mmap_tcd):
+    from libtcd.compact import CompactCatalog
+    return CompactCatalog.from_tcd(mmap_tcd)
+
+
+def coefficients(station):
+    return [(c.amplitude, c.epoch, c.constituent.name)
+            for c in station.coefficients]
+
+
+class TestCompactCatalog(object):
+    def test_len(self, catalog):
+        assert len(catalog) == 2
+
+    def test_slots(self, catalog):
+        for station in catalog:
+            assert not hasattr(station, '__dict__')
+            with pytest.raises(AttributeError):
+                station.foo = 1
+
+    def test_attributes(self, catalog, mmap_tcd):
+        for compact, station in zip(catalog, mmap_tcd):
+            for name in compact._ATTRS:
+                if name != 'reference_station':
+                    assert getattr(compact, name) == getattr(station, name)
+            assert compact.xfields == station.xfields
+
+    def test_coefficients(self, catalog, mmap_tcd):
+        refstation = catalog[0]
+        assert refstation.amplitudes.typecode == 'f'
+        assert refstation.epochs.typecode == 'f'
+        assert len(refstation.constituent_indexes) == 32
+        expected = coefficients(mmap_tcd[0])
+        for (amp, epoch, name), exp in zip(coefficients(refstation),
+                                           expected):
+            assert (amp, epoch) == pytest.approx(exp[:2], abs=1e-4)
+            assert name == exp[2]
+
+    def test_shares_reference_station(self, catalog):
+        assert catalog[1].reference_station is catalog[0]
+
+    def test_interns_values(self, catalog):
+        assert catalog[0].tzfile is catalog[1].tzfile
+        assert catalog[0].country is catalog[1].country
+
+    def test_to_station(self, catalog, mmap_tcd):
+        station = catalog[1].to_station()
+        assert type(station) is type(mmap_tcd[1])
+        assert station.name == mmap_tcd[1].name
+        assert station.min_time_add == mmap_tcd[1].min_time_add
+        refstation = station.reference_station
+        assert type(refstation) is type(mmap_tcd[0])
+        assert len(refstation.coefficients) == 32
+
+    def test_to_station_shares_reference_station(self, catalog):
+        station1 = catalog[1].to_station()
+        station2 = catalog[1].to_station()
+        assert station1 is not station2
+        assert station1.reference_station is station2.reference_station
+
+    def test_unnumbered_reference_stations(self, mmap_tcd):
+        from libtcd.compact import CompactCatalog
+        catalog = CompactCatalog(mmap_tcd.constituents)
+        names = [u'Station %d' % n for n in range(20)]
+        for name in names:
+            # Each station is garbage once compacted, so its id may be
+            # reused by the next
+            station = mmap_tcd[0]
+            station.record_number = None
+            station.name = name
+            catalog.append(station)
+            del station
+        assert [compact.name for compact in catalog] == names
+
+    def test_does_not_keep_original_stations(self):
+        from libtcd.compact import CompactCatalog
+        from libtcd.tcdfile import MmapTcd
+        tcd = MmapTcd.open(TCD_FILENAME)
+        refs = []
+
+        def stations():
+            for station in tcd:
+                refs.append(weakref.ref(station))
+                if getattr(station, 'reference_station', None) is not None:
+                    refs.append(weakref.ref(station.reference_station))
+                yield station
+        catalog = CompactCatalog(tcd.constituents)
+        for station in stations():
+            catalog.append(station)
+        del station
+        tcd.close()
+        del tcd
+        gc.collect()
+        assert len(refs) == 3
+        assert [ref() for ref in refs] == [None] * 3
+        assert catalog[1].reference_station is catalog[0]
+
+    def test_pickle(self, catalog):
+        catalog[1].to_station()
+        station = pickle.loads(pickle.dumps(catalog[1]))
+        assert station.name == catalog[1].name
+        assert station.reference_station.amplitudes \
+            == catalog[0].amplitudes
+        assert not hasattr(station.reference_station, '_station')
+
+    def test_unknown_constituent(self, mmap_tcd):
+        from libtcd.compact import CompactCatalog
+        station = mmap_tcd[0]
+        del mmap_tcd.constituents['M2']
+        catalog = CompactCatalog(mmap_tcd.constituents)
+        with pytest.raises(ValueError):
+            catalog.append(station)
+
+    def test_not_a_station(self, catalog):
+        with pytest.raises(TypeError):
+            catalog.append(object())
+
+    def test_footprint(self, catalog):
+        from libtcd.compact import footprint, TARGET_BYTES_PER_STATION
+        assert footprint(catalog[0]) <= TARGET_BYTES_PER_STATION
+        assert footprint(catalog[1]) <= TARGET_BYTES_PER_STATION
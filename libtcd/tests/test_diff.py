@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from shutil import copyfile
+
+from pkg_resources import resource_filename
+import pytest
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+SEATTLE = u"Seattle, Puget Sound, Washington"
+TACOMA = u"Tacoma Narrows Bridge, Puget Sound, Washington"
+
+
+@pytest.fixture
+def mmap_tcd(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+def test_record_keys(mmap_tcd):
+    from libtcd.diff import _record_keys
+    assert _record_keys(mmap_tcd) == [
+        (1, SEATTLE.encode('ascii'), 0),
+        (2, TACOMA.encode('ascii'), 0),
+        ]
+
+
+def test_diff_identical(mmap_tcd):
+    from libtcd.diff import diff
+    from libtcd.tcdfile import MmapTcd
+    assert list(diff(mmap_tcd, MmapTcd(TCD_FILENAME))) == []
+
+
+@pytest.fixture
+def tcd_copies(tmpdir):
+    from libtcd.api import Tcd
+    copies = []
+    for name in 'old.tcd', 'new.tcd':
+        filename = str(tmpdir.join(name))
+        copyfile(TCD_FILENAME, filename)
+        copies.append(Tcd.open(filename))
+    return copies
+
+
+def test_diff(tcd_copies):
+    from libtcd.diff import diff, StationChange, ADDED, CHANGED, REMOVED
+    old, new = tcd_copies
+    tacoma = new[1]
+    tacoma.notes = u'Changed'
+    new[1] = tacoma
+    seattle = new[0]
+    seattle.name = u'Somewhere'
+    new.append(seattle)
+    assert list(diff(old, new)) == [
+        StationChange(CHANGED, 2, TACOMA.encode('ascii'), 1, 1),
+        StationChange(ADDED, 1, b'Somewhere', None, 2),
+        ]
+    del new[1]
+    assert list(diff(old, new))[-1] \
+        == StationChange(REMOVED, 2, TACOMA.encode('ascii'), 1, None)
+
+
+def test_apply_diff(tcd_copies):
+    from libtcd.diff import diff, apply_diff
+    old, new = tcd_copies
+    seattle = new[0]
+    seattle.name = u'Somewhere'
+    new.append(seattle)
+    tacoma = new[1]
+    tacoma.reference_station = seattle
+    new[1] = tacoma
+    del new[0]
+    counts = apply_diff(old, new, list(diff(old, new)))
+    assert counts == {'added': 1, 'changed': 1, 'removed': 1}
+    assert [s.name for s in old] == [TACOMA, u'Somewhere']
+    assert list(diff(old, new)) == []
+
+
+def test_apply_diff_subordinate_before_reference(tcd_copies):
+    from libtcd.diff import diff, apply_diff
+    old, new = tcd_copies
+    for tcd in old, new:
+        # Make Tacoma refer to a reference station stored after it
+        other = tcd[0]
+        other.name = u'Other'
+        tacoma = tcd[1]
+        tacoma.reference_station = other
+        tcd[1] = tacoma
+        assert [s.name for s in tcd] == [SEATTLE, TACOMA, u'Other']
+    del new[2]                  # also deletes Tacoma
+    assert len(new) == 1
+    counts = apply_diff(old, new, list(diff(old, new)))
+    assert counts == {'added': 0, 'changed': 0, 'removed': 2}
+    assert [s.name for s in old] == [SEATTLE]
+
+
+def test_apply_diff_cascaded_deletions():
+    from libtcd.diff import apply_diff, StationChange, REMOVED
+    from libtcd._libtcd import REFERENCE_STATION, SUBORDINATE_STATION
+
+    class Header(object):
+        def __init__(self, record_type, name, reference_station):
+            self.record_type = record_type
+            self.name = name
+            self.reference_station = reference_station
+
+    class Database(object):
+        # Records are (record_type, name, name of reference station)
+        def __init__(self, records):
+            self.records = list(records)
+            self.header_passes = 0
+
+        def __len__(self):
+            return len(self.records)
+
+        def extend(self, stations):
+            assert stations == []
+
+        def _reading(self):
+            return self
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_typ, exc_val, exc_tb):
+            pass
+
+        def _iter_headers(self):
+            self.header_passes += 1
+            names = [name for _, name, _ in self.records]
+            for record_type, name, refname in self.records:
+                yield Header(record_type, name,
+                             names.index(refname) if refname else -1)
+
+        def __delitem__(self, i):
+            record_type, name, _ = self.records[i]
+            # Deleting a reference station deletes its subordinates
+            self.records = [
+                rec for j, rec in enumerate(self.records)
+                if j != i and not (record_type == REFERENCE_STATION
+                                   and rec[2] == name)]
+
+    target = Database([
+        (SUBORDINATE_STATION, 'b1', 'B'),
+        (REFERENCE_STATION, 'A', None),
+        (SUBORDINATE_STATION, 'a1', 'A'),
+        (REFERENCE_STATION, 'B', None),
+        (REFERENCE_STATION, 'C', None),
+        (SUBORDINATE_STATION, 'c1', 'C'),
+        ])
+    changes = [
+        StationChange(REMOVED, SUBORDINATE_STATION, b'a1', 2, None),
+        StationChange(REMOVED, REFERENCE_STATION, b'A', 1, None),
+        StationChange(REMOVED, REFERENCE_STATION, b'B', 3, None),
+        ]
+    apply_diff(target, None, changes)
+    assert target.records == [
+        (REFERENCE_STATION, 'C', None),
+        (SUBORDINATE_STATION, 'c1', 'C'),
+        ]
+    # The headers are read once, however many stations are removed
+    assert target.header_passes == 1
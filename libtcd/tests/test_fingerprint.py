@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from binascii import hexlify
+import os
+import subprocess
+import sys
+
+from pkg_resources import resource_filename
+import pytest
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+
+@pytest.fixture
+def mmap_tcd(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+class Test_RecordDigester(object):
+    @pytest.fixture
+    def digest(self, mmap_tcd):
+        from libtcd.fingerprint import _RecordDigester
+        return _RecordDigester(mmap_tcd)
+
+    @pytest.fixture
+    def rec(self, mmap_tcd):
+        return mmap_tcd._get_record(1)
+
+    def test_ignores_record_number(self, digest, rec):
+        expected = digest(rec)
+        rec.record_number = 42
+        rec.record_size += 1
+        rec.reference_station = 1
+        assert digest(rec) == expected
+
+    @pytest.mark.parametrize('name, value', [
+        ('latitude', 0.0),
+        ('name', b'Somewhere'),
+        ('tzfile', 0),
+        ('notes', b'foo'),
+        ])
+    def test_detects_change(self, digest, rec, name, value):
+        expected = digest(rec)
+        setattr(rec, name, value)
+        assert digest(rec) != expected
+
+    def test_coefficients(self, digest, mmap_tcd):
+        rec = mmap_tcd._get_record(0)
+        expected = digest(rec)
+        rec.amplitude[5] += 1.0
+        assert digest(rec) != expected
+
+    def test_coefficients_are_identified_by_name(self, digest, mmap_tcd):
+        from libtcd.fingerprint import _RecordDigester
+        rec = mmap_tcd._get_record(0)
+        expected = digest(rec)
+        # Swap the first two constituents
+        swapped = _RecordDigester(mmap_tcd)
+        names = swapped.constituents
+        names[0], names[1] = names[1], names[0]
+        rec.amplitude[0], rec.amplitude[1] = rec.amplitude[1], rec.amplitude[0]
+        rec.epoch[0], rec.epoch[1] = rec.epoch[1], rec.epoch[0]
+        assert swapped(rec) == expected
+
+
+def test_fingerprint_table(mmap_tcd):
+    from libtcd.fingerprint import (
+        _RecordDigester,
+        fingerprint_table,
+        record_fingerprint,
+        )
+    from libtcd.tcdfile import MmapTcd
+    table = fingerprint_table(mmap_tcd, chunk_size=1)
+    assert len(table) == 2
+    assert table[0] != table[1]
+    assert table == fingerprint_table(MmapTcd(TCD_FILENAME))
+    assert table[0] == _RecordDigester(mmap_tcd)(mmap_tcd._get_record(0))
+    for i in range(2):
+        assert record_fingerprint(mmap_tcd, mmap_tcd._get_record(i)) \
+            == table[i]
+
+
+def test_fingerprints_are_stable_between_processes(mmap_tcd):
+    script = (
+        "from binascii import hexlify\n"
+        "from libtcd.tcdfile import MmapTcd\n"
+        "tcd = MmapTcd(%r)\n"
+        "print(' '.join(hexlify(f).decode('ascii')"
+        " for f in tcd.fingerprints()))\n" % TCD_FILENAME)
+    expected = ' '.join(hexlify(f).decode('ascii')
+                        for f in mmap_tcd.fingerprints())
+    for seed in '1', '2':
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         env=env)
+        assert output.decode('ascii').strip() == expected
+
+
+def test_subordinate_covers_refstation(mmap_tcd, monkeypatch):
+    from libtcd.fingerprint import _RecordDigester, fingerprint_table
+    expected = fingerprint_table(mmap_tcd)
+    digest = _RecordDigester.__call__
+
+    def changed_refstation(self, rec):
+        if rec.record_type == 1:
+            rec.latitude += 1
+        return digest(self, rec)
+    monkeypatch.setattr(_RecordDigester, '__call__', changed_refstation)
+    table = fingerprint_table(mmap_tcd)
+    assert table[0] != expected[0]
+    assert table[1] != expected[1]
+
+
+def test_fingerprints_are_cached(mmap_tcd):
+    fingerprints = mmap_tcd.fingerprints()
+    assert len(fingerprints) == 2
+    assert mmap_tcd.fingerprints() is fingerprints
+
+
+def test_duplicates(mmap_tcd):
+    from libtcd.fingerprint import duplicates
+    assert duplicates(mmap_tcd) == []
+    mmap_tcd._fingerprint_table = [b'a', b'b', b'a']
+    assert duplicates(mmap_tcd) == [[0, 2]]
+
+
+def test_fingerprints_invalidated_by_modification(temp_tcd):
+    fingerprints = temp_tcd.fingerprints()
+    station = temp_tcd[1]
+    station.notes = u'Changed'
+    temp_tcd[1] = station
+    assert temp_tcd.fingerprints()[1] != fingerprints[1]
+    temp_tcd.append(station)
+    assert len(temp_tcd.fingerprints()) == 3
+
+
+@pytest.fixture
+def temp_tcd(tmpdir):
+    from shutil import copyfile
+    from libtcd.api import Tcd
+    filename = str(tmpdir.join('test.tcd'))
+    copyfile(TCD_FILENAME, filename)
+    return Tcd.open(filename)
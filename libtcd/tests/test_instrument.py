@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from pkg_resources import resource_filename
+import pytest
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+
+@pytest.fixture
+def instrument(request):
+    from libtcd import instrument
+    instrument.reset()
+    instrument.enable()
+
+    def fin():
+        instrument.disable()
+        instrument.reset()
+    request.addfinalizer(fin)
+    return instrument
+
+
+class TestHistogram(object):
+    def test_observe(self):
+        from libtcd.instrument import Histogram, BUCKET_BOUNDS
+        histogram = Histogram()
+        histogram.observe(0.5e-6)
+        histogram.observe(3e-6)
+        histogram.observe(1e6)
+        snapshot = histogram.snapshot()
+        assert snapshot['count'] == 3
+        assert snapshot['min'] == 0.5e-6
+        assert snapshot['max'] == 1e6
+        assert snapshot['buckets'][:3] == [1, 1, 0]
+        assert snapshot['buckets'][len(BUCKET_BOUNDS)] == 1
+
+
+def test_enable_disable(instrument):
+    from libtcd import _libtcd, api
+    assert instrument.is_enabled()
+    get_speed = _libtcd.get_speed
+    assert get_speed._instrumented
+    lock = api._lock
+    instrument.enable()                 # idempotent
+    assert api._lock is lock
+    instrument.disable()
+    assert not instrument.is_enabled()
+    assert _libtcd.get_speed is get_speed._instrumented
+    assert api._lock is lock._instrumented
+    assert not hasattr(api.Tcd.__dict__['_make_current'], '_instrumented')
+
+
+def test_libtcd_calls(instrument, monkeypatch):
+    from libtcd import _libtcd
+    instrument.disable()
+    monkeypatch.setattr(_libtcd, 'get_speed', lambda i: 1.5)
+    instrument.enable()
+    assert _libtcd.get_speed(0) == 1.5
+    assert _libtcd.get_speed(1) == 1.5
+    metrics = instrument.snapshot()
+    assert metrics['libtcd']['get_speed']['count'] == 2
+
+
+def test_disable_leaves_replaced_functions(instrument, monkeypatch):
+    from libtcd import _libtcd
+
+    def replacement(i):
+        return 1.5
+    monkeypatch.setattr(_libtcd, 'get_speed', replacement)
+    instrument.disable()
+    assert _libtcd.get_speed is replacement
+
+
+def test_lock(instrument):
+    from libtcd import api
+    with api._lock:
+        assert api._lock.locked()
+    assert api._lock.acquire(False)
+    assert not api._lock.acquire(False)
+    api._lock.release()
+    metrics = instrument.snapshot()
+    assert metrics['lock']['wait']['count'] == 2
+    assert metrics['lock']['hold']['count'] == 2
+
+
+def test_records_decoded(instrument):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    assert len(list(tcd)) == 2
+    assert len(list(tcd.headers)) == 2
+    metrics = instrument.snapshot()
+    # Including the reference station of the subordinate station
+    assert metrics['decode']['record']['count'] == 3
+    assert metrics['decode']['header']['count'] == 3
+    assert metrics['records_decoded'] == 6
+    assert metrics['reopens'] == 0
+
+
+def test_subordinate_reference_station_decoded(instrument):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    assert tcd[1].reference_station.name == tcd[0].name
+    metrics = instrument.snapshot()
+    assert metrics['decode']['record']['count'] == 3
+    assert metrics['records_decoded'] == 3
+
+
+def test_lazy_attributes_decoded(instrument):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME, lazy=True)
+    station = tcd[0]
+    assert station.country == u'U.S.A.'
+    assert station.country == u'U.S.A.'
+    metrics = instrument.snapshot()
+    assert metrics['decode']['record']['count'] == 1
+    assert metrics['decode']['attribute']['count'] == 1
+    assert metrics['records_decoded'] == 1
+
+
+def test_string_table_calls(instrument, monkeypatch):
+    from libtcd import _libtcd
+    from libtcd.api import ReferenceStation
+    instrument.disable()
+    monkeypatch.setattr(_libtcd, 'get_country', lambda i: b'U.S.A.')
+    instrument.enable()
+    descriptor = [d for d in ReferenceStation._PACKED_ATTRS
+                  if d.name == 'country'][0]
+    assert descriptor.unpack_value(object(), 224) == u'U.S.A.'
+    metrics = instrument.snapshot()
+    assert metrics['libtcd']['get_country']['count'] == 1
+
+
+def test_reset(instrument):
+    from libtcd import api
+    with api._lock:
+        pass
+    instrument.reset()
+    metrics = instrument.snapshot()
+    assert metrics['lock'] == {}
+    assert metrics['records_decoded'] == 0
+
+
+def test_export(instrument):
+    exported = []
+    instrument.add_exporter(exported.append)
+    try:
+        metrics = instrument.export()
+    finally:
+        instrument.remove_exporter(exported.append)
+    assert exported == [metrics]
+    assert set(metrics) == set(['libtcd', 'lock', 'tcd', 'decode',
+                                'reopens', 'records_decoded'])
@@ -234,3 +234,29 @@ def test_delete_tide_record_failure(empty_tcdfile):
     with pytest.raises(_libtcd.Error) as excinfo:
         _libtcd.delete_tide_record(c_int32(0), header)
     assert 'delete_tide_record failed' in excinfo.exconly()
+
+
+def test_import_does_not_load_library():
+    import subprocess
+    import sys
+    script = ("import libtcd.api, libtcd._libtcd as _libtcd;"
+              "assert _libtcd._lib is None;"
+              "assert isinstance(_libtcd.get_speed, _libtcd._LazyFunction)")
+    subprocess.check_call([sys.executable, '-c', script])
+
+
+def test_lazy_function_binds_on_first_call(monkeypatch):
+    from ctypes.util import find_library
+    from libtcd import _libtcd
+    libc = find_library('c')
+    if libc is None:
+        pytest.skip("can not find libc")
+    monkeypatch.setattr(_libtcd, '_load_library',
+                        lambda: cdll.LoadLibrary(libc))
+    func = _libtcd._LazyFunction('abs', [_libtcd._Param(c_int32, 'i')],
+                                 c_int32, None, 'test_abs')
+    monkeypatch.setattr(_libtcd, 'test_abs', func, raising=False)
+    assert func(-42) == 42
+    assert _libtcd.test_abs is not func
+    assert _libtcd.test_abs.__name__ == 'test_abs'
+    assert func(i=-1) == 1
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from pkg_resources import resource_filename
+import pytest
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+SEATTLE = u"Seattle, Puget Sound, Washington"
+TACOMA = u"Tacoma Narrows Bridge, Puget Sound, Washington"
+
+
+@pytest.fixture(params=[1, 2])
+def parallel_tcd(request):
+    from libtcd.parallel import ParallelTcd
+    from libtcd.tcdfile import MmapTcd
+    tcd = ParallelTcd(TCD_FILENAME, processes=2, shard_size=request.param,
+                      tcd_class=MmapTcd)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+@pytest.fixture
+def mmap_tcd(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+def test_len(parallel_tcd):
+    assert len(parallel_tcd) == 2
+
+
+def test_constituents(parallel_tcd, mmap_tcd):
+    assert list(parallel_tcd.constituents) == list(mmap_tcd.constituents)
+
+
+def test_iter(parallel_tcd, mmap_tcd):
+    from libtcd.api import ReferenceStation, SubordinateStation
+    ref, sub = parallel_tcd
+    assert isinstance(ref, ReferenceStation)
+    assert isinstance(sub, SubordinateStation)
+    assert [ref.name, sub.name] == [SEATTLE, TACOMA]
+    assert sub.reference_station is ref
+
+    expected = mmap_tcd[0]
+    assert ref.datum == expected.datum
+    assert ref.xfields == expected.xfields
+    assert ref.zone_offset == expected.zone_offset
+    assert [(c.amplitude, c.epoch, c.constituent.name)
+            for c in ref.coefficients] \
+        == [(c.amplitude, c.epoch, c.constituent.name)
+            for c in expected.coefficients]
+    constituent = ref.coefficients[0].constituent
+    assert constituent is parallel_tcd.constituents[constituent.name]
+
+
+def test_stations_match_serial_decode(parallel_tcd, mmap_tcd):
+    def state(station):
+        d = dict(vars(station))
+        d.pop('coefficients', None)
+        d.pop('reference_station', None)
+        return d
+    assert list(map(state, parallel_tcd.decode_all())) \
+        == list(map(state, mmap_tcd))
+
+
+def test_iter_records_range(parallel_tcd):
+    sub, = parallel_tcd.iter_records(start=1)
+    assert sub.name == TACOMA
+    assert sub.reference_station.name == SEATTLE
+
+
+def test_getitem(parallel_tcd):
+    assert parallel_tcd[-1].name == TACOMA
+    with pytest.raises(IndexError):
+        parallel_tcd[2]
+
+
+def test_bad_shard_size():
+    from libtcd.parallel import ParallelTcd
+    with pytest.raises(ValueError):
+        ParallelTcd(TCD_FILENAME, shard_size=0)
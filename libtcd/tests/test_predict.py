@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+from __future__ import absolute_import
+
+import calendar
+import datetime
+from math import cos, radians
+from pkg_resources import resource_filename
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+
+@pytest.fixture
+def constituents():
+    from libtcd.api import Constituent, NodeFactors, NodeFactor
+    rnd = numpy.random.RandomState(42)
+    constituents = []
+    for i, speed in enumerate([28.9841042, 30.0, 15.0410686, 13.9430356]):
+        factors = [NodeFactor(rnd.uniform(0, 360), rnd.uniform(0.8, 1.2))
+                   for year in range(2000, 2020)]
+        constituents.append(
+            Constituent('C%d' % i, speed, NodeFactors(2000, factors)))
+    return constituents
+
+
+@pytest.fixture
+def refstation(constituents):
+    from libtcd.api import Coefficient, ReferenceStation
+    coefficients = [Coefficient(1.0 + 0.5 * i, 10.0 + 40.0 * i, c)
+                    for i, c in enumerate(constituents)]
+    return ReferenceStation(
+        u'Somewhere', coefficients,
+        datum_offset=2.5,
+        zone_offset=datetime.timedelta(hours=-8))
+
+
+def naive_predict(station, t):
+    """ Straightforward (slow) implementation of the harmonic sum """
+    dt = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=t)
+    year_start = calendar.timegm(datetime.date(dt.year, 1, 1).timetuple())
+    hours = (t - year_start) / 3600.0
+    zone_offset = station.zone_offset.total_seconds() / 3600.0
+    height = station.datum_offset
+    for coeff in station.coefficients:
+        speed = coeff.constituent.speed
+        equilibrium, node_factor = coeff.constituent.node_factors[dt.year]
+        phase = coeff.epoch - speed * zone_offset
+        height += coeff.amplitude * node_factor * cos(
+            radians(speed * hours + equilibrium - phase))
+    return height
+
+
+def timestamp(*args):
+    return calendar.timegm(datetime.datetime(*args).timetuple())
+
+
+class TestAsSeconds(object):
+    def call_it(self, times):
+        from libtcd.predict import as_seconds
+        return as_seconds(times)
+
+    def test_numbers(self):
+        assert list(self.call_it([0, 1.5])) == [0.0, 1.5]
+
+    def test_datetime64(self):
+        times = numpy.array(['1970-01-01T00:01', '2000-01-01T00:00'],
+                            dtype='datetime64[m]')
+        assert list(self.call_it(times)) == [60.0, 946684800.0]
+
+    def test_datetimes(self):
+        class UTC(datetime.tzinfo):
+            def utcoffset(self, dt):
+                return datetime.timedelta(hours=1)
+
+            def dst(self, dt):
+                return datetime.timedelta(0)
+        times = [datetime.datetime(1970, 1, 1, 0, 1, 0, 500000),
+                 datetime.datetime(1970, 1, 1, 1, tzinfo=UTC())]
+        assert list(self.call_it(times)) == [60.5, 0.0]
+
+
+class TestPredict(object):
+    def call_it(self, station, times):
+        from libtcd.predict import predict
+        return predict(station, times)
+
+    @pytest.mark.parametrize('step', [360.0, 3600.0])
+    def test_evenly_spaced(self, refstation, step):
+        # spans a year boundary
+        times = timestamp(2010, 12, 31, 12) + numpy.arange(0, 86400, step)
+        expected = [naive_predict(refstation, t) for t in times]
+        heights = self.call_it(refstation, times)
+        assert heights == pytest.approx(expected, abs=1e-9)
+
+    def test_unevenly_spaced(self, refstation):
+        rnd = numpy.random.RandomState(0)
+        times = timestamp(2005, 1, 1) + rnd.uniform(0, 5 * 365 * 86400, 500)
+        expected = [naive_predict(refstation, t) for t in times]
+        heights = self.call_it(refstation, times)
+        assert heights == pytest.approx(expected, abs=1e-9)
+
+    def test_shape(self, refstation):
+        times = timestamp(2005, 1, 1) + numpy.arange(6.0).reshape(2, 3)
+        assert self.call_it(refstation, times).shape == (2, 3)
+        assert self.call_it(refstation, times[0, 0]).shape == ()
+
+    def test_out_of_range(self, refstation):
+        with pytest.raises(ValueError):
+            self.call_it(refstation, [timestamp(2025, 1, 1)])
+
+    def test_no_coefficients(self):
+        from libtcd.api import ReferenceStation
+        station = ReferenceStation(u'Flat', [], datum_offset=1.25)
+        assert list(self.call_it(station, [0.0, 1.0])) == [1.25, 1.25]
+
+    def test_hydraulic(self):
+        from libtcd.api import ReferenceStation
+        station = ReferenceStation(u'Current', [], datum_offset=-4.0,
+                                   level_units=u'knots^2')
+        assert self.call_it(station, 0.0) == -2.0
+
+    def test_test_tcd(self):
+        from libtcd.api import Tcd
+        station = Tcd.open(TCD_FILENAME)[0]
+        times = timestamp(2015, 6, 1) + numpy.arange(0, 86400, 600.0)
+        expected = [naive_predict(station, t) for t in times]
+        heights = self.call_it(station, times)
+        assert heights == pytest.approx(expected, abs=1e-6)
+
+
+@pytest.fixture
+def smooth_refstation():
+    """ A reference station whose equilibrium arguments are consistent from
+    year to year, so that its tide curve is continuous.
+    """
+    from libtcd.api import (
+        Coefficient, Constituent, NodeFactor, NodeFactors, ReferenceStation)
+    speeds = [28.9841042, 30.0, 28.4397295, 15.0410686, 13.9430356]
+    amplitudes = [1.0, 0.25, 0.2, 0.6, 0.4]
+    coefficients = []
+    for i, (speed, amplitude) in enumerate(zip(speeds, amplitudes)):
+        equilibrium = 37.0 * i
+        factors = []
+        for year in range(2000, 2020):
+            factors.append(NodeFactor(equilibrium % 360, 1.0))
+            equilibrium += speed * 24 * (366 if calendar.isleap(year) else 365)
+        constituent = Constituent('C%d' % i, speed, NodeFactors(2000, factors))
+        coefficients.append(Coefficient(amplitude, 50.0 * i, constituent))
+    return ReferenceStation(u'Smooth', coefficients, datum_offset=2.0,
+                            zone_offset=datetime.timedelta(hours=-8))
+
+
+@pytest.fixture
+def substation(smooth_refstation):
+    from libtcd.api import SubordinateStation, timeoffset
+    return SubordinateStation(
+        u'Nearby', smooth_refstation,
+        min_time_add=timeoffset(minutes=-20),
+        max_time_add=timeoffset(minutes=45),
+        min_level_multiply=0.5,
+        max_level_add=0.25)
+
+
+class TestHarmonics(object):
+    @pytest.fixture
+    def harmonics(self, smooth_refstation):
+        from libtcd.predict import Harmonics
+        return Harmonics.from_station(smooth_refstation)
+
+    def test_derivative(self, harmonics):
+        times = timestamp(2012, 12, 31) + numpy.arange(0, 2 * 86400, 3000.0)
+        finite_difference = (harmonics.predict(times + 1)
+                             - harmonics.predict(times - 1)) / 2 * 3600
+        rates = harmonics.predict(times, derivative=1)
+        assert rates == pytest.approx(finite_difference, abs=1e-6)
+
+    def test_extrema(self, harmonics):
+        start = timestamp(2012, 12, 25)
+        end = timestamp(2013, 1, 5)
+        times, heights, is_high = harmonics.extrema(start, end)
+        assert numpy.all((times >= start) & (times <= end))
+        assert numpy.all(numpy.diff(times) > 0)
+        assert numpy.all(is_high[1:] != is_high[:-1])
+        assert numpy.abs(
+            harmonics.predict(times, derivative=1)).max() < 1e-3
+        assert heights == pytest.approx(harmonics.predict(times))
+
+        # Compare with a brute-force search for extrema
+        dense = harmonics.predict(numpy.arange(start, end, 60.0))
+        diffs = numpy.diff(dense)
+        n_highs = numpy.sum((diffs[:-1] > 0) & (diffs[1:] <= 0))
+        n_lows = numpy.sum((diffs[:-1] < 0) & (diffs[1:] >= 0))
+        assert numpy.sum(is_high) == n_highs
+        assert numpy.sum(~is_high) == n_lows
+
+
+class TestSubordinateOffsets(object):
+    def test_apply(self):
+        from libtcd.predict import Extrema, SubordinateOffsets
+        offsets = SubordinateOffsets(
+            min_time_add=-600.0, min_level_multiply=2.0, min_level_add=1.0,
+            max_time_add=1200.0, max_level_multiply=0.5, max_level_add=-1.0)
+        extrema = Extrema(numpy.array([0.0, 1000.0, 2000.0]),
+                          numpy.array([1.0, 4.0, 1.5]),
+                          numpy.array([False, True, False]))
+        times, heights, is_high = offsets.apply(extrema)
+        assert list(times) == [-600.0, 1400.0, 2200.0]
+        assert list(heights) == [3.0, 4.0, 1.0]
+        assert list(is_high) == [False, False, True]
+
+    def test_from_station_defaults(self, smooth_refstation):
+        from libtcd.api import SubordinateStation
+        from libtcd.predict import SubordinateOffsets
+        offsets = SubordinateOffsets.from_station(
+            SubordinateStation(u'Sub', smooth_refstation))
+        assert offsets.min_time_add == offsets.max_time_add == 0.0
+        assert offsets.min_level_multiply == offsets.max_level_multiply == 1.0
+        assert offsets.min_level_add == offsets.max_level_add == 0.0
+
+
+class TestInterpolateExtrema(object):
+    def call_it(self, extrema, times):
+        from libtcd.predict import interpolate_extrema
+        return interpolate_extrema(extrema, times)
+
+    @pytest.fixture
+    def extrema(self):
+        from libtcd.predict import Extrema
+        return Extrema(numpy.array([0.0, 100.0, 300.0]),
+                       numpy.array([0.0, 2.0, -2.0]),
+                       numpy.array([False, True, False]))
+
+    def test(self, extrema):
+        heights = self.call_it(extrema, [0.0, 50.0, 100.0, 200.0, 300.0])
+        assert heights == pytest.approx([0.0, 1.0, 2.0, 0.0, -2.0])
+
+    @pytest.mark.parametrize('t', [-1.0, 301.0])
+    def test_raises_value_error(self, extrema, t):
+        with pytest.raises(ValueError):
+            self.call_it(extrema, [t])
+
+
+class TestSubordinatePrediction(object):
+    def test_extrema(self, smooth_refstation, substation):
+        from libtcd.predict import extrema
+        start = timestamp(2013, 3, 1)
+        end = timestamp(2013, 3, 4)
+        ref = extrema(smooth_refstation, start - 86400, end + 86400)
+        sub = extrema(substation, start, end)
+        i = numpy.searchsorted(ref.times, sub.times[0] - 2700.0 - 1)
+        ref_times = ref.times[i:i + len(sub.times)]
+        ref_heights = ref.heights[i:i + len(sub.times)]
+        assert list(sub.is_high) == list(ref.is_high[i:i + len(sub.times)])
+        assert sub.times == pytest.approx(
+            ref_times + numpy.where(sub.is_high, 2700.0, -1200.0), abs=1.0)
+        assert sub.heights == pytest.approx(
+            numpy.where(sub.is_high, ref_heights + 0.25, ref_heights * 0.5),
+            abs=1e-6)
+
+    def test_predict(self, substation):
+        from libtcd.predict import extrema, predict
+        start = timestamp(2013, 3, 1)
+        sub = extrema(substation, start, start + 2 * 86400)
+        assert predict(substation, sub.times) \
+            == pytest.approx(sub.heights, abs=1e-6)
+        heights = predict(substation, start + numpy.arange(0, 86400, 600.0))
+        assert heights.min() >= sub.heights.min() - 1e-6
+        assert heights.max() <= sub.heights.max() + 1e-6
+
+    def test_predict_empty(self, substation):
+        from libtcd.predict import predict
+        assert predict(substation, []).shape == (0,)
+
+    def test_tide_tables(self, smooth_refstation, substation):
+        from libtcd.api import SubordinateStation
+        from libtcd.predict import extrema, tide_tables
+        start = timestamp(2013, 3, 1)
+        end = timestamp(2013, 3, 8)
+        other = SubordinateStation(u'Other', smooth_refstation,
+                                   max_level_multiply=2.0)
+        stations = [smooth_refstation, substation, other]
+        tables = tide_tables(stations, start, end)
+        for station, table in zip(stations, tables):
+            expected = extrema(station, start, end)
+            assert table.times == pytest.approx(expected.times, abs=1.0)
+            assert table.heights == pytest.approx(expected.heights, abs=1e-6)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+from __future__ import absolute_import
+
+import random
+
+import pytest
+
+
+def test_great_circle_distance():
+    from libtcd.spatial import great_circle_distance, EARTH_RADIUS
+    assert great_circle_distance(0, 0, 0, 0) == 0
+    assert great_circle_distance(0, 0, 0, 90) \
+        == pytest.approx(EARTH_RADIUS * 3.14159265 / 2)
+    assert great_circle_distance(90, 0, -90, 0, radius=1.0) \
+        == pytest.approx(3.14159265)
+
+
+class TestSpatialIndex(object):
+    def make_one(self, locations):
+        from libtcd.spatial import SpatialIndex
+        return SpatialIndex(locations)
+
+    @pytest.fixture
+    def locations(self):
+        rnd = random.Random(42)
+        locations = [(i, rnd.uniform(-90, 90), rnd.uniform(-180, 180))
+                     for i in range(500)]
+        locations.append((500, None, None))
+        return locations
+
+    @pytest.fixture
+    def index(self, locations):
+        return self.make_one(locations)
+
+    @staticmethod
+    def brute_force(locations, latitude, longitude):
+        from libtcd.spatial import great_circle_distance
+        return sorted(
+            (great_circle_distance(latitude, longitude, lat, lon), i)
+            for i, lat, lon in locations
+            if lat is not None)
+
+    def test_len(self, index):
+        assert len(index) == 500
+
+    @pytest.mark.parametrize('point', [(0, 0), (47.6, -122.3), (-89, 179)])
+    def test_nearest(self, index, locations, point):
+        expected = self.brute_force(locations, *point)[:7]
+        neighbors = index.nearest(point[0], point[1], k=7)
+        assert [n.record_number for n in neighbors] \
+            == [i for d, i in expected]
+        assert [n.distance for n in neighbors] \
+            == pytest.approx([d for d, i in expected])
+
+    def test_nearest_k_zero(self, index):
+        assert index.nearest(0, 0, k=0) == []
+
+    def test_nearest_empty(self):
+        index = self.make_one([])
+        assert index.nearest(0, 0) == []
+
+    @pytest.mark.parametrize('distance', [0, 500, 2500, 1e6])
+    def test_within_radius(self, index, locations, distance):
+        expected = [i for d, i in self.brute_force(locations, 10, 20)
+                    if d <= distance]
+        neighbors = index.within_radius(10, 20, distance)
+        assert [n.record_number for n in neighbors] == expected
+
+    @pytest.mark.parametrize('bbox', [
+        (-10, -20, 30, 40),
+        (-90, -180, 90, 180),
+        (20, 170, 60, -170),            # crosses the antimeridian
+        (20, 530, 60, -530),
+        ])
+    def test_within_bbox(self, index, locations, bbox):
+        south, west, north, east = bbox
+        west = (west + 180) % 360 - 180 if abs(west) > 180 else west
+        east = (east + 180) % 360 - 180 if abs(east) > 180 else east
+
+        def in_box(lat, lon):
+            if not south <= lat <= north:
+                return False
+            if west <= east:
+                return west <= lon <= east
+            return lon >= west or lon <= east
+        expected = [i for i, lat, lon in locations
+                    if lat is not None and in_box(lat, lon)]
+        assert index.within_bbox(*bbox) == expected
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import datetime
+import sys
+import threading
+
+from pkg_resources import resource_filename
+import pytest
+
+TCD_FILENAME = resource_filename('libtcd.tests', 'test.tcd')
+
+SEATTLE = u"Seattle, Puget Sound, Washington"
+TACOMA = u"Tacoma Narrows Bridge, Puget Sound, Washington"
+
+
+@pytest.fixture
+def mmap_tcd(request):
+    from libtcd.tcdfile import MmapTcd
+    tcd = MmapTcd.open(TCD_FILENAME)
+    request.addfinalizer(tcd.close)
+    return tcd
+
+
+@pytest.mark.parametrize('buf, pos, nbits, expected', [
+    (b'\xff', 0, 8, 0xff),
+    (b'\x0f\xf0', 4, 8, 0xff),
+    (b'\x80\x00\x01', 0, 1, 1),
+    (b'\x80\x00\x01', 1, 22, 0),
+    (b'\x80\x00\x01', 23, 1, 1),
+    (b'\x12\x34\x56', 4, 16, 0x2345),
+    ])
+def test_unpack_bits(buf, pos, nbits, expected):
+    from libtcd.tcdfile import _unpack_bits
+    assert _unpack_bits(buf, pos, nbits) == expected
+
+
+class Test_BitReader(object):
+    def make_one(self, buf, pos=0):
+        from libtcd.tcdfile import _BitReader
+        return _BitReader(buf, pos)
+
+    def test_signed(self):
+        reader = self.make_one(b'\xf0\x70')
+        assert reader.signed(4) == -1
+        assert reader.signed(4) == 0
+        assert reader.signed(8) == 0x70
+        assert reader.pos == 16
+
+    @pytest.mark.parametrize('shift', range(8))
+    def test_string(self, shift):
+        s = b'foo bar' * 50
+        bits = '1' * shift + ''.join(
+            '{0:08b}'.format(c) for c in bytearray(s + b'\0'))
+        nbits = len(bits)
+        bits += '1' * (8 - nbits % 8)
+        buf = bytearray(int(bits[i:i + 8], 2)
+                        for i in range(0, len(bits), 8))
+        reader = self.make_one(bytes(buf) + b'\xff', shift)
+        assert reader.string(1000) == s
+        assert reader.pos == nbits
+
+    def test_string_is_truncated(self):
+        reader = self.make_one(b'abcdef\0')
+        assert reader.string(4) == b'abc'
+        assert reader.pos == 56
+
+    def test_unterminated_string(self):
+        from libtcd.api import InvalidTcdFile
+        reader = self.make_one(b'abc' * 100, 3)
+        with pytest.raises(InvalidTcdFile):
+            reader.string(1000)
+
+
+class TestTcdFile(object):
+    @pytest.fixture
+    def tcdfile(self, request):
+        from libtcd.tcdfile import TcdFile
+        tcdfile = TcdFile(TCD_FILENAME)
+        request.addfinalizer(tcdfile.close)
+        return tcdfile
+
+    def test_header(self, tcdfile):
+        header = tcdfile.header
+        assert header.major_rev == 2
+        assert header.number_of_records == 2
+        assert header.start_year == 1970
+        assert header.number_of_years == 68
+        assert header.constituents == 173
+        assert len(tcdfile) == 2
+
+    @pytest.mark.parametrize('table_name, i, expected', [
+        ('level_units', 1, b'feet'),
+        ('level_units', 4, b'knots^2'),
+        ('dir_units', 1, b'degrees true'),
+        ('restriction', 2, b'Non-commercial use only'),
+        ('tzfile', 115, b':America/Los_Angeles'),
+        ('datum', 3, b'Mean Lower Low Water'),
+        ('legalese', 0, b'NULL'),
+        ('constituent', 0, b'J1'),
+        ('country', -1, b'Unknown'),
+        ('country', 241, b'Unknown'),
+        ])
+    def test_get_string(self, tcdfile, table_name, i, expected):
+        assert tcdfile.get_string(table_name, i) == expected
+
+    def test_find_string(self, tcdfile):
+        assert tcdfile.find_string('tzfile', b':America/Los_Angeles') == 115
+        assert tcdfile.find_string('country', b'Atlantis') == -1
+
+    def test_speeds(self, tcdfile):
+        assert len(tcdfile.speeds) == 173
+        assert tcdfile.speeds[0] == pytest.approx(15.5854433)
+        assert tcdfile.speeds[5] == pytest.approx(28.9841042)
+
+    def test_equilibriums(self, tcdfile):
+        equilibriums = tcdfile.get_equilibriums(5)
+        assert len(equilibriums) == 68
+        assert equilibriums[0] == pytest.approx(165.43, abs=1e-4)
+
+    def test_node_factors(self, tcdfile):
+        node_factors = tcdfile.get_node_factors(5)
+        assert len(node_factors) == 68
+        assert node_factors[0] == pytest.approx(0.9665, abs=1e-6)
+        with pytest.raises(IndexError):
+            tcdfile.get_node_factors(173)
+
+    def test_read_header(self, tcdfile):
+        header = tcdfile.read_header(1)
+        assert header.record_number == 1
+        assert header.record_type == 2
+        assert header.name == TACOMA.encode('ascii')
+        assert header.reference_station == 0
+        assert header.tzfile == 115
+        assert tcdfile.read_header(2) is None
+        assert tcdfile.read_header(-1) is None
+
+    def test_read_record(self, tcdfile):
+        rec = tcdfile.read_record(0)
+        assert rec.record_type == 1
+        assert rec.name == SEATTLE.encode('ascii')
+        assert rec.reference_station == -1
+        assert rec.latitude == pytest.approx(47.6033)
+        assert rec.longitude == pytest.approx(-122.34)
+        assert rec.datum == 3
+        assert sum(1 for a in rec.amplitude if a != 0) == 32
+        assert tcdfile.read_record(2) is None
+
+    def test_read_subordinate_record(self, tcdfile):
+        rec = tcdfile.read_record(1)
+        assert rec.record_type == 2
+        assert rec.min_level_multiply == pytest.approx(1.02)
+        assert rec.max_level_multiply == pytest.approx(1.11)
+
+    def test_read_into_buffer(self, tcdfile):
+        from ctypes import addressof, sizeof, string_at
+        from libtcd._libtcd import TIDE_RECORD
+
+        def as_bytes(rec):
+            return string_at(addressof(rec), sizeof(rec))
+
+        buf = TIDE_RECORD()
+        assert tcdfile.read_record(0, buf) is buf
+        assert tcdfile.read_record(1, buf) is buf
+        assert as_bytes(buf) == as_bytes(tcdfile.read_record(1))
+        header = buf.header
+        assert tcdfile.read_header(0, header) is header
+        assert buf.name == SEATTLE.encode('ascii')
+        assert tcdfile.read_record(2, buf) is None
+
+    def test_truncated_file(self, tmpdir):
+        from libtcd.api import InvalidTcdFile
+        from libtcd.tcdfile import TcdFile
+        with open(TCD_FILENAME, 'rb') as fp:
+            data = fp.read()
+        path = tmpdir.join('truncated.tcd')
+        path.write_binary(data[:-100])
+        with pytest.raises(InvalidTcdFile):
+            TcdFile(str(path))
+
+    def test_header_without_legalese(self, tcdfile, tmpdir):
+        from libtcd.tcdfile import TcdFile
+        # Older version 2 files have no legalese table
+        with open(TCD_FILENAME, 'rb') as fp:
+            data = fp.read()
+        for key in b'BITS', b'TYPES', b'SIZE':
+            line = data[data.index(b'[LEGALESE ' + key):]
+            line = line[:line.index(b'\n') + 1]
+            data = data.replace(line, b'\n' * len(line))
+        table = tcdfile._string_tables['legalese']
+        start = table.offset
+        end = start + 16 * table.size
+        data = data.replace(
+            ('[END OF FILE] = %d' % len(data)).encode('ascii'),
+            ('[END OF FILE] = %d' % (len(data) - (end - start)))
+            .encode('ascii'))
+        path = tmpdir.join('old.tcd')
+        path.write_binary(data[:start] + data[end:])
+
+        old = TcdFile(str(path))
+        try:
+            assert old.header.legaleses == 1
+            assert old.get_strings('legalese') == [b'NULL']
+            assert old.get_string('tzfile', 115) == b':America/Los_Angeles'
+            assert old.get_string('constituent', 0) == b'J1'
+            assert old.speeds == tcdfile.speeds
+            assert old.read_header(1).name == TACOMA.encode('ascii')
+        finally:
+            old.close()
+
+    def test_not_a_tcd_file(self, tmpdir):
+        from libtcd.api import InvalidTcdFile
+        from libtcd.tcdfile import TcdFile
+        path = tmpdir.join('bad.tcd')
+        path.write_binary(b'not a tcd file')
+        with pytest.raises(InvalidTcdFile):
+            TcdFile(str(path))
+
+
+class TestMmapTcd(object):
+    def test_len(self, mmap_tcd):
+        assert len(mmap_tcd) == 2
+
+    def test_getitem(self, mmap_tcd):
+        from libtcd.api import ReferenceStation
+        station = mmap_tcd[0]
+        assert isinstance(station, ReferenceStation)
+        assert station.name == SEATTLE
+        assert station.record_number == 0
+        assert station.tzfile == u':America/Los_Angeles'
+        assert station.country == u'U.S.A.'
+        assert station.datum == u'Mean Lower Low Water'
+        assert station.level_units == u'feet'
+        assert station.date_imported == datetime.date(2009, 12, 23)
+        assert len(station.coefficients) == 32
+        m2, = [c for c in station.coefficients if c.constituent.name == 'M2']
+        assert m2.amplitude == pytest.approx(3.516, abs=1e-6)
+
+    def test_getitem_subordinate(self, mmap_tcd):
+        station = mmap_tcd[-1]
+        assert station.name == TACOMA
+        assert station.reference_station.name == SEATTLE
+        assert station.min_time_add == datetime.timedelta(minutes=23)
+        assert station.max_time_add == datetime.timedelta(minutes=28)
+        assert station.flood_begins is None
+
+    def test_getitem_raises_index_error(self, mmap_tcd):
+        with pytest.raises(IndexError):
+            mmap_tcd[2]
+
+    def test_iter(self, mmap_tcd):
+        assert [s.name for s in mmap_tcd] == [SEATTLE, TACOMA]
+
+    def test_read_chunk_into_buffers(self, mmap_tcd):
+        from libtcd._libtcd import TIDE_RECORD
+        buffers = [TIDE_RECORD() for _ in range(3)]
+        records = mmap_tcd._read_chunk(0, 3, buffers)
+        assert records == buffers[:2]
+        assert [rec.name for rec in records] \
+            == [SEATTLE.encode('ascii'), TACOMA.encode('ascii')]
+
+    def test_headers(self, mmap_tcd):
+        from libtcd.api import ReferenceStationHeader
+        headers = list(mmap_tcd.headers)
+        assert [h.name for h in headers] == [SEATTLE, TACOMA]
+        refstation = headers[1].reference_station
+        assert isinstance(refstation, ReferenceStationHeader)
+        assert refstation.name == SEATTLE
+
+    def test_find(self, mmap_tcd):
+        assert mmap_tcd.find(TACOMA).record_number == 1
+        assert mmap_tcd.index(mmap_tcd[0]) == 0
+        with pytest.raises(KeyError):
+            mmap_tcd.find(u'Nowhere')
+
+    def test_nearest(self, mmap_tcd):
+        nearest, = mmap_tcd.nearest(47.3, -122.5)
+        assert nearest.name == TACOMA
+
+    def test_constituents(self, mmap_tcd):
+        constituents = mmap_tcd.constituents
+        assert len(constituents) == 173
+        assert list(constituents)[:2] == [u'J1', u'K1']
+        m2 = constituents[u'M2']
+        assert m2.speed == pytest.approx(28.9841042)
+        assert m2.node_factors.start_year == 1970
+        assert m2.node_factors.end_year == 2038
+
+    def test_constituent_tables(self, mmap_tcd):
+        tables = mmap_tcd.constituent_tables
+        assert len(tables) == 173
+        assert len(tables.node_factors) == 173 * 68
+        assert tables.node_factors[5 * 68] == pytest.approx(0.9665, abs=1e-6)
+        m2 = mmap_tcd.constituents[u'M2']
+        assert m2.node_factors[1970].node_factor \
+            == tables.node_factors[5 * 68]
+
+    def test_is_read_only(self, mmap_tcd):
+        with pytest.raises((AttributeError, TypeError)):
+            mmap_tcd.append(mmap_tcd[0])
+        with pytest.raises((AttributeError, TypeError)):
+            del mmap_tcd[0]
+
+    def test_does_not_use_global_lock(self, mmap_tcd):
+        from libtcd.api import _lock
+        with _lock:
+            assert mmap_tcd[1].name == TACOMA
+            assert list(mmap_tcd.headers)[0].name == SEATTLE
+
+    def test_concurrent_reads(self, mmap_tcd):
+        from libtcd.tcdfile import MmapTcd
+        results = []
+
+        def read():
+            tcd = MmapTcd.open(TCD_FILENAME)
+            names = [s.name for s in tcd] + [s.name for s in mmap_tcd]
+            results.append(names)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [[SEATTLE, TACOMA] * 2] * 8
+
+    def test_concurrent_subordinate_reads(self, mmap_tcd):
+        errors = []
+
+        def read():
+            try:
+                for n in range(200):
+                    station = mmap_tcd[1]
+                    assert station.reference_station.name == SEATTLE
+                    if n % 3 == 0:
+                        mmap_tcd._invalidate_refstations()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        # Switch threads often, to provoke races
+        interval = getattr(sys, 'getswitchinterval', lambda: None)()
+        if interval is not None:
+            sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if interval is not None:
+                sys.setswitchinterval(interval)
+        assert errors == []
+        for cache in mmap_tcd._refstation_caches.values():
+            assert cache.size == len(cache) <= 1
@@ -4,6 +4,8 @@
 from __future__ import absolute_import
 
 from datetime import timedelta
+import sys
+import threading
 import unittest
 
 import pytest
@@ -63,6 +65,103 @@ class Test_remove_if_exists(object):
             self.call_it(testdir.strpath)
 
 
+class TestLRUCache(object):
+    def make_one(self, maxsize=2):
+        from libtcd.util import LRUCache
+        return LRUCache(maxsize)
+
+    def test_get(self):
+        cache = self.make_one()
+        cache['a'] = 1
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('b', 42) == 42
+
+    def test_evicts_least_recently_used(self):
+        cache = self.make_one()
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        assert len(cache) == 2
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+
+    def test_replace(self):
+        cache = self.make_one()
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 3
+        assert len(cache) == 2
+        assert cache.get('a') == 3
+
+    def test_pop(self):
+        cache = self.make_one()
+        cache['a'] = 1
+        assert cache.pop('a') == 1
+        assert cache.pop('a') is None
+        assert len(cache) == 0
+
+    def test_clear(self):
+        cache = self.make_one()
+        cache['a'] = 1
+        cache.clear()
+        assert 'a' not in cache
+        assert cache.size == 0
+
+    def test_sizeof(self):
+        from libtcd.util import LRUCache
+        cache = LRUCache(10, sizeof=len)
+        cache['a'] = 'x' * 4
+        cache['b'] = 'x' * 4
+        assert cache.size == 8
+        cache.get('a')
+        cache['c'] = 'x' * 3
+        assert cache.keys() == ['a', 'c']
+        assert cache.size == 7
+        cache['d'] = 'x' * 11           # too large
+        assert 'd' not in cache
+        assert cache.pop('a') == 'x' * 4
+        assert cache.size == 3
+
+    def test_bad_maxsize(self):
+        with pytest.raises(ValueError):
+            self.make_one(0)
+
+    def test_concurrent_use(self):
+        from libtcd.util import LRUCache
+        cache = LRUCache(4, sizeof=len)
+        errors = []
+
+        def use(t):
+            try:
+                for n in range(5000):
+                    key = n % 7
+                    cache[key] = 'x' * (1 + (n + t) % 3)
+                    cache.get((key + 1) % 7)
+                    cache.pop((key + 2) % 7)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=use, args=(t,)) for t in range(8)]
+        # Switch threads often, to provoke races
+        interval = getattr(sys, 'getswitchinterval', lambda: None)()
+        if interval is not None:
+            sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if interval is not None:
+                sys.setswitchinterval(interval)
+        assert errors == []
+        assert cache.size == sum(len(cache.get(key)) for key in cache.keys())
+        assert cache.size <= 4
+
+
 class TestReify(unittest.TestCase):
     # Ripped verbatim from pyramid.tests.test_decorator
     def _makeOne(self, wrapped):
@@ -5,6 +5,9 @@ from __future__ import absolute_import
 
 import errno
 import os
+import threading
+
+from .compat import OrderedDict
 
 
 def timedelta_total_minutes(td, strict=False):
@@ -61,3 +64,78 @@ class reify(object):
         val = self.wrapped(inst)
         setattr(inst, self.wrapped.__name__, val)
         return val
+
+
+class LRUCache(object):
+    """ A mapping which holds at most ``maxsize`` items.
+
+    When full, the least recently used item is discarded to make room
+    for a new one.
+
+    If ``sizeof`` is given, it is called to compute the size of each
+    value, and ``maxsize`` limits the total size of the values, rather
+    than their number.  Values larger than ``maxsize`` are not stored.
+
+    The cache may be used from multiple threads.
+
+    """
+    def __init__(self, maxsize=128, sizeof=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return self.sizeof(value) if self.sizeof is not None else 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value     # mark as most recently used
+            return value
+
+    def __setitem__(self, key, value):
+        size = self._size(value)
+        with self._lock:
+            data = self._data
+            self._pop(key)
+            if size > self.maxsize:
+                return
+            while self.size + size > self.maxsize:
+                _, discarded = data.popitem(last=False)
+                self.size -= self._size(discarded)
+            data[key] = value
+            self.size += size
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._pop(key, default)
+
+    def _pop(self, key, default=None):
+        # The caller must hold self._lock
+        if key not in self._data:
+            return default
+        value = self._data.pop(key)
+        self.size -= self._size(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
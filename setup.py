@@ -15,6 +15,12 @@ install_requires = ['six']
 
 tests_require = ['pytest']
 
+# libtcd.arrays, libtcd.astro, libtcd.cache and libtcd.predict require
+# numpy.  (libtcd.aio requires python >= 3.5, but no extra packages.)
+extras_require = {
+    'numpy': ['numpy'],
+    }
+
 if sys.version_info < (2, 7):
     install_requires.append('ordereddict')
 
@@ -50,6 +56,7 @@ setup(name='libtcd',
           "Programming Language :: Python :: 2.7",
           "Programming Language :: Python :: 3.3",
           "Programming Language :: Python :: 3.4",
+          "Programming Language :: Python :: 3.5",
           "Programming Language :: Python :: Implementation :: CPython",
           "Topic :: Scientific/Engineering",
           "Topic :: Software Development :: Libraries",
@@ -63,6 +70,7 @@ setup(name='libtcd',
 
       packages=find_packages(),
       install_requires=install_requires,
+      extras_require=extras_require,
       include_package_data=True,
       zip_safe=True,
 